@@ -0,0 +1,61 @@
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from menu_store import load_menu_file  # noqa: E402
+from models import OrderContext  # noqa: E402
+from order_parser import build_menu_index, try_fast_path  # noqa: E402
+
+mcdonalds_menu = load_menu_file().items
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "utterances.txt")
+
+
+def load_conversations(path: str):
+    conversations, current = [], []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line == "---":
+                conversations.append(current)
+                current = []
+            else:
+                current.append(line)
+    if current:
+        conversations.append(current)
+    return conversations
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(rounds: int = 200):
+    index = build_menu_index(mcdonalds_menu)
+    conversations = load_conversations(CORPUS_PATH)
+    timings, hits, total = [], 0, 0
+    for _ in range(rounds):
+        for conversation in conversations:
+            context = OrderContext()
+            for message in conversation:
+                start = time.perf_counter()
+                result = try_fast_path(message, context, index)
+                timings.append((time.perf_counter() - start) * 1000)
+                total += 1
+                if result is not None:
+                    hits += 1
+                    context = result.context
+    print(f"utterances:    {total // rounds} x {rounds} rounds")
+    print(f"fast-path hit: {hits / total:.1%}")
+    print(f"p50 latency:   {statistics.median(timings):.3f} ms")
+    print(f"p99 latency:   {percentile(timings, 99):.3f} ms")
+
+
+if __name__ == "__main__":
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
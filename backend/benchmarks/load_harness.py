@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import httpx  # noqa: E402
+
+# Replays scripted multi-turn ordering conversations against the chat API at
+# a fixed concurrency and reports throughput, latency percentiles, event-loop
+# lag and memory per session. No Gemini or Atlas: by default the app runs
+# in-process with the stand-ins from stand_ins.py; with --url it targets a
+# server started with MCBOT_STAND_INS=1 (or anything else speaking the API).
+#
+#   python benchmarks/load_harness.py --concurrency 32 --conversations 400 --out run.json
+#   python benchmarks/load_harness.py ... --compare baseline.json
+#
+# Results are JSON so two runs can be diffed; --compare prints the diff.
+
+CONVERSATIONS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "conversations.json")
+
+# Metrics compared by --compare, and whether higher is better.
+COMPARED = {
+    "rps": True,
+    "turn_ms.p50": False,
+    "turn_ms.p95": False,
+    "turn_ms.p99": False,
+    "loop_lag_ms.p99": False,
+    "loop_lag_ms.max": False,
+    "error_rate": False,
+    "memory.bytes_per_session": False,
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Replay scripted conversations against the chat API.")
+    parser.add_argument("--concurrency", type=int, default=16, help="conversations in flight at once")
+    parser.add_argument("--conversations", type=int, default=200, help="conversations to replay in total")
+    parser.add_argument("--script", default=CONVERSATIONS, help="JSON list of conversations (lists of messages)")
+    parser.add_argument("--stream", action="store_true", help="use /api/chat/stream instead of /api/chat")
+    parser.add_argument("--sessions", action="store_true", help="keep order state server-side (session mode)")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="pause between a user's turns")
+    parser.add_argument("--llm-latency-ms", type=float, default=800.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-max-in-flight", type=int, default=64)
+    parser.add_argument("--llm-rate-per-minute", type=float, default=0.0, help="0 disables the rate limiter")
+    parser.add_argument("--mongo-latency-ms", type=float, default=5.0)
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="results JSON from an earlier run to diff against")
+    return parser.parse_args()
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0, "mean": 0.0}
+    ordered = sorted(samples)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+    return {
+        "p50": round(pick(0.50), 3),
+        "p95": round(pick(0.95), 3),
+        "p99": round(pick(0.99), 3),
+        "max": round(ordered[-1], 3),
+        "mean": round(statistics.fmean(ordered), 3),
+    }
+
+
+def rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.turn_ms: List[float] = []
+        self.first_byte_ms: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.sources: Dict[str, int] = {}
+        self.conversations_done = 0
+
+    def status(self, code: Any) -> None:
+        self.statuses[str(code)] = self.statuses.get(str(code), 0) + 1
+
+    def source(self, source: str) -> None:
+        self.sources[source] = self.sources.get(source, 0) + 1
+
+
+async def send_turn(client: httpx.AsyncClient, body: Dict[str, Any], stream: bool, rec: Recorder) -> Optional[Dict[str, Any]]:
+    started = time.perf_counter()
+    path = "/api/chat/stream" if stream else "/api/chat"
+    done = None
+    try:
+        async with client.stream("POST", path, json=body) as response:
+            if response.status_code != 200:
+                await response.aread()
+                rec.status(response.status_code)
+                return None
+            if not stream:
+                done = json.loads(await response.aread())
+            else:
+                first = True
+                async for line in response.aiter_lines():
+                    if first:
+                        rec.first_byte_ms.append((time.perf_counter() - started) * 1000)
+                        first = False
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "done":
+                        done = event
+                    elif event["type"] == "error":
+                        rec.status(event.get("status", "error"))
+                        return None
+    except httpx.HTTPError as e:
+        rec.status(type(e).__name__)
+        return None
+    rec.turn_ms.append((time.perf_counter() - started) * 1000)
+    rec.status(200)
+    if done is not None:
+        rec.source(done.get("source", "?"))
+    return done
+
+
+async def run_conversation(client: httpx.AsyncClient, messages: List[str], args: argparse.Namespace, rec: Recorder) -> None:
+    context: Optional[Dict[str, Any]] = None
+    session_id, session_version = None, None
+    for message in messages:
+        body: Dict[str, Any] = {"message": message}
+        if args.sessions:
+            body.update(use_session=True, session_id=session_id, session_version=session_version)
+        elif context is not None:
+            body["context"] = context
+        result = await send_turn(client, body, args.stream, rec)
+        if result is None:
+            return
+        context = result["context"]
+        session_id, session_version = result.get("session_id"), result.get("session_version")
+        if args.think_ms:
+            await asyncio.sleep(args.think_ms / 1000)
+    rec.conversations_done += 1
+
+
+async def watch_loop_lag(stop: asyncio.Event, samples: List[float], interval: float = 0.01) -> None:
+    # How late a 10 ms sleep wakes up is how long something hogged the loop.
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, (time.perf_counter() - started - interval) * 1000))
+
+
+def configure_in_process(args: argparse.Namespace):
+    # The scheduler and logger read these at import time.
+    os.environ["LLM_MAX_IN_FLIGHT"] = str(args.llm_max_in_flight)
+    os.environ["LLM_MAX_QUEUE"] = str(max(64, args.concurrency * 2))
+    os.environ["LLM_RATE_PER_MINUTE"] = str(args.llm_rate_per_minute)
+    os.environ.setdefault("LOG_LEVEL", "warning")
+    # Not os.devnull: replaying the spill file removes it.
+    os.environ.setdefault("ORDER_SPILL_PATH", os.path.join(tempfile.mkdtemp(prefix="mcbot-load-"), "unsaved_orders.jsonl"))
+
+    import main
+    from stand_ins import stand_in_dependencies
+
+    main.install_dependencies(*stand_in_dependencies(
+        latency=args.llm_latency_ms / 1000,
+        jitter=args.llm_jitter_ms / 1000,
+        error_rate=args.llm_error_rate,
+        mongo_write_latency=args.mongo_latency_ms / 1000,
+        seed=args.seed,
+    ))
+    return main
+
+
+async def replay(client: httpx.AsyncClient, args: argparse.Namespace, rec: Recorder) -> float:
+    with open(args.script) as f:
+        scripts = json.load(f)
+    rng = random.Random(args.seed)
+    pending: asyncio.Queue = asyncio.Queue()
+    for _ in range(args.conversations):
+        pending.put_nowait(rng.choice(scripts))
+
+    async def user() -> None:
+        while not pending.empty():
+            await run_conversation(client, pending.get_nowait(), args, rec)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(args.concurrency)))
+    return time.perf_counter() - started
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    rec = Recorder()
+    lag_ms: List[float] = []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    timeout = httpx.Timeout(120.0)
+
+    if args.url:
+        app = None
+        client = httpx.AsyncClient(base_url=args.url, limits=limits, timeout=timeout)
+    else:
+        app = configure_in_process(args)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app.app), base_url="http://bench", timeout=timeout)
+
+    rss_before = rss_bytes()
+    async with client:
+        if app is not None:
+            lifespan = app.app.router.lifespan_context(app.app)
+            await lifespan.__aenter__()
+        watcher = asyncio.create_task(watch_loop_lag(stop, lag_ms))
+        try:
+            elapsed = await replay(client, args, rec)
+        finally:
+            stop.set()
+            await watcher
+        rss_after = rss_bytes()
+        server_stats = (await client.get("/api/stats")).json()
+        if app is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    turns = len(rec.turn_ms)
+    failures = sum(count for status, count in rec.statuses.items() if status != "200")
+    sessions = server_stats.get("sessions", {})
+    memory: Dict[str, Any] = {"session_store_avg_bytes": sessions.get("avg_bytes_per_session")}
+    if app is not None and rss_before and rss_after:
+        memory["rss_delta_bytes"] = rss_after - rss_before
+        memory["bytes_per_session"] = round((rss_after - rss_before) / max(1, args.conversations))
+    return {
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "results": {
+            "elapsed_s": round(elapsed, 3),
+            "turns": turns,
+            "conversations_completed": rec.conversations_done,
+            "rps": round(turns / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(failures / (turns + failures), 4) if turns + failures else 0.0,
+            "statuses": rec.statuses,
+            "sources": rec.sources,
+            "turn_ms": percentiles(rec.turn_ms),
+            "first_byte_ms": percentiles(rec.first_byte_ms) if args.stream else None,
+            # In-process, the load generator shares the loop with the app.
+            "loop_lag_ms": percentiles(lag_ms),
+            "memory": memory,
+        },
+        "server_stats": server_stats,
+    }
+
+
+def lookup(results: Dict[str, Any], dotted: str) -> Optional[float]:
+    value: Any = results
+    for part in dotted.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value if isinstance(value, (int, float)) else None
+
+
+def print_comparison(current: Dict[str, Any], baseline_path: str) -> None:
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\n{'metric':<26} {'baseline':>12} {'current':>12} {'change':>9}")
+    for metric, higher_is_better in COMPARED.items():
+        old = lookup(baseline["results"], metric)
+        new = lookup(current["results"], metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old if old else 0.0
+        worse = change < 0 if higher_is_better else change > 0
+        flag = "  <-- worse" if worse and abs(change) > 0.05 else ""
+        print(f"{metric:<26} {old:>12} {new:>12} {change:>+8.1%}{flag}")
+
+
+def main() -> None:
+    args = parse_args()
+    results = asyncio.run(run(args))
+    summary = results["results"]
+    print(f"{summary['turns']} turns in {summary['elapsed_s']}s at concurrency {args.concurrency}: {summary['rps']} rps")
+    print(f"turn latency ms   {summary['turn_ms']}")
+    if args.stream:
+        print(f"first byte ms     {summary['first_byte_ms']}")
+    print(f"loop lag ms       {summary['loop_lag_ms']}")
+    print(f"statuses          {summary['statuses']}  sources {summary['sources']}")
+    print(f"memory            {summary['memory']}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"wrote {args.out}")
+    if args.compare:
+        print_comparison(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from order_store import OrderWriter  # noqa: E402
+
+# Stand-in for an Atlas collection: synchronous calls with a fixed round trip.
+ROUND_TRIP = 0.03
+BURST = 50
+TICK = 0.005
+
+
+class SlowCollection:
+    def __init__(self):
+        self.docs = []
+
+    def insert_one(self, doc):
+        time.sleep(ROUND_TRIP)
+        self.docs.append(doc)
+
+    def insert_many(self, docs, ordered=True):
+        time.sleep(ROUND_TRIP)
+        self.docs.extend(docs)
+
+
+async def measure_lag(stop: asyncio.Event, lags: list):
+    # How late does a task scheduled every TICK seconds actually wake up?
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append((time.perf_counter() - start - TICK) * 1000)
+
+
+async def finalize_burst(save):
+    async def one_order(i):
+        await asyncio.sleep(0)
+        save({"n": i, "items": {}, "subtotal": 0.0})
+
+    await asyncio.gather(*(one_order(i) for i in range(BURST)))
+
+
+async def run(mode: str):
+    collection = SlowCollection()
+    lags, stop = [], asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, lags))
+    await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    if mode == "insert_one":
+        await finalize_burst(collection.insert_one)
+    else:
+        spill = os.path.join(tempfile.mkdtemp(), "spill.jsonl")
+        writer = OrderWriter(lambda: collection, batch_size=25, flush_interval=0.05, spill_path=spill)
+        await writer.start()
+        # A server's writer has loaded bson/pymongo long before the first
+        # order is finalized; don't time that import.
+        await writer.warm_up()
+        start = time.perf_counter()
+        await finalize_burst(writer.submit)
+    handler_time = (time.perf_counter() - start) * 1000
+    if mode != "insert_one":
+        await writer.stop()
+
+    await asyncio.sleep(0.05)
+    stop.set()
+    await ticker
+    print(
+        f"{mode:>12}: handlers done in {handler_time:7.1f} ms, "
+        f"loop lag p50 {statistics.median(lags):6.2f} ms, max {max(lags):7.1f} ms, "
+        f"orders saved {len(collection.docs)}"
+    )
+
+
+async def main():
+    print(f"burst of {BURST} finalizations, {ROUND_TRIP * 1000:.0f} ms Mongo round trip")
+    await run("insert_one")
+    await run("writer")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,109 @@
+import json
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_output import OrderBlockExtractor, extract_order_block, parse_structured_output  # noqa: E402
+from streaming import StructuredReplyStreamer  # noqa: E402
+
+# Compares the old regex extraction with the brace-balanced extractor (text
+# mode) and the JSON-mode parser on fixtures/llm_outputs.jsonl. "parses" in a
+# fixture is whether a correct parser should get an order out of it.
+#
+#   python benchmarks/output_parse_bench.py [repeats]
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "llm_outputs.jsonl")
+OLD_BLOCK_RE = re.compile(r"```json\s*({.*?})\s*```", re.DOTALL)
+
+
+def old_regex_parse(text: str):
+    match = OLD_BLOCK_RE.search(text)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(1))
+    except ValueError:
+        return None
+    OLD_BLOCK_RE.sub("", text).strip()
+    return data if isinstance(data, dict) and "items" in data else None
+
+
+def time_per_call(fn, text: str, repeats: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeats):
+        fn(text)
+    return (time.perf_counter() - started) / repeats * 1e6
+
+
+def chunked(text: str, rng: random.Random):
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 12)
+        yield text[pos:pos + size]
+        pos += size
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    with open(FIXTURES, encoding="utf-8") as f:
+        fixtures = [json.loads(line) for line in f if line.strip()]
+    rng = random.Random(7)
+
+    rows = []
+    for fixture in fixtures:
+        text, structured = fixture["text"], fixture["mode"] == "json"
+        new_parse = parse_structured_output if structured else extract_order_block
+        result = new_parse(text)
+        row = {
+            "name": fixture["name"],
+            "mode": fixture["mode"],
+            "expected": fixture["parses"],
+            "new": result.order is not None,
+            "new_us": time_per_call(new_parse, text, repeats),
+        }
+        if structured:
+            streamer = StructuredReplyStreamer()
+            streamed = "".join(streamer.feed(chunk) for chunk in chunked(text, rng))
+            # A response that isn't JSON at all has no reply field to stream;
+            # its reply only arrives with the final "done" event.
+            is_json = text.lstrip().startswith("{")
+            row["stream_ok"] = result.order is None or not is_json or streamed.strip() == result.reply
+        else:
+            row["old"] = old_regex_parse(text) is not None
+            row["old_us"] = time_per_call(old_regex_parse, text, repeats)
+            extractor = OrderBlockExtractor()
+            for chunk in chunked(text, rng):
+                extractor.feed(chunk)
+            incremental = extractor.finish()
+            row["stream_ok"] = (incremental.order, incremental.reply) == (result.order, result.reply)
+        rows.append(row)
+
+    print(f"{'fixture':<24} {'mode':<5} {'expect':>6} {'regex':>6} {'new':>6} {'regex us':>9} {'new us':>8} {'chunked':>8}")
+    for row in rows:
+        print(f"{row['name']:<24} {row['mode']:<5} {str(row['expected']):>6} {str(row.get('old', '-')):>6} "
+              f"{str(row['new']):>6} {row.get('old_us', 0):>9.1f} {row['new_us']:>8.1f} {str(row['stream_ok']):>8}")
+
+    def failure_rate(rows, key):
+        parseable = [r for r in rows if r["expected"]]
+        return sum(1 for r in parseable if not r[key]) / len(parseable) if parseable else 0.0
+
+    text_rows = [r for r in rows if r["mode"] == "text"]
+    json_rows = [r for r in rows if r["mode"] == "json"]
+    print()
+    print(f"text mode, parseable outputs lost: regex {failure_rate(text_rows, 'old'):.0%}, extractor {failure_rate(text_rows, 'new'):.0%}")
+    print(f"json mode, parseable outputs lost: {failure_rate(json_rows, 'new'):.0%}")
+    false_positives = [r["name"] for r in rows if r["new"] and not r["expected"]]
+    print(f"malformed outputs accepted: {false_positives or 'none'}")
+    print(f"mean parse time: regex {sum(r['old_us'] for r in text_rows) / len(text_rows):.1f} us, "
+          f"extractor {sum(r['new_us'] for r in text_rows) / len(text_rows):.1f} us, "
+          f"json {sum(r['new_us'] for r in json_rows) / len(json_rows):.1f} us")
+    mismatched = [r["name"] for r in rows if not r["stream_ok"]]
+    print(f"chunked feed matches one-shot parse: {'yes' if not mismatched else mismatched}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import json
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from menu_store import load_menu_file  # noqa: E402
+from models import OrderContext, OrderItemDetail  # noqa: E402
+from order_codec import OrderCodec  # noqa: E402
+
+mcdonalds_menu = load_menu_file().items
+
+MODIFICATIONS = ["no pickles", "extra cheese", "no onions", "plain", "light ice", "add bacon"]
+# Crude tokenizer stand-in: words, numbers and individual punctuation marks.
+TOKEN_RE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_RE.findall(text))
+
+
+def random_order(rng: random.Random, lines: int) -> OrderContext:
+    names = rng.sample(list(mcdonalds_menu), min(lines, len(mcdonalds_menu)))
+    items = {}
+    for name in names:
+        quantity = rng.randint(1, 12)
+        price = float(mcdonalds_menu[name]["price"])
+        items[name] = OrderItemDetail(
+            quantity=quantity,
+            base_price=price,
+            total_price=round(price * quantity, 2),
+            modifications=rng.sample(MODIFICATIONS, rng.randint(0, 2)),
+        )
+    return OrderContext(items=items, subtotal=round(sum(i.total_price for i in items.values()), 2))
+
+
+def legacy_state(context: OrderContext) -> str:
+    # What format_context_for_prompt used to send.
+    context_dict = context.model_dump(exclude={"is_finalized"})
+    return f"Current Order State (JSON):\n```json\n{json.dumps(context_dict, indent=2)}\n```"
+
+
+def check_round_trip(codec: OrderCodec, rng: random.Random, cases: int = 2000) -> None:
+    for _ in range(cases):
+        context = random_order(rng, rng.randint(0, len(mcdonalds_menu)))
+        context.is_finalized = rng.random() < 0.2
+        compact = codec.to_compact(context)
+        compact["is_finalized"] = context.is_finalized
+        decoded, unknown_ids = codec.from_compact(json.loads(json.dumps(compact)))
+        assert decoded == context and not unknown_ids, (context, decoded)
+    print(f"round trip: {cases} random orders decoded back to identical OrderContext")
+
+
+def main():
+    rng = random.Random(8)
+    codec = OrderCodec(mcdonalds_menu)
+    check_round_trip(codec, rng)
+    print(f"{'lines':>5} {'legacy chars':>13} {'compact chars':>14} {'legacy tok':>11} {'compact tok':>12} {'saved':>6}")
+    for lines in (1, 2, 5, 10, 20, 30, 45):
+        context = random_order(rng, lines)
+        legacy, compact = legacy_state(context), codec.format_state(context)
+        legacy_tokens, compact_tokens = estimate_tokens(legacy), estimate_tokens(compact)
+        print(
+            f"{lines:>5} {len(legacy):>13} {len(compact):>14} {legacy_tokens:>11} {compact_tokens:>12} "
+            f"{1 - compact_tokens / legacy_tokens:>6.0%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
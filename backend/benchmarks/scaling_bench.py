@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+
+# Throughput of `uvicorn main:app --workers N` for several N, against the
+# stand-in model (MCBOT_STAND_INS=1), driven by load_harness.py --url. With
+# the default zero model latency every turn is pure server CPU, so perfect
+# scaling is N times the single-worker RPS, up to the number of cores (the
+# load generators need cores too).
+#
+#   python benchmarks/scaling_bench.py --workers 1 2 4 --conversations 400
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Throughput against the number of server workers.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--conversations", type=int, default=300, help="per load generator")
+    parser.add_argument("--concurrency", type=int, default=32, help="per load generator")
+    parser.add_argument("--clients", type=int, default=0, help="load generator processes (default: one per worker)")
+    parser.add_argument("--llm-latency-ms", type=float, default=0.0)
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--out", help="write results JSON here")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(url: str, proc: subprocess.Popen, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            with urllib.request.urlopen(url + "/readyz", timeout=1) as response:
+                if response.status == 200:
+                    return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError("server never became ready")
+
+
+def start_server(workers: int, port: int, args: argparse.Namespace, spill_dir: str) -> subprocess.Popen:
+    env = dict(
+        os.environ,
+        MCBOT_STAND_INS="1",
+        STAND_IN_LLM_LATENCY_MS=str(args.llm_latency_ms),
+        STAND_IN_LLM_JITTER_MS="0",
+        STAND_IN_MONGO_LATENCY_MS="0",
+        WEB_CONCURRENCY=str(workers),
+        LLM_RATE_PER_MINUTE="0",
+        LLM_MAX_IN_FLIGHT="256",
+        LLM_MAX_QUEUE="1024",
+        LOG_LEVEL="warning",
+        ORDER_SPILL_PATH=os.path.join(spill_dir, "unsaved_orders.jsonl"),
+    )
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+def run_load(url: str, clients: int, args: argparse.Namespace, out_dir: str):
+    outputs = [os.path.join(out_dir, f"client{i}.json") for i in range(clients)]
+    procs = [
+        subprocess.Popen(
+            [sys.executable, os.path.join(BENCH_DIR, "load_harness.py"), "--url", url,
+             "--conversations", str(args.conversations), "--concurrency", str(args.concurrency),
+             "--seed", str(i + 1), "--out", path] + (["--stream"] if args.stream else []),
+            stdout=subprocess.DEVNULL,
+        )
+        for i, path in enumerate(outputs)
+    ]
+    for proc in procs:
+        proc.wait()
+    results = []
+    for path in outputs:
+        with open(path) as f:
+            results.append(json.load(f)["results"])
+    return results
+
+
+def measure(workers: int, args: argparse.Namespace) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    clients = args.clients or workers
+    with tempfile.TemporaryDirectory(prefix="mcbot-scaling-") as tmp:
+        server = start_server(workers, port, args, tmp)
+        try:
+            wait_ready(url, server)
+            # One short run first so every worker has imported and warmed up.
+            warm = argparse.Namespace(**{**vars(args), "conversations": 20})
+            run_load(url, clients, warm, tmp)
+            results = run_load(url, clients, args, tmp)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+    # Generators start together but finish apart; total turns over the
+    # longest run is the throughput all of them saw together.
+    turns = sum(r["turns"] for r in results)
+    elapsed = max(r["elapsed_s"] for r in results)
+    return {
+        "workers": workers,
+        "clients": clients,
+        "rps": round(turns / elapsed, 1),
+        "p50_ms": max(r["turn_ms"]["p50"] for r in results),
+        "p99_ms": max(r["turn_ms"]["p99"] for r in results),
+        "errors": sum(count for r in results for status, count in r["statuses"].items() if status != "200"),
+    }
+
+
+def main() -> None:
+    args = parse_args()
+    cores = os.cpu_count() or 1
+    print(f"{cores} CPU core(s); scaling past that many processes (workers + load generators) isn't possible here.")
+    rows = []
+    for workers in args.workers:
+        rows.append(measure(workers, args))
+        row = rows[-1]
+        base = rows[0]["rps"] / rows[0]["workers"]
+        row["efficiency"] = round(row["rps"] / (base * workers), 2)
+        print(f"workers {workers:>2}  clients {row['clients']:>2}  {row['rps']:>8} rps  p50 {row['p50_ms']:>7} ms  "
+              f"p99 {row['p99_ms']:>8} ms  errors {row['errors']}  scaling efficiency {row['efficiency']:.0%}")
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump({"cpu_count": cores, "config": vars(args), "rows": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+import asyncio
+import collections
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.api_core import exceptions as google_exceptions  # noqa: E402
+
+from llm_client import LLMScheduler, SchedulerRejected  # noqa: E402
+
+# Fake model: fixed latency and a hard requests-per-second quota (over a
+# rolling second), answering over-quota calls with 429 the way Gemini does.
+# A 429 comes with a Retry-After; a client that calls again before it runs
+# out is throttled again and restarts the penalty window, so ignoring
+# Retry-After keeps a client locked out.
+LATENCY = 0.05
+QUOTA_PER_SECOND = 40
+PENALTY_SECONDS = 1.0
+DURATION = 3.0
+
+
+class FakeRateLimitedModel:
+    def __init__(self):
+        self.served = collections.deque()
+        self.blocked_until = 0.0
+        self.calls = 0
+        self.throttled = 0
+
+    def _throttle(self, now: float):
+        self.throttled += 1
+        self.blocked_until = now + PENALTY_SECONDS
+        return google_exceptions.ResourceExhausted(f"429 quota exceeded; retry after {PENALTY_SECONDS:.0f}s")
+
+    async def generate_content_async(self, prompt):
+        self.calls += 1
+        now = time.monotonic()
+        while self.served and now - self.served[0] >= 1.0:
+            self.served.popleft()
+        if now < self.blocked_until or len(self.served) >= QUOTA_PER_SECOND:
+            error = self._throttle(now)
+            await asyncio.sleep(LATENCY / 5)
+            raise error
+        self.served.append(now)
+        await asyncio.sleep(LATENCY)
+        return "ok"
+
+
+async def naive_client(model, stop_at, results):
+    # What chat_handler did before: call directly, retry immediately on 429.
+    while time.monotonic() < stop_at:
+        for _ in range(4):
+            try:
+                await model.generate_content_async("hi")
+                results["ok"] += 1
+                break
+            except google_exceptions.ResourceExhausted:
+                continue
+        else:
+            results["failed"] += 1
+
+
+async def scheduled_client(model, scheduler, stop_at, results):
+    while time.monotonic() < stop_at:
+        try:
+            await scheduler.run(lambda: model.generate_content_async("hi"))
+            results["ok"] += 1
+        except SchedulerRejected:
+            results["rejected"] += 1
+            await asyncio.sleep(0.05)
+        except google_exceptions.ResourceExhausted:
+            results["failed"] += 1
+
+
+async def run_once(clients: int, scheduled: bool):
+    model = FakeRateLimitedModel()
+    results = {"ok": 0, "failed": 0, "rejected": 0}
+    started = time.monotonic()
+    stop_at = started + DURATION
+    if scheduled:
+        scheduler = LLMScheduler(
+            max_in_flight=4, max_queue=256, queue_timeout=2.0,
+            rate_per_minute=QUOTA_PER_SECOND * 60 * 0.95, burst=2, backoff_base=0.05,
+        )
+        coros = [scheduled_client(model, scheduler, stop_at, results) for _ in range(clients)]
+    else:
+        coros = [naive_client(model, stop_at, results) for _ in range(clients)]
+    tasks = [asyncio.create_task(coro) for coro in coros]
+    await asyncio.sleep(DURATION)
+    # Only calls that finished inside the window count; in-flight ones are
+    # cancelled rather than drained (the stop_at check covers a task that
+    # misses its cancellation).
+    ok, throttled, elapsed = results["ok"], model.throttled, time.monotonic() - started
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    return ok / elapsed, throttled, results
+
+
+async def main():
+    print(f"fake model: {LATENCY * 1000:.0f} ms latency, {QUOTA_PER_SECOND} req/s quota, "
+          f"{PENALTY_SECONDS:.0f} s penalty after a 429")
+    print(f"{'clients':>8} {'mode':>10} {'goodput/s':>10} {'429s':>6} {'rejected':>9}")
+    for clients in (2, 8, 32, 128):
+        for scheduled in (False, True):
+            goodput, throttled, results = await run_once(clients, scheduled)
+            mode = "scheduler" if scheduled else "direct"
+            print(f"{clients:>8} {mode:>10} {goodput:>10.1f} {throttled:>6} {results['rejected']:>9}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,52 @@
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Local stand-ins: a fake API key and a Mongo address that never answers, so
+# any code path that waits on Mongo during startup shows up in the timing.
+STAND_IN_ENV = {
+    "GOOGLE_API_KEY": "startup-bench-fake-key",
+    "MONGO_URI": "mongodb://10.255.255.1:27017/?serverSelectionTimeoutMS=5000&connectTimeoutMS=5000",
+    "ORDER_SPILL_PATH": os.path.join(tempfile.mkdtemp(prefix="mcbot-startup-"), "unsaved_orders.jsonl"),
+}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def time_to_first_200(timeout: float = 30.0) -> float:
+    port = free_port()
+    env = dict(os.environ, **STAND_IN_ENV)
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/healthz", timeout=1) as resp:
+                    if resp.status == 200:
+                        return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        raise RuntimeError("server did not answer /healthz in time")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+if __name__ == "__main__":
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    timings = sorted(time_to_first_200() for _ in range(runs))
+    print(f"process start -> first 200 on /healthz over {runs} runs (Mongo unreachable):")
+    print(f"  min {timings[0] * 1000:.0f} ms, median {timings[len(timings) // 2] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms")
@@ -0,0 +1,83 @@
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ORDER_SPILL_PATH", os.path.join(tempfile.mkdtemp(prefix="mcbot-bench-"), "unsaved_orders.jsonl"))
+
+import httpx  # noqa: E402
+
+import main  # noqa: E402
+import telemetry  # noqa: E402
+
+# Request time with metrics + structured logging on vs. off, on the two
+# cheapest turn types (where relative overhead is largest): a fast-path add
+# and an LLM turn against an instant stub model. Logs go to an in-memory
+# stream so terminal speed doesn't count.
+#
+#   python benchmarks/telemetry_overhead_bench.py [turns]
+
+ROUNDS = 8
+LLM_REPLY = 'Sure! Anything else?\n```json\n{"items":[[1,1]],"is_finalized":false}\n```'
+
+
+class StubResponse:
+    text = LLM_REPLY
+    usage_metadata = None
+
+
+class StubModel:
+    async def generate_content_async(self, prompt, **kwargs):
+        return StubResponse()
+
+
+async def ready() -> bool:
+    return True
+
+
+async def time_turns(client: httpx.AsyncClient, message: str, turns: int) -> float:
+    samples = []
+    for i in range(turns):
+        # Vary the message so the response cache never answers the LLM turn.
+        body = {"message": f"{message} {i}" if "fast" not in message else "add a big mac"}
+        started = time.perf_counter()
+        response = await client.post("/api/chat", json=body)
+        samples.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+    return statistics.median(samples)
+
+
+async def run(turns: int) -> None:
+    main.gemini.wait_ready = ready
+    main.install_dependencies(model_factory=lambda prompt_cache: StubModel())
+    main.llm_scheduler.bucket = None
+    telemetry.log.stream = io.StringIO()
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        results = {}
+        for label, message in (("fast path", "fast"), ("llm (stub)", "tell me a joke about fries")):
+            # Alternate on/off rounds so drift (GC, CPU frequency) hits both.
+            for enabled in (False, True) * ROUNDS:
+                telemetry.metrics.enabled = enabled
+                telemetry.log.level = telemetry.LEVELS["info"] if enabled else 100
+                median = await time_turns(client, message, turns)
+                results.setdefault((label, enabled), []).append(median)
+        for label in ("fast path", "llm (stub)"):
+            off = statistics.median(results[(label, False)])
+            on = statistics.median(results[(label, True)])
+            print(f"{label:<11} off {off * 1e3:7.3f} ms   on {on * 1e3:7.3f} ms   overhead {(on - off) / off:+.1%}")
+
+    started = time.perf_counter()
+    for _ in range(100000):
+        with telemetry.span("bench"):
+            pass
+    print(f"span() cost: {(time.perf_counter() - started) / 100000 * 1e6:.2f} us")
+    telemetry.log.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
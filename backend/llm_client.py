@@ -0,0 +1,303 @@
+import asyncio
+import collections
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+from google.api_core import exceptions as google_exceptions
+
+from telemetry import log, record_error, record_stage
+
+T = TypeVar("T")
+
+# Server processes sharing one API key (gunicorn and Render both set this).
+WORKERS = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+
+# Errors worth retrying: quota/rate limiting, overloaded or flaky backend.
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.TooManyRequests,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    asyncio.TimeoutError,
+    ConnectionError,
+)
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request can't get an LLM slot (queue full or deadline hit)."""
+
+    def __init__(self, reason: str, retry_after: float = 1.0):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class GeminiConfig:
+    """Configures the Gemini SDK off the startup path.
+
+    The SDK import alone takes most of a second, so it runs in a worker thread
+    after the server is already accepting connections; LLM calls await it.
+    """
+
+    def __init__(self, api_key: Optional[str]):
+        self.api_key = api_key
+        self.state = "idle" if api_key else "missing_key"
+        self.error: Optional[str] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def stand_in(cls) -> "GeminiConfig":
+        # For a PromptCache with a model_factory: nothing to configure.
+        config = cls(None)
+        config.state = "configured"
+        return config
+
+    def start(self) -> None:
+        if self.state == "configured":
+            return
+        if not self.api_key:
+            log.error("gemini_missing_key", hint="Set GOOGLE_API_KEY in the environment or .env file.")
+            return
+        if self._task is None:
+            self.state = "configuring"
+            self._task = asyncio.create_task(asyncio.to_thread(self._configure))
+
+    def _configure(self) -> None:
+        try:
+            import google.generativeai as genai
+
+            genai.configure(api_key=self.api_key)
+            self.state = "configured"
+            log.info("gemini_configured")
+        except Exception as e:
+            self.state = "error"
+            self.error = str(e)
+            log.error("gemini_configure_failed", error=str(e))
+
+    async def wait_ready(self) -> bool:
+        if self._task is None and self.state != "configured":
+            self.start()
+        if self._task is not None:
+            await self._task
+        return self.state == "configured"
+
+    def status(self) -> Dict:
+        return {"state": self.state, "error": self.error}
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second: float, capacity: float):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, deadline: float) -> None:
+        # The lock keeps token hand-out in arrival order.
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+                if time.monotonic() + wait > deadline:
+                    raise SchedulerRejected("rate limit wait exceeds deadline", retry_after=wait)
+                await asyncio.sleep(wait)
+
+
+class LLMScheduler:
+    """Bounded-concurrency front door for model calls.
+
+    At most ``max_in_flight`` calls run at once; the rest wait in a FIFO queue
+    of at most ``max_queue`` entries for up to ``queue_timeout`` seconds. Each
+    call also takes a token from a bucket sized to the API quota, and transient
+    errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        max_queue: int = 64,
+        queue_timeout: float = 20.0,
+        rate_per_minute: float = 15.0,
+        burst: int = 5,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+    ):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate_per_minute / 60.0, burst) if rate_per_minute > 0 else None
+
+        self.in_flight = 0
+        self._waiters: Deque[asyncio.Future] = collections.deque()
+
+        self.admitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.rejected_queue_full = 0
+        self.rejected_deadline = 0
+        self.max_queue_depth = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    @classmethod
+    def from_env(cls) -> "LLMScheduler":
+        # LLM_RATE_PER_MINUTE/LLM_RATE_BURST are the quota for the whole key;
+        # each worker gets its share. In-flight and queue limits are per worker.
+        return cls(
+            max_in_flight=int(os.getenv("LLM_MAX_IN_FLIGHT", "8")),
+            max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20")),
+            rate_per_minute=float(os.getenv("LLM_RATE_PER_MINUTE", "15")) / WORKERS,
+            burst=max(1, int(os.getenv("LLM_RATE_BURST", "5")) // WORKERS),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "3")),
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    async def _acquire_slot(self, deadline: float) -> None:
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise SchedulerRejected("LLM queue is full", retry_after=self.queue_timeout / 2)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.max_queue_depth = max(self.max_queue_depth, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout=max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            if waiter.done() and not waiter.cancelled():
+                # Slot was handed over just as we timed out; give it back.
+                self._release_slot()
+            else:
+                self._discard(waiter)
+            self.rejected_deadline += 1
+            raise SchedulerRejected("timed out waiting for an LLM slot", retry_after=1.0)
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self._release_slot()
+            else:
+                self._discard(waiter)
+            raise
+
+    def _discard(self, waiter: asyncio.Future) -> None:
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def _release_slot(self) -> None:
+        # Hand the slot straight to the oldest live waiter so ordering stays FIFO.
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        queued_at = time.monotonic()
+        deadline = queued_at + (self.queue_timeout if timeout is None else timeout)
+        await self._acquire_slot(deadline)
+        try:
+            if self.bucket is not None:
+                try:
+                    await self.bucket.acquire(deadline)
+                except SchedulerRejected:
+                    self.rejected_deadline += 1
+                    raise
+            admitted_at = time.monotonic()
+            waited = admitted_at - queued_at
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+            self.admitted += 1
+            record_stage("queue_wait", waited)
+            try:
+                yield
+            finally:
+                # Time holding the slot: the Gemini call(s), retries included.
+                record_stage("llm", time.monotonic() - admitted_at)
+        finally:
+            self._release_slot()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def _call_with_retries(self, call: Callable[[], Awaitable[T]]) -> T:
+        attempt = 0
+        while True:
+            try:
+                return await call()
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                attempt += 1
+                self.retries += 1
+                record_error("llm_transient_" + type(e).__name__)
+                log.warning("llm_retry", error=type(e).__name__, attempt=attempt, max_retries=self.max_retries, delay=round(delay, 3))
+                await asyncio.sleep(delay)
+                if self.bucket is not None:
+                    await self.bucket.acquire(time.monotonic() + self.backoff_max + self.queue_timeout)
+
+    async def run(self, call: Callable[[], Awaitable[T]], timeout: Optional[float] = None) -> T:
+        async with self.slot(timeout):
+            try:
+                result = await self._call_with_retries(call)
+            except Exception:
+                self.failed += 1
+                raise
+            self.completed += 1
+            return result
+
+    async def stream(self, call: Callable[[], Awaitable[AsyncIterable[T]]], timeout: Optional[float] = None) -> AsyncIterator[T]:
+        # Holds the slot until the stream is exhausted or closed. Retries only
+        # cover opening the stream; once chunks flow they go to the caller.
+        async with self.slot(timeout):
+            try:
+                response = await self._call_with_retries(call)
+                async for chunk in response:
+                    yield chunk
+            except Exception:
+                self.failed += 1
+                raise
+            self.completed += 1
+
+    def stats(self) -> Dict:
+        return {
+            "max_in_flight": self.max_in_flight,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "admitted": self.admitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "retries": self.retries,
+            "rejected_queue_full": self.rejected_queue_full,
+            "rejected_deadline": self.rejected_deadline,
+            "wait_seconds_avg": self.wait_seconds_total / self.admitted if self.admitted else 0.0,
+            "wait_seconds_max": self.wait_seconds_max,
+        }
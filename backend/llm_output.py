@@ -0,0 +1,232 @@
+import json
+import re
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+# Pulls the reply text and the order object out of a model response, in
+# either of the two output modes:
+#
+#   text mode:  "Sure! Anything else?\n```json\n{"items":[[1,2]],...}\n```"
+#   JSON mode:  {"reply": "Sure! Anything else?", "order": {"items": [...], ...}}
+
+# The only characters that matter while inside an object. A backtick can't
+# appear in JSON outside a string, so meeting one means the "{" was prose.
+_SIGNIFICANT_RE = re.compile(r'[{}"\\`]')
+FENCE_RE = re.compile(r"```[A-Za-z]*")
+FENCED_BLOCK_RE = re.compile(r"```(?:json|JSON)?[ \t]*\n?(.*?)```", re.DOTALL)
+# A trailing run that may still turn into a fence marker: "`", "``", "```js".
+PARTIAL_FENCE_RE = re.compile(r"`{1,3}[A-Za-z]*\Z")
+
+
+@dataclass
+class ParsedOutput:
+    reply: str
+    order: Optional[Dict[str, Any]]
+    error: Optional[str] = None
+
+
+class OrderBlockExtractor:
+    """Incremental extraction of the order object from a text-mode response.
+
+    Braces are matched outside of JSON strings (with escapes), so nested
+    objects and braces in modification text are fine. A "{" that turns out
+    to be prose - a backtick before it closes, or it never closes at all -
+    is given up and scanning resumes right after it. Fenced ```json blocks
+    win over bare objects; otherwise the last order object wins.
+
+    feed() returns the reply text that is safe to show so far: everything
+    from an unclosed "{" on, and a trailing partial fence, is held back.
+    finish() gives the final reply (text outside order blocks) and order.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.order: Optional[Dict[str, Any]] = None
+        self.decode_error: Optional[str] = None
+        self._pos = 0
+        self._start: Optional[int] = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._unterminated: Optional[int] = None
+        # [start, end) of order blocks, kept out of the reply.
+        self._held: List[Tuple[int, int]] = []
+        self._released = 0
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+        self._scan()
+        return self._release()
+
+    def _scan(self) -> None:
+        text, pos, end = self.text, self._pos, len(self.text)
+        while pos < end:
+            if self._start is None:
+                start = text.find("{", pos)
+                if start == -1:
+                    pos = end
+                    break
+                self._start, self._depth = start, 1
+                self._in_string = self._escape = False
+                pos = start + 1
+                continue
+            if self._escape:
+                self._escape = False
+                pos += 1
+                continue
+            match = _SIGNIFICANT_RE.search(text, pos)
+            if match is None:
+                pos = end
+                break
+            char, pos = match.group(), match.end()
+            if self._in_string:
+                if char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "`":
+                pos = self._abandon()
+            elif char == "{":
+                self._depth += 1
+            elif char == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close(self._start, pos)
+                    self._start = None
+        self._pos = pos
+
+    def _abandon(self) -> int:
+        start, self._start, self._depth = self._start, None, 0
+        return start + 1
+
+    def _close(self, start: int, end: int) -> None:
+        candidate = self.text[start:end]
+        try:
+            data = json.loads(candidate)
+        except ValueError as e:
+            if '"items"' in candidate:
+                # A broken order block: keep it out of the reply, remember why.
+                self.decode_error = str(e)
+                self._held.append((start, end))
+            return
+        if isinstance(data, dict) and "items" in data:
+            self.order = data
+            self._held.append((start, end))
+
+    def _without_held(self, lo: int, hi: int) -> str:
+        parts, pos = [], lo
+        for start, end in sorted(self._held):
+            if end <= pos or start >= hi:
+                continue
+            parts.append(self.text[pos:max(pos, start)])
+            pos = max(pos, end)
+        parts.append(self.text[pos:hi])
+        return "".join(parts)
+
+    def _release(self) -> str:
+        safe_end = len(self.text) if self._start is None else self._start
+        partial = PARTIAL_FENCE_RE.search(self.text, self._released, safe_end)
+        if partial is not None:
+            safe_end = partial.start()
+        if safe_end <= self._released:
+            return ""
+        visible = FENCE_RE.sub("", self._without_held(self._released, safe_end))
+        self._released = safe_end
+        return visible
+
+    def _fenced_order(self) -> None:
+        fenced = None
+        for match in FENCED_BLOCK_RE.finditer(self.text):
+            try:
+                data = json.loads(match.group(1).strip())
+            except ValueError:
+                continue
+            if isinstance(data, dict) and "items" in data:
+                fenced = (data, match.start(), match.end())
+        if fenced is not None:
+            self.order = fenced[0]
+            self._held.append(fenced[1:])
+
+    def finish(self) -> ParsedOutput:
+        # An object still open at the end: give up on its "{" and rescan.
+        while self._start is not None:
+            if self._unterminated is None and '"items"' in self.text[self._start:]:
+                self._unterminated = self._start
+            self._pos = self._abandon()
+            self._scan()
+        self._fenced_order()
+        if self.order is None and self._unterminated is not None:
+            # Most likely a cut-off order block; don't show it as reply text.
+            self._held.append((self._unterminated, len(self.text)))
+        reply = FENCE_RE.sub("", self._without_held(0, len(self.text))).strip()
+        if self.order is not None:
+            return ParsedOutput(reply=reply, order=self.order)
+        if self._unterminated is not None:
+            return ParsedOutput(reply=reply, order=None, error="unterminated JSON object")
+        if self.decode_error:
+            return ParsedOutput(reply=reply, order=None, error=f"invalid JSON: {self.decode_error}")
+        return ParsedOutput(reply=reply, order=None, error="no JSON block found")
+
+
+def extract_order_block(text: str) -> ParsedOutput:
+    extractor = OrderBlockExtractor()
+    extractor.feed(text)
+    return extractor.finish()
+
+
+def parse_structured_output(text: str) -> ParsedOutput:
+    """JSON mode: the whole response is {"reply": ..., "order": ...}."""
+    try:
+        data = json.loads(text)
+    except ValueError:
+        # The model ignored the response schema (or got cut off); it may
+        # still have written a text-mode reply.
+        return extract_order_block(text)
+    if not isinstance(data, dict):
+        return ParsedOutput(reply="", order=None, error="response is not a JSON object")
+    reply = data.get("reply")
+    order = data.get("order")
+    if not isinstance(reply, str):
+        reply = ""
+    if not isinstance(order, dict):
+        return ParsedOutput(reply=reply, order=None, error="response has no 'order' object")
+    return ParsedOutput(reply=reply.strip(), order=order)
+
+
+class OutputParser:
+    """Parses model responses and keeps failure counts and parse time."""
+
+    def __init__(self):
+        self.parsed = 0
+        self.failures: Dict[str, int] = {}
+        self.parse_seconds = 0.0
+
+    def parse(self, text: str, structured: bool, extractor: Optional[OrderBlockExtractor] = None) -> ParsedOutput:
+        # extractor: a text-mode extractor that was already fed the response
+        # as it streamed, so the text isn't scanned a second time.
+        started = time.perf_counter()
+        if structured:
+            result = parse_structured_output(text)
+        elif extractor is not None:
+            result = extractor.finish()
+        else:
+            result = extract_order_block(text)
+        self.parse_seconds += time.perf_counter() - started
+        self.parsed += 1
+        if result.error:
+            kind = result.error.split(":", 1)[0]
+            self.failures[kind] = self.failures.get(kind, 0) + 1
+        return result
+
+    def stats(self) -> Dict:
+        failed = sum(self.failures.values())
+        return {
+            "parsed": self.parsed,
+            "failed": failed,
+            "failure_rate": failed / self.parsed if self.parsed else 0.0,
+            "failures": dict(self.failures),
+            "avg_parse_us": self.parse_seconds / self.parsed * 1e6 if self.parsed else 0.0,
+        }
@@ -1,21 +1,50 @@
 import os
-import re
-import json
-import pymongo
-from pymongo.server_api import ServerApi
 import datetime
+import time
 from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel, Field
-from typing import Dict, List, Optional, Any
-import google.generativeai as genai
 import traceback
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from models import OrderContext, ChatRequest, ChatResponse
+from order_parser import build_menu_index, try_fast_path
+from order_codec import OrderCodec
+from pricing import PriceBook
+from menu_answers import MenuAnswers
+from menu_store import MenuVersion, MenuWatcher
+from response_cache import ResponseCache
+from llm_output import OrderBlockExtractor, OutputParser
+from telemetry import Trace, activate, finish_trace, log, metrics, record_error, record_token_usage, span, start_trace
+from prompts import PromptCache
+from llm_client import WORKERS, GeminiConfig, LLMScheduler, SchedulerRejected
+from streaming import StructuredReplyStreamer, ndjson_event
+from order_store import OrderWriter
+from mongo import MongoConnection, mongo_uri_from_env
+from sessions import RedisSessionStore, VersionConflict, new_session_id, session_store_from_env
 
 load_dotenv()
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing here blocks: Gemini setup and the Mongo connection both happen
+    # in the background while the server is already taking requests.
+    gemini.start()
+    mongo.start(on_connected=order_writer.replay_spill)
+    await order_writer.start()
+    menu_watcher.start()
+    if WORKERS > 1 and not isinstance(session_store, RedisSessionStore):
+        log.warning("sessions_not_shared", workers=WORKERS, detail="Session mode needs SESSION_BACKEND=redis with more than one worker.")
+    yield
+    await menu_watcher.stop()
+    await order_writer.stop()
+    await mongo.close()
+    await session_store.close()
+    log.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "https://mcbot-frontend.onrender.com", 
@@ -31,219 +60,336 @@ app.add_middleware(
 )
 
 
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+gemini = GeminiConfig(os.getenv("GOOGLE_API_KEY"))
+
+mongo = MongoConnection(mongo_uri_from_env())
+
+# The collection is looked up per flush, so orders queued before Mongo
+# finishes connecting are written (or replayed from disk) once it does.
+order_writer = OrderWriter.from_env(lambda: mongo.collection)
+
+# Server-side order state for clients that opt into session mode.
+session_store = session_store_from_env()
+
+# Static system instructions + rendered menu, built once and reused every turn.
+prompt_cache = PromptCache('gemini-1.5-flash')
+
+# Replies to turns that didn't change the order, reused for repeat questions.
+response_cache = ResponseCache.from_env()
+
+menu_answers: Optional[MenuAnswers] = None
+
+def menu_collection():
+    orders = mongo.collection
+    return None if orders is None else orders.database[os.getenv("MENU_COLLECTION", "menus")]
+
+def load_menu(menu: MenuVersion) -> None:
+    # Everything derived from the menu is rebuilt here; anything that changes
+    # the menu must go through this so cached replies are dropped with it.
+    # There is no await in here, so a hot reload swaps all of it at once as
+    # far as any turn is concerned.
+    global menu_index, price_book, menu_answers
+    index = build_menu_index(menu.items)
+    answers = MenuAnswers(menu.items, index)
+    if menu_answers is not None:
+        answers.answered = menu_answers.answered
+    menu_index, price_book, menu_answers = index, PriceBook(menu.items, index), answers
+    if prompt_cache.refresh(menu.items):
+        response_cache.invalidate(prompt_cache.fingerprint)
+
+# The menu comes from menu.json (MENU_PATH), or from Mongo with
+# MENU_SOURCE=mongo, and is reloaded when it changes; see menu_store.py.
+menu_watcher = MenuWatcher.from_env(load_menu, get_collection=menu_collection)
+menu_watcher.load()
+
+def install_dependencies(gemini_config: Optional[GeminiConfig] = None,
+                         mongo_connection: Optional[MongoConnection] = None,
+                         model_factory=None) -> None:
+    # Swaps the external services (Gemini, Mongo) for stand-ins, e.g. the
+    # fakes in stand_ins.py. Call before the app starts.
+    global gemini, mongo
+    if gemini_config is not None:
+        gemini = gemini_config
+    if mongo_connection is not None:
+        mongo = mongo_connection
+    if model_factory is not None:
+        prompt_cache.set_model_factory(model_factory)
+
+# Load tests against a real server process (uvicorn/gunicorn) without Gemini
+# or Atlas: STAND_IN_* variables tune the fakes, see stand_ins.py.
+if os.getenv("MCBOT_STAND_INS", "").lower() in ("1", "true", "yes"):
+    from stand_ins import stand_in_dependencies_from_env
+    install_dependencies(*stand_in_dependencies_from_env())
+    log.warning("stand_ins_installed", detail="Gemini and MongoDB are replaced by in-process fakes.")
+
+# Extracts reply text and order JSON from model output, with failure counts.
+output_parser = OutputParser()
+
+# Every Gemini call goes through this: bounded in-flight calls, FIFO queueing,
+# quota-matched rate limiting and retries on transient errors.
+llm_scheduler = LLMScheduler.from_env()
+
+metrics.gauge("mcbot_llm_in_flight", lambda: llm_scheduler.in_flight, "Gemini calls holding a scheduler slot.")
+metrics.gauge("mcbot_llm_queue_depth", lambda: llm_scheduler.queue_depth, "Turns waiting for a scheduler slot.")
+metrics.gauge("mcbot_order_queue_pending", lambda: order_writer.queue.qsize(), "Finalized orders waiting to be written.")
+metrics.gauge("mcbot_response_cache_entries", lambda: response_cache.stats()["entries"], "Cached read-only replies.")
+metrics.gauge("mcbot_log_dropped", lambda: log.dropped, "Log records dropped because the log buffer was full.")
+
+# Keep proxies (Render, nginx) from buffering the NDJSON stream.
+STREAM_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.get("/healthz")
+async def healthz_handler():
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz_handler():
+    # Gemini is required to serve chat; Mongo isn't, since finalized orders
+    # are spilled to disk and replayed once it comes back.
+    dependencies = {
+        "gemini": {**gemini.status(), "required": True},
+        "mongo": {**mongo.status(), "required": False},
+        "order_writer": {"state": "running" if order_writer.running else "stopped", "required": False},
+    }
+    ready = gemini.state == "configured"
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "not_ready", "dependencies": dependencies},
+    )
 
-if not GOOGLE_API_KEY:
-    print("ERROR: GOOGLE_API_KEY environment variable not set. Did you create a .env file and set the variable?")
-else:
+@app.get("/api/stats")
+async def stats_handler():
+    return {
+        "menu": menu_watcher.stats(),
+        "prompt": prompt_cache.stats(),
+        "llm": llm_scheduler.stats(),
+        "orders": order_writer.stats(),
+        "sessions": await session_store.stats(),
+        "response_cache": response_cache.stats(),
+        "menu_answers": menu_answers.answered,
+        "llm_output": output_parser.stats(),
+    }
+
+@app.get("/metrics")
+async def metrics_handler():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def save_finalized_order(order_context: OrderContext) -> str:
+    # Hands the order to the write-behind queue; the actual insert happens in
+    # the background so the event loop never waits on Atlas.
     try:
-        genai.configure(api_key=GOOGLE_API_KEY)
-        print("Gemini API Key configured successfully from environment variable.")
+        order_data = order_context.model_dump()
+        order_data['orderTimestamp'] = datetime.datetime.now(datetime.timezone.utc)
+        order_id = order_writer.submit(order_data)
+        log.info("order_queued", order_id=str(order_id), lines=len(order_context.items))
+        return ""
     except Exception as e:
-        print(f"ERROR: Failed to configure Gemini API Key: {e}")
-        GOOGLE_API_KEY = None
-
-MONGO_PASSWORD = os.getenv("MONGO_PASSWORD")
-MONGO_USER = os.getenv("MONGO_USER")
-MONGO_CLUSTER_URL = os.getenv("MONGO_CLUSTER_URL")
+        record_error("order_queue")
+        log.error("order_queue_failed", error=str(e), exc=traceback.format_exc())
+        return " (Note: There was an issue saving the order to the database.)"
+
+def session_unavailable(e: Exception) -> HTTPException:
+    # The session store (Redis) is down or timing out. The order lives there,
+    # so the turn can't go ahead; the client can retry the same message.
+    record_error("session_store")
+    log.error("session_store_failed", error=str(e), error_type=type(e).__name__)
+    return HTTPException(
+        status_code=503,
+        detail="Your order can't be reached right now. Please try again in a moment.",
+        headers={"Retry-After": "1"},
+    )
 
-mongo_client = None
-db = None
-orders_collection = None
+@dataclass
+class TurnSession:
+    session_id: str
+    version: int
 
-if not MONGO_PASSWORD:
-    print("ERROR: MONGO_PASSWORD environment variable not set. Did you create a .env file and set the variable?")
-else:
-    MONGO_URI = f"mongodb+srv://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_CLUSTER_URL}/?retryWrites=true&w=majority&appName=UserOrders"
-    try:
-        mongo_client = pymongo.MongoClient(MONGO_URI, server_api=ServerApi('1'))
-        mongo_client.admin.command('ping')
-        print("Successfully connected to MongoDB using credentials from environment variables!")
-        db = mongo_client["mcdonalds_orders"]
-        orders_collection = db["orders"]
-    except Exception as e:
-        print(f"ERROR: Could not connect to MongoDB: {e}")
-        traceback.print_exc()
-        mongo_client = None
-        db = None
-        orders_collection = None
-
-mcdonalds_menu = {
-    "big mac": {"price": 5.99, "description": "Two all-beef patties, special sauce, lettuce, cheese, pickles, onions on a sesame seed bun."},
-    "quarter pounder with cheese": {"price": 6.19, "description": "Quarter pound 100% fresh beef patty, cheese, ketchup, mustard, pickles, onions."},
-    "double quarter pounder with cheese": {"price": 8.29, "description": "Two quarter pound 100% fresh beef patties, cheese, ketchup, mustard, pickles, onions."},
-    "mcdouble": {"price": 3.49, "description": "Two 100% beef patties, cheese, ketchup, mustard, pickles, onions."},
-    "cheeseburger": {"price": 2.79, "description": "100% beef patty, cheese, ketchup, mustard, pickle, onions."},
-    "hamburger": {"price": 2.49, "description": "100% beef patty, ketchup, mustard, pickle, onions."},
-    "mcchicken": {"price": 3.19, "description": "Crispy chicken patty, lettuce, mayonnaise."},
-    "filet-o-fish": {"price": 5.69, "description": "Fish filet patty, tartar sauce, half slice of cheese."},
-    "4 piece chicken mcnuggets": {"price": 3.29, "description": "4 piece Chicken McNuggets with choice of sauce."},
-    "6 piece chicken mcnuggets": {"price": 4.49, "description": "6 piece Chicken McNuggets with choice of sauce."},
-    "10 piece chicken mcnuggets": {"price": 5.99, "description": "10 piece Chicken McNuggets with choice of sauce."},
-    "20 piece chicken mcnuggets": {"price": 8.99, "description": "20 piece Chicken McNuggets with choice of sauce."},
-    "small fries": {"price": 2.59, "description": "Small World Famous Fries."},
-    "medium fries": {"price": 3.39, "description": "Medium World Famous Fries."},
-    "large fries": {"price": 3.99, "description": "Large World Famous Fries."},
-    "small coke": {"price": 1.89, "description": "Small Coca-Cola."},
-    "medium coke": {"price": 2.19, "description": "Medium Coca-Cola."},
-    "large coke": {"price": 2.59, "description": "Large Coca-Cola."},
-    "small sprite": {"price": 1.89, "description": "Small Sprite."},
-    "medium sprite": {"price": 2.19, "description": "Medium Sprite."},
-    "large sprite": {"price": 2.59, "description": "Large Sprite."},
-    "small diet coke": {"price": 1.89, "description": "Small Diet Coke."},
-    "medium diet coke": {"price": 2.19, "description": "Medium Diet Coke."},
-    "large diet coke": {"price": 2.59, "description": "Large Diet Coke."},
-    "small dr pepper": {"price": 1.89, "description": "Small Dr Pepper."},
-    "medium dr pepper": {"price": 2.19, "description": "Medium Dr Pepper."},
-    "large dr pepper": {"price": 2.59, "description": "Large Dr Pepper."},
-    "small fanta": {"price": 1.89, "description": "Small Fanta Orange."},
-    "medium fanta": {"price": 2.19, "description": "Medium Fanta Orange."},
-    "large fanta": {"price": 2.59, "description": "Large Fanta Orange."},
-    "small orange hi-c": {"price": 1.89, "description": "Small Orange Hi-C."},
-    "medium orange hi-c": {"price": 2.19, "description": "Medium Orange Hi-C."},
-    "large orange hi-c": {"price": 2.59, "description": "Large Orange Hi-C."},
-    "bottled water": {"price": 1.89, "description": "Dasani Bottled Water."},
-    "mcflurry with oreo cookies": {"price": 4.19, "description": "Vanilla soft serve swirled with OREO cookies."},
-    "mcflurry with m&ms": {"price": 4.19, "description": "Vanilla soft serve swirled with M&M'S chocolate candies."},
-    "baked apple pie": {"price": 1.99, "description": "Hot baked apple pie."},
-    "chocolate chip cookie": {"price": 1.29, "description": "Single warm chocolate chip cookie."},
-    "honey mustard sauce": {"price": 0.25, "description": "Honey Mustard Sauce Packet."},
-    "tangy barbeque sauce": {"price": 0.25, "description": "Tangy Barbeque Sauce Packet."},
-    "spicy buffalo ranch sauce": {"price": 0.25, "description": "Spicy Buffalo Ranch Sauce Packet."},
-    "creamy ranch sauce": {"price": 0.25, "description": "Creamy Ranch Sauce Packet."},
-    "ketchup packet": {"price": 0.25, "description": "Ketchup Packet."},
-    "mayonnaise packet": {"price": 0.25, "description": "Mayonnaise Packet."},
-    "tartar sauce packet": {"price": 0.25, "description": "Tartar Sauce Packet."},
-}
-
-def format_menu_for_prompt(menu: Dict) -> str:
-    menu_str = "Available Menu Items:\n"
-    for name, details in menu.items():
+async def load_turn_context(request: ChatRequest) -> Tuple[OrderContext, Optional[TurnSession]]:
+    with span("context_parse"):
+        if not (request.session_id or request.use_session):
+            return parse_incoming_context(request), None
+        session_id = request.session_id or new_session_id()
         try:
-            price = float(details.get('price', 0.0))
-            menu_str += f"- {name.title()}: ${price:.2f} ({details.get('description', '')})\n"
-        except (ValueError, TypeError):
-             menu_str += f"- {name.title()}: (Price Error) ({details.get('description', '')})\n"
-    return menu_str
-
-def format_context_for_prompt(order_context: Optional['OrderContext']) -> str:
-    if not order_context or not order_context.items:
-        return "The user's order is currently empty."
-    else:
+            current_context, version = await session_store.get(session_id)
+        except Exception as e:
+            raise session_unavailable(e)
+    if request.session_version is not None and request.session_version != version:
+        record_error("stale_session")
+        log.warning("stale_session", session_id=session_id, client_version=request.session_version, server_version=version)
+        raise HTTPException(status_code=409, detail="This order was updated elsewhere. Please refresh and try again.")
+    current_context.is_finalized = False
+    return current_context, TurnSession(session_id, version)
+
+async def finish_turn(response: ChatResponse, session: Optional[TurnSession]) -> ChatResponse:
+    # The session write is the commit point: only a turn that wins it gets to
+    # persist a finalized order, so a duplicated "that's all" can't save twice.
+    if session is not None:
         try:
-            if isinstance(order_context, OrderContext):
-                 context_dict = order_context.model_dump(exclude={'is_finalized'})
-            else:
-                 temp_context = OrderContext(**order_context)
-                 context_dict = temp_context.model_dump(exclude={'is_finalized'})
-            if not context_dict.get("items"):
-                 return "The user's order is currently empty."
-            return f"Current Order State (JSON):\n```json\n{json.dumps(context_dict, indent=2)}\n```"
+            with span("session_write"):
+                new_version = await session_store.put(session.session_id, response.context, session.version)
+        except VersionConflict as e:
+            record_error("session_conflict")
+            log.warning("session_conflict", session_id=e.session_id, expected=e.expected, actual=e.actual)
+            raise HTTPException(status_code=409, detail="This order was updated by another request. Please try again.")
         except Exception as e:
-            print(f"Error dumping model context for prompt: {e}")
-            return "Error formatting current order state. Assume order is empty."
-
-class OrderItemDetail(BaseModel):
-    quantity: int = Field(gt=0)
-    base_price: float = Field(ge=0)
-    total_price: float = Field(ge=0)
-    modifications: List[str] = Field(default_factory=list)
-
-class OrderContext(BaseModel):
-    items: Dict[str, OrderItemDetail] = Field(default_factory=dict)
-    subtotal: float = Field(default=0.0, ge=0)
-    is_finalized: bool = False
-
-class ChatRequest(BaseModel):
-    message: str
-    context: Optional[Dict[str, Any]] = None
-
-class ChatResponse(BaseModel):
-    reply: str
-    context: OrderContext
-
-SYSTEM_PROMPT_TEMPLATE = """
-You are "McBot", a friendly and helpful AI assistant for taking McDonald's orders.
-Your goal is to assist users in building their order, handling requests naturally, and keeping track of the items, modifications, quantities, and subtotal accurately.
-
-**Your Instructions:**
-
-1.  **Be Conversational:** Respond politely and naturally. Understand greetings and respond appropriately. Always ask "Anything else?" after successfully adding or modifying an item, unless the order is being finalized (see rule 11).
-
-2.  **Use the Menu:** Only add items from the menu provided below. If a user asks for something not on the menu, politely inform them it's unavailable. Prices are listed in the menu. Use the exact item names from the menu as keys in the JSON `items` dictionary (e.g., "large fries", "honey mustard sauce").
-
-3.  **Track the Order:** Maintain a list of items the user has added in the `items` dictionary within the JSON context. Each item key should be the exact item name from the menu. The value should be an object containing `quantity`, `base_price` (from the menu), `total_price` (quantity * base_price), and a list of `modifications`. If a user orders an item already in the list, increment the `quantity` and update the `total_price`.
-
-4.  **Handle Multiple Items & Details:** If the user mentions multiple items or details in a single message (e.g., "filet o fish and large fries", "2 mcchickens and a small coke"), add all recognized items with their specified details. **Crucially, capture associated details like size or quantity mentioned for each item (e.g., if the user says 'large fries', add 'large fries', not just 'fries'; if they say '2 ketchup packets', set quantity to 2).** If a size or essential detail is truly missing for an item that requires it (like fries or drinks), then ask for clarification *only for that specific item*, while still adding any other fully specified items from the message.
-    * Example 1 (Size Provided): User: 'a mcchicken and a large sprite' -> Bot adds 'mcchicken' (qty 1) and 'large sprite' (qty 1) to the JSON, then asks 'Anything else?'
-    * Example 2 (Size Missing): User: 'fillet o fish and fries' -> Bot adds 'filet-o-fish' (qty 1) to JSON. Recognizes 'fries' but size is missing. Bot asks 'I've added the Filet-o-Fish. What size fries would you like?' (The Filet-o-Fish remains in the JSON context).
-
-5.  **Handle Modifications:** Understand requests like "extra cheese", "no pickles", "add onions", "plain". Add these modifications as strings to the `modifications` list for the specific item in the `items` dictionary. Assume simple modifications do not change the `base_price`.
-
-6.  **Calculate Subtotal:** Keep a running `subtotal` of all items in the order. **Update it accurately** whenever items are added, removed, or quantities change. The subtotal MUST be the sum of the `total_price` for every item currently in the `items` dictionary. Calculate prices carefully (quantity * base_price).
-
-7.  **Show Menu/Order/Subtotal:** If the user asks for the "menu", their "order", or "subtotal", provide that information clearly based on the current context JSON. Format the order details nicely in your reply.
-
-8.  **Handle Ambiguity:** If the user's request is unclear (e.g., "add a burger"), ask for clarification (e.g., "Which burger would you like? We have...").
-
-9.  **Handle Removal/Quantity Change:** Understand requests like "remove the big mac", "take off the fries", "make that 2 cokes instead of 1", "I only want one fries". Update the `items` dictionary (remove item or change quantity) and recalculate the `subtotal` correctly.
-
-10. **Handle Off-Topic:** If the user asks something unrelated to ordering, gently redirect them back to the order. Example: "I can only help with McDonald's orders right now. Was there anything else you wanted to add?"
-
-11. **Finalize Order:** When the user clearly indicates they are finished ordering (e.g., says 'no', 'that's all', 'nope', 'that's it' in response to 'Anything else?'), **do not ask 'Anything else?' again.** Instead, follow these steps meticulously:
-    * **First, summarize the order:** In your text reply, list the quantity and name of each item currently in the `items` dictionary (based on the final state you are about to put in the JSON). Format it naturally (e.g., "Okay, so you have 1 Filet-O-Fish, 1 Large Fries, and 2 Honey Mustard Sauce."). Include any modifications if present.
-    * **Then, state the final subtotal:** Clearly state the final total based on the `subtotal` field calculated for the JSON context.
-    * **Finally, provide a polite closing message.** (e.g., "Thanks for ordering with McBot!")
-    * **CRITICAL JSON Step:** In the JSON block accompanying this final reply, set the field `"is_finalized": true`. **The `items` dictionary and `subtotal` in this final JSON MUST perfectly match all the items, quantities, modifications, and the total price stated in your textual summary.** Ensure all calculations are correct.
-
-12. **Output Format:** Your response MUST contain two parts:
-    * The user-facing conversational reply based on the instructions above.
-    * A JSON block representing the COMPLETE updated order state, enclosed in ```json ... ```. This JSON block MUST strictly follow the structure of the `OrderContext` model (containing `items`, `subtotal`, and `is_finalized`). Double-check your JSON structure, item names, quantities, prices, modifications, and the subtotal for accuracy before outputting. Set `is_finalized` to `true` ONLY when finalizing the order as per rule 11.
-
-**Menu:**
-{menu_string}
-
-**Current Order State:**
-{context_string}
-
-**User Message:**
-{user_message}
-
-**Your Response (Reply + JSON):** Ensure the JSON is valid and accurately reflects the order state described in the reply.  
-"""
-
-@app.post("/api/chat", response_model=ChatResponse)
-async def chat_handler(request: ChatRequest):
-    print(f"Received request: message='{request.message}', context={request.context}")
-    user_message = request.message
-
+            raise session_unavailable(e)
+        response.session_id = session.session_id
+        response.session_version = new_version
+    if response.context.is_finalized:
+        response.reply += save_finalized_order(response.context)
+    return response
+
+def parse_incoming_context(request: ChatRequest) -> OrderContext:
     current_context = OrderContext()
     if request.context:
         try:
-            current_context = OrderContext(**request.context)
+            # Client-supplied prices are ignored; the order is repriced from the menu.
+            current_context = price_book.price_order(OrderContext(**request.context)).context
             current_context.is_finalized = False
-            print("Successfully parsed incoming context.")
         except Exception as e:
-             print(f"Warning: Could not parse incoming context dict: {e}. Using empty context.")
-
-    if not GOOGLE_API_KEY:
-        print("ERROR in chat_handler: Google API key is missing or failed to configure.")
+            record_error("context_invalid")
+            log.warning("context_invalid", error=str(e))
+    return current_context
+
+def fast_path_response(user_message: str, current_context: OrderContext) -> Optional[ChatResponse]:
+    fast_result = try_fast_path(user_message, current_context, menu_index)
+    if fast_result is None:
+        return None
+    priced_context = price_book.price_order(fast_result.context).context
+    return ChatResponse(reply=fast_result.reply, context=priced_context, source="fast_path")
+
+def local_response(user_message: str, current_context: OrderContext, cache_key: str) -> Optional[ChatResponse]:
+    # Everything that can be answered without Gemini, cheapest first.
+    with span("local_answer"):
+        menu_reply = menu_answers.answer(user_message)
+        if menu_reply is not None:
+            return ChatResponse(reply=menu_reply, context=current_context, source="menu")
+        fast_response = fast_path_response(user_message, current_context)
+        if fast_response is not None:
+            return fast_response
+        cached_reply = response_cache.get(cache_key)
+        if cached_reply is not None:
+            return ChatResponse(reply=cached_reply, context=current_context, source="cache")
+    return None
+
+def remember_reply(cache_key: str, current_context: OrderContext, response: ChatResponse, parsed: bool, latency: float) -> None:
+    # Only turns the model answered cleanly without touching the order are
+    # safe to replay for the next identical question.
+    if parsed and not response.context.is_finalized and response.context.items == current_context.items:
+        response_cache.put(cache_key, response.reply, latency)
+
+async def ensure_llm_configured() -> None:
+    if not await gemini.wait_ready():
+        record_error("llm_not_configured")
+        log.error("llm_not_configured", state=gemini.state)
         raise HTTPException(status_code=500, detail="API key is not configured correctly on the server.")
 
-    menu_str = format_menu_for_prompt(mcdonalds_menu)
-    context_str = format_context_for_prompt(current_context)
-
-    prompt = SYSTEM_PROMPT_TEMPLATE.format(
-        menu_string=menu_str,
-        context_string=context_str,
-        user_message=user_message
+def invalid_output_response(message: str, current_context: OrderContext) -> Tuple[ChatResponse, bool]:
+    return ChatResponse(
+        reply=f"{message}\n(Your previous order state is maintained.)",
+        context=current_context
+    ), False
+
+def apply_llm_output(llm_response_text: str, current_context: OrderContext, codec: OrderCodec,
+                     extractor: Optional[OrderBlockExtractor] = None) -> Tuple[ChatResponse, bool]:
+    # The flag is False when the model's order JSON was missing or invalid
+    # and the previous context was kept. codec is the one the prompt was
+    # built with: item ids mean what they meant before the model call, even
+    # if the menu was reloaded while it ran.
+    log.payload("llm_output", text=llm_response_text)
+
+    with span("json_extract"):
+        parsed = output_parser.parse(llm_response_text, structured=prompt_cache.json_output, extractor=extractor)
+    if parsed.order is None:
+        error_kind = parsed.error.split(":", 1)[0]
+        record_error("llm_output_" + error_kind.replace(" ", "_"))
+        log.warning("llm_output_unparsed", error=parsed.error, chars=len(llm_response_text))
+        if parsed.error == "no JSON block found":
+            return invalid_output_response("Sorry, I couldn't update the order state. Please try rephrasing your request.", current_context)
+        return invalid_output_response(f"Internal error: AI returned improperly formatted order data ({parsed.error}).", current_context)
+
+    with span("validation"):
+        try:
+            unknown_ids: List[int] = []
+            if isinstance(parsed.order.get("items"), list):
+                # Compact lines: [id, qty, mods] in text mode, {id, qty, mods} in JSON mode.
+                validated_context, unknown_ids = codec.from_compact(parsed.order)
+            else:
+                validated_context = OrderContext(**parsed.order)
+        except Exception as e:
+            record_error("llm_output_invalid")
+            log.warning("llm_output_invalid", error=str(e))
+            return invalid_output_response(f"Internal error: AI returned invalid order data (Validation Error: {e}).", current_context)
+
+        # Never trust the model's names or arithmetic: canonicalize every line
+        # against the menu and reprice it server-side.
+        pricing = price_book.price_order(validated_context, unknown_ids)
+    if pricing.repaired or pricing.dropped or pricing.unknown_ids:
+        log.info("llm_items_repaired", repaired=len(pricing.repaired), dropped=len(pricing.dropped),
+                 unknown_ids=pricing.unknown_ids)
+    if abs(validated_context.subtotal - pricing.context.subtotal) > 0.01 and validated_context.subtotal:
+        record_error("llm_subtotal_mismatch")
+    updated_context = pricing.context
+    reply_text = parsed.reply or "Okay, order updated."
+    reply_text += pricing.note()
+    return ChatResponse(reply=reply_text, context=updated_context), True
+
+def busy_exception(e: SchedulerRejected) -> HTTPException:
+    record_error("llm_rejected")
+    log.warning("llm_rejected", reason=e.reason, in_flight=llm_scheduler.in_flight, queued=llm_scheduler.queue_depth)
+    return HTTPException(
+        status_code=503,
+        detail="McBot is busy right now. Please try again in a moment.",
+        headers={"Retry-After": str(max(1, int(e.retry_after)))},
     )
 
+def blocked_exception(llm_response, detail_prefix: str) -> Optional[HTTPException]:
+    feedback = getattr(llm_response, 'prompt_feedback', None)
+    if not (feedback and feedback.block_reason):
+        return None
+    block_message = feedback.block_reason_message or "Blocked by safety filter."
+    record_error("llm_blocked")
+    log.warning("llm_blocked", reason=str(feedback.block_reason))
+    return HTTPException(status_code=400, detail=f"{detail_prefix}: {block_message}")
+
+@app.post("/api/chat", response_model=ChatResponse)
+async def chat_handler(request: ChatRequest):
+    trace = start_trace("chat")
+    log.payload("chat_request", message=request.message, context=request.context)
+    try:
+        response = await run_chat_turn(request)
+    except HTTPException as e:
+        finish_trace(trace, source="error", status=e.status_code)
+        raise
+    except Exception:
+        finish_trace(trace, source="error", status=500)
+        raise
+    finish_trace(trace, source=response.source)
+    return response
+
+async def run_chat_turn(request: ChatRequest) -> ChatResponse:
+    user_message = request.message
+    current_context, session = await load_turn_context(request)
+
+    cache_key = response_cache.key(user_message, current_context)
+    quick_response = local_response(user_message, current_context, cache_key)
+    if quick_response is not None:
+        return await finish_turn(quick_response, session)
+
+    await ensure_llm_configured()
+    with span("prompt_build"):
+        prompt = prompt_cache.build_turn_prompt(current_context, user_message)
+        codec = prompt_cache.codec
+
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        print("Calling Gemini API...")
-        llm_response = await model.generate_content_async(prompt)
-        print("Received response from Gemini.")
+        model = await prompt_cache.get_model()
+        started = time.perf_counter()
+        try:
+            llm_response = await llm_scheduler.run(lambda: model.generate_content_async(prompt))
+        except SchedulerRejected as e:
+            raise busy_exception(e)
+        record_token_usage(llm_response)
 
         llm_response_text = ""
         try:
@@ -252,114 +398,135 @@ async def chat_handler(request: ChatRequest):
             elif hasattr(llm_response, 'parts') and llm_response.parts:
                  llm_response_text = "".join(part.text for part in llm_response.parts if hasattr(part, 'text'))
             else:
-                 if hasattr(llm_response, 'prompt_feedback') and llm_response.prompt_feedback and llm_response.prompt_feedback.block_reason:
-                      block_reason = llm_response.prompt_feedback.block_reason
-                      block_message = llm_response.prompt_feedback.block_reason_message or "Blocked by safety filter."
-                      print(f"Warning: LLM Response Blocked. Reason: {block_reason}")
-                      raise HTTPException(status_code=400, detail=f"Request blocked by AI safety filter: {block_message}")
-                 else:
-                     print(f"Warning: Unexpected LLM response structure: {llm_response}")
-                     llm_response_text = str(llm_response)
+                 blocked = blocked_exception(llm_response, "Request blocked by AI safety filter")
+                 if blocked is not None:
+                      raise blocked
+                 log.warning("llm_unexpected_response", response_type=type(llm_response).__name__)
+                 llm_response_text = str(llm_response)
 
             if not llm_response_text.strip():
-                 print("Warning: LLM response text is empty.")
-                 if hasattr(llm_response, 'prompt_feedback') and llm_response.prompt_feedback and llm_response.prompt_feedback.block_reason:
-                      block_reason = llm_response.prompt_feedback.block_reason
-                      block_message = llm_response.prompt_feedback.block_reason_message or "Blocked by safety filter."
-                      print(f"Warning: LLM Response Blocked (empty text). Reason: {block_reason}")
-                      raise HTTPException(status_code=400, detail=f"Request blocked by AI safety filter (empty response): {block_message}")
+                 blocked = blocked_exception(llm_response, "Request blocked by AI safety filter (empty response)")
+                 if blocked is not None:
+                      raise blocked
+                 record_error("llm_empty")
                  raise ValueError("LLM returned an empty response text.")
 
         except HTTPException as http_exc:
              raise http_exc
         except Exception as e:
-            print(f"Error accessing LLM response content: {e}")
-            print(f"Raw LLM response object: {llm_response}")
+            record_error("llm_response_unreadable")
+            log.error("llm_response_unreadable", error=str(e))
             raise HTTPException(status_code=500, detail=f"Error processing response from AI model: {e}")
 
-        print(f"LLM Raw Response Text:\n{llm_response_text}\n--------------------")
-
-        reply_text = llm_response_text
-        updated_context = current_context
-
-        json_match = re.search(r"```json\s*({.*?})\s*```", llm_response_text, re.DOTALL)
-        updated_context_dict = None
-        validation_error = False
-        validation_error_message = "Failed to process order update."
-
-        if json_match:
-            json_string_found = json_match.group(1)
-            try:
-                updated_context_dict = json.loads(json_string_found)
-                print("Successfully parsed JSON from LLM response.")
-                validated_context = OrderContext(**updated_context_dict)
-                calculated_subtotal = sum(item.total_price for item in validated_context.items.values())
-                if abs(validated_context.subtotal - calculated_subtotal) > 0.01:
-                    print(f"Warning: LLM subtotal ({validated_context.subtotal}) differs from calculated subtotal ({calculated_subtotal}). Using calculated value.")
-                    validated_context.subtotal = calculated_subtotal
-                updated_context = validated_context
-                print("Context dictionary validated successfully.")
-                reply_text = re.sub(r"```json\s*({.*?})\s*```", "", llm_response_text, flags=re.DOTALL).strip()
-                if not reply_text: reply_text = "Okay, order updated."
-
-            except json.JSONDecodeError as e:
-                print(f"ERROR: Failed to decode JSON from LLM response: {e}\nJSON String Attempted: {json_string_found}")
-                validation_error = True
-                validation_error_message = f"Internal error: AI returned improperly formatted order data (JSON Decode Error: {e})."
-            except Exception as e:
-                print(f"ERROR: Error validating LLM context JSON: {e}\nDict Attempted: {updated_context_dict}")
-                validation_error = True
-                validation_error_message = f"Internal error: AI returned invalid order data (Validation Error: {e})."
-        else:
-             print("Warning: No JSON block found in LLM response.")
-             validation_error = True
-             validation_error_message = "Sorry, I couldn't update the order state. Please try rephrasing your request."
-
-        if validation_error:
-            print(f"Warning: Could not parse or validate updated context JSON. Falling back to previous context.")
-            return ChatResponse(
-                reply=f"{validation_error_message}\n(Your previous order state is maintained.)",
-                context=current_context
-            )
-
-        if updated_context.is_finalized:
-            print("Order finalized. Attempting to save to MongoDB...")
-            if orders_collection is not None and mongo_client is not None:
-                try:
-                    order_data = updated_context.model_dump()
-                    order_data['orderTimestamp'] = datetime.datetime.now(datetime.timezone.utc)
-                    insert_result = orders_collection.insert_one(order_data)
-                    print(f"Order successfully saved to MongoDB with ID: {insert_result.inserted_id}")
-                except Exception as e:
-                    print(f"ERROR: Failed to save finalized order to MongoDB: {e}")
-                    traceback.print_exc()
-                    reply_text += " (Note: There was an issue saving the order to the database.)"
-            else:
-                 print("Warning: MongoDB connection not available. Cannot save finalized order.")
-                 reply_text += " (Note: Order could not be saved to database due to connection issue.)"
-
-        print(f"Sending response: reply='{reply_text}', context={updated_context.model_dump()}")
-        return ChatResponse(reply=reply_text, context=updated_context)
+        llm_latency = time.perf_counter() - started
+        response, parsed = apply_llm_output(llm_response_text, current_context, codec)
+        response = await finish_turn(response, session)
+        remember_reply(cache_key, current_context, response, parsed, llm_latency)
+        return response
 
     except HTTPException as http_exc:
         raise http_exc
     except Exception as e:
-        print(f"FATAL ERROR in chat_handler: {e}")
-        traceback.print_exc()
+        record_error(type(e).__name__)
+        log.error("chat_turn_failed", error=str(e), exc=traceback.format_exc())
         fallback_context = current_context
         error_reply = "Sorry, an unexpected server error occurred. Please try again later."
-        return ChatResponse(reply=error_reply, context=fallback_context)
+        return await finish_turn(ChatResponse(reply=error_reply, context=fallback_context), session)
+
+def response_chunk_text(chunk) -> str:
+    try:
+        return chunk.text
+    except Exception:
+        # Safety-blocked or empty candidates raise on .text; treat as no text.
+        return "".join(part.text for part in getattr(chunk, 'parts', []) if hasattr(part, 'text'))
+
+@app.post("/api/chat/stream")
+async def chat_stream_handler(request: ChatRequest):
+    trace = start_trace("chat_stream")
+    log.payload("chat_request", message=request.message, context=request.context)
+    try:
+        return await start_stream_turn(request, trace)
+    except HTTPException as e:
+        finish_trace(trace, source="error", status=e.status_code)
+        raise
+    except Exception:
+        finish_trace(trace, source="error", status=500)
+        raise
+
+async def start_stream_turn(request: ChatRequest, trace: Trace) -> StreamingResponse:
+    user_message = request.message
+    current_context, session = await load_turn_context(request)
+
+    cache_key = response_cache.key(user_message, current_context)
+    quick_response = local_response(user_message, current_context, cache_key)
+    if quick_response is not None:
+        quick_response = await finish_turn(quick_response, session)
+        finish_trace(trace, source=quick_response.source)
+
+        async def quick_events():
+            yield ndjson_event("delta", text=quick_response.reply)
+            yield ndjson_event("done", **quick_response.model_dump())
+        return StreamingResponse(quick_events(), media_type="application/x-ndjson", headers=STREAM_HEADERS)
+
+    await ensure_llm_configured()
+    with span("prompt_build"):
+        prompt = prompt_cache.build_turn_prompt(current_context, user_message)
+        codec = prompt_cache.codec
+    model = await prompt_cache.get_model()
+
+    async def llm_events():
+        activate(trace)
+        # Text mode: the extractor that decides what is safe to show (nothing
+        # from an order object's "{" on) also produces the final parse.
+        extractor = None if prompt_cache.json_output else OrderBlockExtractor()
+        splitter = StructuredReplyStreamer() if extractor is None else extractor
+        started = time.perf_counter()
+        source, status = "llm", 200
+        try:
+            last_chunk = None
+            async for chunk in llm_scheduler.stream(lambda: model.generate_content_async(prompt, stream=True)):
+                last_chunk = chunk
+                visible_text = splitter.feed(response_chunk_text(chunk))
+                if visible_text:
+                    yield ndjson_event("delta", text=visible_text)
+            # Usage metadata on a stream is cumulative; the last chunk has the totals.
+            record_token_usage(last_chunk)
+            if not splitter.text.strip():
+                record_error("llm_empty")
+                raise ValueError("LLM returned an empty response text.")
+            llm_latency = time.perf_counter() - started
+            final_response, parsed = apply_llm_output(splitter.text, current_context, codec, extractor)
+            final_response = await finish_turn(final_response, session)
+            remember_reply(cache_key, current_context, final_response, parsed, llm_latency)
+            yield ndjson_event("done", **final_response.model_dump())
+        except SchedulerRejected as e:
+            busy = busy_exception(e)
+            source, status = "error", busy.status_code
+            yield ndjson_event("error", status=busy.status_code, detail=busy.detail, retry_after=busy.headers["Retry-After"])
+        except HTTPException as e:
+            source, status = "error", e.status_code
+            yield ndjson_event("error", status=e.status_code, detail=e.detail)
+        except Exception as e:
+            record_error(type(e).__name__)
+            log.error("chat_stream_failed", error=str(e), exc=traceback.format_exc())
+            error_reply = "Sorry, an unexpected server error occurred. Please try again later."
+            error_response = ChatResponse(reply=error_reply, context=current_context)
+            if session is not None:
+                error_response.session_id, error_response.session_version = session.session_id, session.version
+            yield ndjson_event("done", **error_response.model_dump())
+        finally:
+            finish_trace(trace, source=source, status=status)
+
+    return StreamingResponse(llm_events(), media_type="application/x-ndjson", headers=STREAM_HEADERS)
 
 if __name__ == "__main__":
     import uvicorn
     print("Starting McBot server...")
-    if not GOOGLE_API_KEY:
+    if not gemini.api_key and gemini.state != "configured":
          print("!!! FATAL: GOOGLE_API_KEY not found in environment variables. Server cannot start. !!!")
          exit()
-    if not orders_collection:
-        print("!!! WARNING: MongoDB connection failed or not established during startup. Orders cannot be saved. !!!")
-    else:
-        print("MongoDB connection appears successful.")
+    if mongo.uri is None:
+        print("!!! WARNING: MongoDB is not configured. Finalized orders will be kept in the local spill file. !!!")
 
     print("Server attempting to start...")
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
\ No newline at end of file
+    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
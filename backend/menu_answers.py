@@ -0,0 +1,88 @@
+import re
+from typing import Dict, List, Optional
+
+from money import to_cents
+from order_parser import MenuIndex, normalize
+
+# Read-only questions about the menu ("how much are large fries", "whats on
+# a mcdouble", "show me the menu") answered straight from the menu dict.
+# Like the fast-path parser, anything it isn't sure about returns None.
+
+MENU_PHRASES = {
+    "menu", "the menu", "show menu", "show the menu", "show me the menu", "see the menu",
+    "can i see the menu", "can i see a menu", "whats on the menu", "what is on the menu",
+    "what do you have", "what do you sell", "what can i order", "what can i get",
+    "full menu", "show me the full menu", "menu please",
+}
+
+PRICE_PATTERNS = [
+    re.compile(r"^how much (?:is|are|does|do|for|would) (?P<item>.+?)(?: cost| be)?$"),
+    re.compile(r"^(?:whats|what is|what are) the (?:price|cost|prices) (?:of|for) (?P<item>.+)$"),
+    re.compile(r"^(?:price|cost|prices) (?:of|for) (?P<item>.+)$"),
+    re.compile(r"^what (?:does|do) (?P<item>.+?) cost$"),
+]
+
+DESCRIPTION_PATTERNS = [
+    re.compile(r"^(?:whats|what is|what are|what s) (?:in|on) (?P<item>.+)$"),
+    re.compile(r"^what (?:comes|goes) (?:in|on|with) (?P<item>.+)$"),
+    re.compile(r"^(?:describe|tell me about) (?P<item>.+)$"),
+]
+
+LEADING_WORDS_RE = re.compile(r"^(?:a|an|the|one|your|a single)\s+")
+TRAILING_WORDS_RE = re.compile(r"\s+(?:please|thanks|thank you|each|now|today)$")
+
+
+def _price(value) -> str:
+    return f"${to_cents(value)}"
+
+
+class MenuAnswers:
+    """Answers price, description and "show the menu" questions for one
+    menu. The full menu reply is rendered once per menu."""
+
+    def __init__(self, menu: Dict[str, Dict], index: MenuIndex):
+        self.menu = menu
+        self.index = index
+        lines = [f"- {name.title()}: {_price(details['price'])}" for name, details in menu.items()]
+        self.menu_reply = "Here's our menu:\n" + "\n".join(lines) + "\nWhat can I get for you?"
+        self.answered = 0
+
+    def _item_names(self, phrase: str) -> List[str]:
+        phrase = TRAILING_WORDS_RE.sub("", LEADING_WORDS_RE.sub("", phrase.strip()))
+        name = self.index.resolve(phrase)
+        if name is not None:
+            return [name]
+        # "fries" / "coke" without a size: answer for every size.
+        return self.index.sized_variants(phrase)
+
+    def _price_reply(self, names: List[str]) -> str:
+        if len(names) == 1:
+            return f"A {names[0].title()} is {_price(self.menu[names[0]]['price'])}. Would you like to add one?"
+        sizes = ", ".join(f"{name.title()} {_price(self.menu[name]['price'])}" for name in names)
+        return f"We have {sizes}. Which one would you like?"
+
+    def _description_reply(self, names: List[str]) -> str:
+        if len(names) == 1:
+            details = self.menu[names[0]]
+            return f"{names[0].title()} ({_price(details['price'])}): {details.get('description', '')} Would you like to add one?"
+        return self._price_reply(names)
+
+    def answer(self, message: str) -> Optional[str]:
+        text = normalize(message)
+        if not text:
+            return None
+        reply = None
+        if text in MENU_PHRASES:
+            reply = self.menu_reply
+        else:
+            for patterns, render in ((PRICE_PATTERNS, self._price_reply), (DESCRIPTION_PATTERNS, self._description_reply)):
+                match = next((m for m in (p.match(text) for p in patterns) if m), None)
+                if match is None:
+                    continue
+                names = self._item_names(match.group("item"))
+                if names:
+                    reply = render(names)
+                break
+        if reply is not None:
+            self.answered += 1
+        return reply
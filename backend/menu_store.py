@@ -0,0 +1,215 @@
+import asyncio
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from telemetry import log, record_error
+
+# The menu lives in a versioned JSON file (or, across nodes, in Mongo)
+# rather than in code, so a price change is a data edit, not a redeploy:
+#
+#   {"version": "2024-05-01.1", "items": {"big mac": {"price": 5.99, "description": "..."}, ...}}
+#
+# Item order matters: prompt ids are positions in the menu, so append new
+# items at the end. Replace the file atomically (write a temp file, rename it
+# over), since every worker polls it and reloads whatever it finds.
+
+DEFAULT_MENU_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "menu.json")
+
+
+class MenuError(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class MenuVersion:
+    """One parsed, validated menu. items is read-only all the way down, so
+    every structure built from it can be shared without copying."""
+
+    version: str
+    items: Mapping[str, Mapping[str, Any]]
+    fingerprint: str
+    source: str
+
+
+def _freeze_items(raw: Any) -> Mapping[str, Mapping[str, Any]]:
+    if not isinstance(raw, dict) or not raw:
+        raise MenuError("menu has no items")
+    items: Dict[str, Mapping[str, Any]] = {}
+    for name, details in raw.items():
+        if not isinstance(details, dict):
+            raise MenuError(f"{name!r}: expected an object")
+        price = details.get("price")
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+            raise MenuError(f"{name!r}: price must be a non-negative number")
+        if not isinstance(details.get("description", ""), str):
+            raise MenuError(f"{name!r}: description must be a string")
+        items[name] = MappingProxyType(dict(details))
+    return MappingProxyType(items)
+
+
+def parse_menu(document: Any, source: str = "<memory>") -> MenuVersion:
+    if not isinstance(document, dict):
+        raise MenuError("menu file must contain a JSON object")
+    items = _freeze_items(document.get("items"))
+    canonical = json.dumps(document.get("items"), sort_keys=True)
+    return MenuVersion(
+        version=str(document.get("version") or "unversioned"),
+        items=items,
+        fingerprint=hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        source=source,
+    )
+
+
+def load_menu_file(path: str = DEFAULT_MENU_PATH) -> MenuVersion:
+    try:
+        with open(path, encoding="utf-8") as f:
+            document = json.load(f)
+    except ValueError as e:
+        raise MenuError(f"{path}: {e}") from e
+    return parse_menu(document, source=path)
+
+
+class FileMenuSource:
+    """menu.json on local disk; changes are seen through stat()."""
+
+    def __init__(self, path: str = DEFAULT_MENU_PATH):
+        self.path = path
+
+    def signature(self) -> Optional[Tuple[int, int, int]]:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def load(self) -> MenuVersion:
+        return load_menu_file(self.path)
+
+
+class MongoMenuSource:
+    """The newest document in a Mongo collection, for several nodes that
+    don't share a disk. Publishing a menu is inserting a document shaped
+    like menu.json; the newest _id wins."""
+
+    def __init__(self, get_collection: Callable[[], Any]):
+        self.get_collection = get_collection
+        self.path = "mongo"
+
+    def signature(self) -> Any:
+        collection = self.get_collection()
+        if collection is None:
+            return None
+        newest = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        return newest["_id"] if newest else None
+
+    def load(self) -> MenuVersion:
+        document = self.get_collection().find_one({}, sort=[("_id", -1)])
+        if document is None:
+            raise MenuError("no menu documents")
+        return parse_menu(document, source=f"mongo:{document['_id']}")
+
+
+class MenuWatcher:
+    """Polls a menu source and hands each new version to on_change.
+
+    Polling costs one stat() (or one indexed find_one) per interval while
+    nothing changes; the menu itself is read and parsed in a worker thread.
+    A menu that fails to load is logged, the current one keeps serving, and
+    the load is retried on the next poll. Every worker runs its own watcher
+    on the same source, so all of them converge on a new menu within one
+    interval.
+    """
+
+    def __init__(self, source, on_change: Callable[[MenuVersion], None], interval: float = 5.0,
+                 initial_path: str = DEFAULT_MENU_PATH):
+        self.source = source
+        self.on_change = on_change
+        self.interval = interval
+        self.initial_path = initial_path
+        self.current: Optional[MenuVersion] = None
+        self._signature: Any = None
+        self._task: Optional[asyncio.Task] = None
+        self.reloads = 0
+        self.failures = 0
+
+    @classmethod
+    def from_env(cls, on_change: Callable[[MenuVersion], None],
+                 get_collection: Callable[[], Any] = lambda: None) -> "MenuWatcher":
+        # MENU_SOURCE=mongo still starts from the file: Mongo connects in
+        # the background, and the first poll after that switches over.
+        path = os.getenv("MENU_PATH") or DEFAULT_MENU_PATH
+        if os.getenv("MENU_SOURCE", "file").lower() == "mongo":
+            source = MongoMenuSource(get_collection)
+        else:
+            source = FileMenuSource(path)
+        return cls(source, on_change, interval=float(os.getenv("MENU_RELOAD_INTERVAL_SECONDS", "5")), initial_path=path)
+
+    def load(self) -> MenuVersion:
+        # Synchronous first load at import time; a broken menu here is fatal.
+        if isinstance(self.source, FileMenuSource):
+            self._signature = self.source.signature()
+        menu = load_menu_file(self.initial_path)
+        self._apply(menu)
+        return menu
+
+    def _apply(self, menu: MenuVersion) -> None:
+        previous = self.current
+        self.current = menu
+        if previous is not None and previous.fingerprint == menu.fingerprint:
+            return
+        self.on_change(menu)
+        if previous is not None:
+            self.reloads += 1
+            log.info("menu_reloaded", version=menu.version, previous_version=previous.version,
+                     source=menu.source, items=len(menu.items))
+
+    async def check(self) -> None:
+        try:
+            signature = await asyncio.to_thread(self.source.signature)
+            if signature is None or signature == self._signature:
+                return
+            menu = await asyncio.to_thread(self.source.load)
+        except Exception as e:
+            # The signature isn't recorded, so the next poll tries again: a
+            # Mongo blip or a file caught mid-write mustn't leave this worker
+            # on the old menu while the others move on.
+            self.failures += 1
+            record_error("menu_reload")
+            log.error("menu_reload_failed", source=self.source.path, error=str(e))
+            return
+        self._signature = signature
+        self._apply(menu)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.check()
+
+    def start(self) -> None:
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "version": self.current.version if self.current else None,
+            "fingerprint": self.current.fingerprint if self.current else None,
+            "source": self.current.source if self.current else None,
+            "items": len(self.current.items) if self.current else 0,
+            "reload_interval_seconds": self.interval,
+            "reloads": self.reloads,
+            "failures": self.failures,
+        }
@@ -0,0 +1,33 @@
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class OrderItemDetail(BaseModel):
+    quantity: int = Field(gt=0)
+    base_price: float = Field(ge=0)
+    total_price: float = Field(ge=0)
+    modifications: List[str] = Field(default_factory=list)
+
+class OrderContext(BaseModel):
+    items: Dict[str, OrderItemDetail] = Field(default_factory=dict)
+    subtotal: float = Field(default=0.0, ge=0)
+    is_finalized: bool = False
+
+class ChatRequest(BaseModel):
+    message: str
+    context: Optional[Dict[str, Any]] = None
+    # Session mode: the server keeps the order, so the client only sends the
+    # id (or use_session=True to get a new one) and the last version it saw.
+    session_id: Optional[str] = None
+    session_version: Optional[int] = None
+    use_session: bool = False
+
+class ChatResponse(BaseModel):
+    reply: str
+    context: OrderContext
+    # Who answered the turn: "llm" (Gemini), "fast_path" (local order parser),
+    # "menu" (menu/price lookup) or "cache" (a reused Gemini reply).
+    source: str = "llm"
+    session_id: Optional[str] = None
+    session_version: Optional[int] = None
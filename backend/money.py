@@ -0,0 +1,12 @@
+from decimal import ROUND_HALF_UP, Decimal
+
+CENT = Decimal("0.01")
+
+
+def to_cents(value) -> Decimal:
+    # str() first so 5.99 becomes Decimal("5.99"), not its binary approximation.
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def line_total(price: Decimal, quantity: int) -> Decimal:
+    return (price * quantity).quantize(CENT, rounding=ROUND_HALF_UP)
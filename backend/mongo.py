@@ -0,0 +1,117 @@
+import asyncio
+import os
+import traceback
+from typing import Awaitable, Callable, Dict, Optional
+
+from telemetry import log
+
+
+def mongo_uri_from_env() -> Optional[str]:
+    # MONGO_URI wins so a local mongod (or any stand-in) can replace Atlas.
+    uri = os.getenv("MONGO_URI")
+    if uri:
+        return uri
+    password = os.getenv("MONGO_PASSWORD")
+    if not password:
+        return None
+    user = os.getenv("MONGO_USER")
+    cluster_url = os.getenv("MONGO_CLUSTER_URL")
+    return f"mongodb+srv://{user}:{password}@{cluster_url}/?retryWrites=true&w=majority&appName=UserOrders"
+
+
+class MongoConnection:
+    """Connects to MongoDB in the background instead of at import time.
+
+    ``collection`` is None until the first successful ping, so callers never
+    block on Atlas; failed attempts are retried with backoff.
+    """
+
+    def __init__(self, uri: Optional[str], database: str = "mcdonalds_orders", collection: str = "orders",
+                 retry_initial: float = 1.0, retry_max: float = 60.0):
+        self.uri = uri
+        self.database_name = database
+        self.collection_name = collection
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.client = None
+        self.collection = None
+        self.state = "disabled" if uri is None else "idle"
+        self.last_error: Optional[str] = None
+        self.attempts = 0
+        self._task: Optional[asyncio.Task] = None
+        self._on_connected: Optional[Callable[[], Awaitable[None]]] = None
+
+    @classmethod
+    def for_collection(cls, collection, name: str = "stand-in") -> "MongoConnection":
+        # Wraps an already-open collection (mongomock, an in-memory fake);
+        # start() then only runs the on-connect hook.
+        connection = cls(name)
+        connection.collection = collection
+        connection.state = "connected"
+        return connection
+
+    def start(self, on_connected: Optional[Callable[[], Awaitable[None]]] = None) -> None:
+        if self.uri is None:
+            log.error("mongo_not_configured", hint="Set MONGO_PASSWORD (or MONGO_URI) in the environment or .env file.")
+            return
+        self._on_connected = on_connected
+        if self._task is None:
+            self._task = asyncio.create_task(self._connect_loop())
+
+    def _connect(self):
+        # Imported here so a process that never reaches Mongo doesn't pay for it.
+        import pymongo
+        from pymongo.server_api import ServerApi
+
+        client = pymongo.MongoClient(self.uri, server_api=ServerApi('1'))
+        try:
+            client.admin.command('ping')
+        except Exception:
+            client.close()
+            raise
+        return client
+
+    async def _connect_loop(self) -> None:
+        delay = self.retry_initial
+        while self.collection is None:
+            self.state = "connecting"
+            self.attempts += 1
+            try:
+                client = await asyncio.to_thread(self._connect)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.state = "error"
+                self.last_error = str(e)
+                log.error("mongo_connect_failed", attempt=self.attempts, error=str(e), retry_in=delay)
+                await asyncio.sleep(delay)
+                delay = min(self.retry_max, delay * 2)
+                continue
+            self.client = client
+            self.collection = client[self.database_name][self.collection_name]
+            self.state = "connected"
+            self.last_error = None
+            log.info("mongo_connected", attempts=self.attempts)
+        if self._on_connected is not None:
+            try:
+                await self._on_connected()
+            except Exception as e:
+                log.error("mongo_on_connect_failed", error=str(e), exc=traceback.format_exc())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self.client is not None:
+            self.client.close()
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "attempts": self.attempts,
+            "last_error": self.last_error,
+        }
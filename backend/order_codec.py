@@ -0,0 +1,101 @@
+import json
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import OrderContext, OrderItemDetail
+from money import line_total, to_cents
+
+# Compact order encoding used on both sides of the prompt:
+#
+#   {"items":[[1,2,["no pickles"]],[17,1]],"is_finalized":false}
+#
+# Each line is [menu id, quantity] or [menu id, quantity, [modifications]].
+# Prices and totals are left out; the server derives them from the menu.
+
+# Quantity cap per line; anything above is a model mistake, not an order.
+MAX_QUANTITY = 99
+
+
+class OrderCodec:
+    """Short, stable item ids over a menu (1-based, in menu order, so new
+    items appended to the menu don't renumber existing ones)."""
+
+    def __init__(self, menu: Dict[str, Dict]):
+        self.menu = menu
+        self.id_by_name: Dict[str, int] = {name: i for i, name in enumerate(menu, start=1)}
+        self.name_by_id: Dict[int, str] = {i: name for name, i in self.id_by_name.items()}
+
+    def item_id(self, name: str) -> Optional[int]:
+        return self.id_by_name.get(name)
+
+    def to_compact(self, context: OrderContext) -> Dict[str, Any]:
+        lines: List[List[Any]] = []
+        for name, item in context.items.items():
+            item_id = self.id_by_name.get(name)
+            if item_id is None:
+                continue
+            line: List[Any] = [item_id, item.quantity]
+            if item.modifications:
+                line.append(list(item.modifications))
+            lines.append(line)
+        return {"items": lines}
+
+    def format_state(self, context: Optional[OrderContext]) -> str:
+        if not context or not context.items:
+            return "The user's order is currently empty."
+        return "Current Order State (compact JSON):\n" + json.dumps(self.to_compact(context), separators=(",", ":"))
+
+    def from_compact(self, data: Dict[str, Any]) -> Tuple[OrderContext, List[int]]:
+        """Expands the model's compact output into a full OrderContext.
+
+        Lines with an id that isn't on the menu are left out and their ids
+        returned for PriceBook to report as dropped. Raises
+        ValueError on malformed output - non-integer ids or quantities,
+        quantities over MAX_QUANTITY, non-boolean is_finalized - so the
+        caller can fall back to the previous state.
+        """
+        raw_items = data.get("items", [])
+        if not isinstance(raw_items, list):
+            raise ValueError("'items' must be a list of [id, quantity, modifications] lines")
+        is_finalized = data.get("is_finalized", False)
+        if not isinstance(is_finalized, bool):
+            raise ValueError(f"'is_finalized' must be true or false, got {is_finalized!r}")
+        items: Dict[str, OrderItemDetail] = {}
+        unknown: List[int] = []
+        for line in raw_items:
+            if isinstance(line, dict):
+                line = [line.get("id"), line.get("qty", line.get("quantity")), line.get("mods", [])]
+            if not isinstance(line, list) or len(line) < 2:
+                raise ValueError(f"Malformed order line: {line!r}")
+            item_id, quantity = line[0], line[1]
+            modifications = line[2] if len(line) > 2 and line[2] else []
+            if isinstance(modifications, str):
+                modifications = [modifications]
+            if not isinstance(modifications, list) or not all(isinstance(m, str) for m in modifications):
+                raise ValueError(f"Modifications must be a list of strings in line: {line!r}")
+            # type() rather than isinstance(): bool is an int, and 1.7 is not an id.
+            if type(item_id) is not int or type(quantity) is not int:
+                raise ValueError(f"Id and quantity must be integers in line: {line!r}")
+            if quantity > MAX_QUANTITY:
+                raise ValueError(f"Quantity over {MAX_QUANTITY} in line: {line!r}")
+            name = self.name_by_id.get(item_id)
+            if name is None:
+                unknown.append(item_id)
+                continue
+            if quantity <= 0:
+                continue
+            if name in items:
+                existing = items[name]
+                quantity += existing.quantity
+                modifications = existing.modifications + [m for m in modifications if m not in existing.modifications]
+                if quantity > MAX_QUANTITY:
+                    raise ValueError(f"Quantity of {name!r} over {MAX_QUANTITY}")
+            base_price = to_cents(self.menu[name]["price"])
+            items[name] = OrderItemDetail(
+                quantity=quantity,
+                base_price=float(base_price),
+                total_price=float(line_total(base_price, quantity)),
+                modifications=list(modifications),
+            )
+        subtotal = float(sum((to_cents(item.total_price) for item in items.values()), Decimal("0.00")))
+        return OrderContext(items=items, subtotal=subtotal, is_finalized=is_finalized), unknown
@@ -0,0 +1,406 @@
+import difflib
+import re
+from dataclasses import dataclass
+from decimal import Decimal
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from models import OrderContext, OrderItemDetail
+from money import line_total, to_cents
+
+# Deterministic parser for the simple turns (adds, removals, quantity changes,
+# "that's all") that make up most chat traffic. Anything it is not sure about
+# returns None so the caller can fall through to Gemini.
+
+SIZES = ("small", "medium", "large")
+SIZED_NAME_RE = re.compile(rf"^({'|'.join(SIZES)}) (.+)$")
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "another": 1, "two": 2, "three": 3, "four": 4,
+    "five": 5, "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+# Applied to normalized text before lookup, so aliases only need to be
+# generated for the canonical spelling.
+WORD_REWRITES = [
+    (r"\bfillet\b", "filet"),
+    (r"\bfilet of fish\b", "filet o fish"),
+    (r"\bfish filet\b", "filet o fish"),
+    (r"\bcoca cola\b", "coke"),
+    (r"\bcola\b", "coke"),
+    (r"\bmc (chicken|double|flurry|nuggets?)\b", r"mc\1"),
+    (r"\bmcnugget\b", "mcnuggets"),
+    (r"\bnugget\b", "nuggets"),
+    (r"\b(\d+) ?(pc|pcs|pieces)\b", r"\1 piece"),
+    (r"\bfry\b", "fries"),
+    (r"\bhic\b", "hi c"),
+]
+COMPILED_REWRITES = [(re.compile(pattern), repl) for pattern, repl in WORD_REWRITES]
+
+# Extra spellings that can't be derived mechanically from the menu keys.
+EXTRA_ALIASES = {
+    "qpc": "quarter pounder with cheese",
+    "quarter pounder": "quarter pounder with cheese",
+    "double quarter pounder": "double quarter pounder with cheese",
+    "oreo mcflurry": "mcflurry with oreo cookies",
+    "mcflurry oreo": "mcflurry with oreo cookies",
+    "m ms mcflurry": "mcflurry with m ms",
+    "mcflurry m ms": "mcflurry with m ms",
+    "apple pie": "baked apple pie",
+    "cookie": "chocolate chip cookie",
+    "water": "bottled water",
+    "fish sandwich": "filet o fish",
+    "barbeque sauce": "tangy barbeque sauce",
+    "bbq sauce": "tangy barbeque sauce",
+    "bbq": "tangy barbeque sauce",
+    "ranch": "creamy ranch sauce",
+    "buffalo ranch": "spicy buffalo ranch sauce",
+    "tartar sauce": "tartar sauce packet",
+    "mayo": "mayonnaise packet",
+}
+
+ADD_PREFIXES = (
+    "can i please get", "can i please have", "can i get", "can i have", "could i get",
+    "could i have", "may i have", "can you add", "could you add", "please add",
+    "i would like", "i want", "id like", "ill have", "ill take", "ill get", "i need",
+    "give me", "get me", "let me get", "let me have", "lemme get", "gimme",
+    "add", "and", "also", "plus", "then",
+)
+REMOVE_PREFIXES = (
+    "please remove", "can you remove", "could you remove", "remove", "take off",
+    "delete", "cancel", "drop", "get rid of", "no more", "scratch",
+)
+ADD_SUFFIXES = (
+    "to my order", "to the order", "as well", "too", "please", "thanks", "thank you",
+)
+REMOVE_SUFFIXES = (
+    "from my order", "from the order", "off my order", "off the order", "off",
+    "please", "thanks", "thank you",
+)
+
+FINALIZE_PHRASES = {
+    "thats all", "thats it", "that is all", "that is it", "thats everything",
+    "that will be all", "thatll be all", "thatll be it", "thatll do", "nothing else",
+    "no thanks", "no thank you", "no thats all", "no thats it", "nope thats all",
+    "nope thats it", "no nothing else", "nope nothing else", "im done", "i am done",
+    "all done", "done", "finish my order", "complete my order", "place my order",
+    "place the order",
+}
+
+QUANTITY_CHANGE_PATTERNS = [
+    re.compile(r"^(?:actually )?make (?:that|it|them) (?P<qty>\w+) (?P<item>.+)$"),
+    re.compile(r"^(?:actually )?i only want (?P<qty>\w+) (?P<item>.+)$"),
+    re.compile(r"^change (?:the |my )?(?P<item>.+?) to (?P<qty>\w+)$"),
+]
+
+CLAUSE_SPLIT_RE = re.compile(r"[,;]|\s&\s")
+SEGMENT_SPLIT_RE = re.compile(r"\s*\b(?:and|plus)\b\s*")
+TAKE_OFF_RE = re.compile(r"^take (.+) off\b")
+
+
+def normalize(text: str) -> str:
+    text = text.lower().replace("’", "'").replace("'", "")
+    text = re.sub(r"[^a-z0-9]+", " ", text).strip()
+    for pattern, repl in COMPILED_REWRITES:
+        text = pattern.sub(repl, text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def _pluralize(phrase: str) -> List[str]:
+    if phrase.endswith("s"):
+        return []
+    if phrase.endswith("y") and not phrase.endswith("ey"):
+        return [phrase + "s", phrase[:-1] + "ies"]
+    return [phrase + "s", phrase + "es"]
+
+
+def _join(parts: List[str]) -> str:
+    if len(parts) <= 1:
+        return "".join(parts)
+    if len(parts) == 2:
+        return f"{parts[0]} and {parts[1]}"
+    return ", ".join(parts[:-1]) + f", and {parts[-1]}"
+
+
+def _plural_name(name: str) -> str:
+    # "quarter pounder with cheese" -> "quarter pounders with cheese"; names
+    # that already read as plural ("large fries", "m&ms") stay as they are.
+    head, with_, rest = name.partition(" with ")
+    if head.endswith(("s", "fish")):
+        return name
+    forms = _pluralize(head)
+    if head.endswith(("x", "z", "ch", "sh")) or (head.endswith("y") and not head.endswith("ey")):
+        plural = forms[1]
+    else:
+        plural = forms[0]
+    return plural + with_ + rest
+
+
+def _item_label(name: str, quantity: int) -> str:
+    return f"{quantity} {(name if quantity == 1 else _plural_name(name)).title()}"
+
+
+class MenuIndex:
+    """Precompiled alias/fuzzy lookup over a menu dict."""
+
+    def __init__(self, menu: Dict[str, Dict]):
+        self.menu = menu
+        self.aliases: Dict[str, str] = {}
+        # "coke" -> ["small coke", "medium coke", "large coke"]
+        self.sized_bases: Dict[str, List[str]] = {}
+
+        norm_to_name = {normalize(name): name for name in menu}
+        for norm, name in norm_to_name.items():
+            self._add_alias(norm, name)
+            size_match = SIZED_NAME_RE.match(norm)
+            if size_match:
+                base = size_match.group(2)
+                self.sized_bases.setdefault(base, []).append(name)
+                for plural in _pluralize(base):
+                    self.sized_bases.setdefault(plural, []).append(name)
+            nugget_match = re.match(r"^(\d+) piece chicken mcnuggets$", norm)
+            if nugget_match:
+                count = nugget_match.group(1)
+                for alias in ("piece mcnuggets", "piece nuggets", "mcnuggets", "nuggets",
+                              "piece chicken nuggets", "chicken mcnuggets", "chicken nuggets"):
+                    self._add_alias(f"{count} {alias}", name)
+            for suffix in (" sauce", " packet"):
+                if norm.endswith(suffix):
+                    stem = norm[: -len(suffix)]
+                    for alias in (stem, f"{stem} packet", f"{stem} sauce", f"{stem} sauce packet"):
+                        self._add_alias(alias, name)
+
+        for alias, target in EXTRA_ALIASES.items():
+            target_name = norm_to_name.get(normalize(target))
+            if target_name:
+                self._add_alias(alias, target_name)
+
+        # Fuzzy candidates bucketed by the numbers they contain.
+        self.fuzzy_buckets: Dict[Tuple[str, ...], List[str]] = {}
+        for key in self.aliases:
+            self.fuzzy_buckets.setdefault(tuple(re.findall(r"\d+", key)), []).append(key)
+        self.resolve = lru_cache(maxsize=2048)(self._resolve)
+
+    def _add_alias(self, alias: str, name: str) -> None:
+        for key in [alias] + _pluralize(alias):
+            self.aliases.setdefault(key, name)
+
+    def _resolve(self, phrase: str) -> Optional[str]:
+        phrase = phrase.strip()
+        if not phrase:
+            return None
+        if phrase in self.aliases:
+            return self.aliases[phrase]
+        if phrase in self.sized_bases:
+            return None
+        # Only fuzzy-match against aliases with the same numbers in them,
+        # otherwise "5 piece nuggets" would happily become the 4 piece.
+        candidates = self.fuzzy_buckets.get(tuple(re.findall(r"\d+", phrase)), [])
+        matches = difflib.get_close_matches(phrase, candidates, n=2, cutoff=0.85)
+        if not matches:
+            return None
+        names = {self.aliases[m] for m in matches}
+        return self.aliases[matches[0]] if len(names) == 1 else None
+
+    def sized_variants(self, phrase: str) -> List[str]:
+        return self.sized_bases.get(phrase.strip(), [])
+
+
+def build_menu_index(menu: Dict[str, Dict]) -> MenuIndex:
+    return MenuIndex(menu)
+
+
+@dataclass
+class FastPathResult:
+    reply: str
+    context: OrderContext
+
+
+def _parse_quantity(token: str) -> Optional[int]:
+    if token.isdigit():
+        quantity = int(token)
+        return quantity if 0 < quantity <= 100 else None
+    return NUMBER_WORDS.get(token)
+
+
+def _strip_affixes(text: str, prefixes: Tuple[str, ...], suffixes: Tuple[str, ...]) -> Tuple[str, bool]:
+    matched_prefix = False
+    changed = True
+    while changed:
+        changed = False
+        for prefix in prefixes:
+            if text == prefix or text.startswith(prefix + " "):
+                text = text[len(prefix):].strip()
+                matched_prefix = changed = True
+                break
+    changed = True
+    while changed:
+        changed = False
+        for suffix in suffixes:
+            if text.endswith(" " + suffix):
+                text = text[: -len(suffix)].strip()
+                changed = True
+                break
+    return text, matched_prefix
+
+
+def _split_quantity(phrase: str, index: MenuIndex) -> Optional[Tuple[int, str]]:
+    # Try the whole phrase first so "10 piece nuggets" isn't read as 10 x "piece nuggets".
+    if index.resolve(phrase):
+        return 1, phrase
+    head, _, rest = phrase.partition(" ")
+    quantity = _parse_quantity(head)
+    if quantity is None or not rest:
+        return None
+    if rest.startswith("more "):
+        rest = rest[len("more "):]
+    return quantity, rest
+
+
+def _resolve_in_order(phrase: str, context: OrderContext, index: MenuIndex) -> Optional[str]:
+    for article in ("the ", "my ", "that ", "those "):
+        if phrase.startswith(article):
+            phrase = phrase[len(article):]
+            break
+    name = index.resolve(phrase)
+    if name is not None:
+        return name if name in context.items else None
+    in_order = [name for name in index.sized_variants(phrase) if name in context.items]
+    return in_order[0] if len(in_order) == 1 else None
+
+
+def _set_line(context: OrderContext, name: str, quantity: int, menu: Dict[str, Dict]) -> None:
+    if quantity <= 0:
+        context.items.pop(name, None)
+        return
+    existing = context.items.get(name)
+    base_price = to_cents(menu[name]["price"])
+    context.items[name] = OrderItemDetail(
+        quantity=quantity,
+        base_price=float(base_price),
+        total_price=float(line_total(base_price, quantity)),
+        modifications=list(existing.modifications) if existing else [],
+    )
+
+
+def _finalize_reply(context: OrderContext) -> str:
+    lines = []
+    for name, item in context.items.items():
+        label = _item_label(name, item.quantity)
+        if item.modifications:
+            label += f" ({', '.join(item.modifications)})"
+        lines.append(label)
+    return (
+        f"Okay, so you have {_join(lines)}. "
+        f"Your total comes to ${context.subtotal:.2f}. Thanks for ordering with McBot!"
+    )
+
+
+def try_fast_path(message: str, context: OrderContext, index: MenuIndex) -> Optional[FastPathResult]:
+    text = normalize(message)
+    if not text:
+        return None
+
+    updated = context.model_copy(deep=True)
+    updated.is_finalized = False
+    added: List[str] = []
+    removed: List[str] = []
+    changed: List[str] = []
+    finalize = False
+
+    quantity_match = None
+    for pattern in QUANTITY_CHANGE_PATTERNS:
+        quantity_match = pattern.match(text)
+        if quantity_match:
+            break
+
+    if quantity_match:
+        quantity = _parse_quantity(quantity_match.group("qty"))
+        name = _resolve_in_order(quantity_match.group("item"), updated, index)
+        if quantity is None or name is None:
+            return None
+        _set_line(updated, name, quantity, index.menu)
+        changed.append(_item_label(name, quantity))
+    else:
+        segments = [
+            segment.strip()
+            for clause in CLAUSE_SPLIT_RE.split(message)
+            for segment in SEGMENT_SPLIT_RE.split(normalize(clause))
+            if segment.strip()
+        ]
+        if not segments:
+            return None
+        mode = "add"
+        for position, segment in enumerate(segments):
+            bare, _ = _strip_affixes(segment, (), ("thanks", "thank you", "please"))
+            if bare in FINALIZE_PHRASES:
+                # Only accepted as the final clause ("2 big macs and that's all").
+                if position != len(segments) - 1:
+                    return None
+                finalize = True
+                continue
+
+            segment = TAKE_OFF_RE.sub(r"take off \1", segment)
+            phrase, is_removal = _strip_affixes(segment, REMOVE_PREFIXES, REMOVE_SUFFIXES)
+            if is_removal:
+                mode = "remove"
+            elif mode == "remove" and not segment.startswith(ADD_PREFIXES):
+                phrase, _ = _strip_affixes(segment, (), REMOVE_SUFFIXES)
+            else:
+                mode = "add"
+                phrase, _ = _strip_affixes(segment, ADD_PREFIXES, ADD_SUFFIXES)
+
+            if mode == "remove":
+                quantity = None
+                head, _, rest = phrase.partition(" ")
+                if rest and _parse_quantity(head) is not None and index.resolve(phrase) is None:
+                    quantity, phrase = _parse_quantity(head), rest
+                name = _resolve_in_order(phrase, updated, index)
+                if name is None:
+                    return None
+                current = updated.items[name].quantity
+                # "remove 5 big macs" with 2 on the order removes the 2.
+                if quantity is not None:
+                    quantity = min(quantity, current)
+                remaining = 0 if quantity is None else current - quantity
+                _set_line(updated, name, remaining, index.menu)
+                removed.append(
+                    f"the {name.title()}" if quantity is None else _item_label(name, quantity)
+                )
+                continue
+
+            split = _split_quantity(phrase, index)
+            if split is None:
+                return None
+            quantity, item_phrase = split
+            name = index.resolve(item_phrase)
+            if name is None:
+                # Covers unsized drinks/fries ("a coke") as well as anything unknown:
+                # the model is better at asking the follow-up question.
+                return None
+            current = updated.items[name].quantity if name in updated.items else 0
+            _set_line(updated, name, current + quantity, index.menu)
+            added.append(_item_label(name, quantity))
+
+    updated.subtotal = float(sum((to_cents(item.total_price) for item in updated.items.values()), Decimal("0.00")))
+
+    if finalize:
+        if not updated.items:
+            return None
+        updated.is_finalized = True
+        return FastPathResult(reply=_finalize_reply(updated), context=updated)
+
+    parts = []
+    if added:
+        parts.append(f"I've added {_join(added)}.")
+    if removed:
+        parts.append(f"I've removed {_join(removed)}.")
+    if changed:
+        parts.append(f"I've updated that to {_join(changed)}.")
+    if not parts:
+        return None
+    if updated.items:
+        parts.append(f"Your subtotal is ${updated.subtotal:.2f}. Anything else?")
+    else:
+        parts.append("Your order is now empty. What would you like?")
+    return FastPathResult(reply=" ".join(parts), context=updated)
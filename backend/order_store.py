@@ -0,0 +1,309 @@
+import asyncio
+import contextlib
+import datetime
+import fcntl
+import glob
+import json
+import os
+import traceback
+from typing import Any, Callable, Dict, List, Optional
+
+from telemetry import log, record_error, span
+
+DUPLICATE_KEY = 11000
+
+# bson and pymongo aren't imported at module level: pymongo takes well over
+# 100 ms to import, which would land on startup (see MongoConnection._connect)
+# or, imported lazily, on the event loop at the first finalized order. The
+# writer task loads them in a worker thread instead (_load_driver).
+ObjectId: Any = None
+BulkWriteError: Any = None
+
+
+def _load_driver() -> None:
+    global ObjectId, BulkWriteError
+    from bson import ObjectId
+    from pymongo.errors import BulkWriteError
+
+
+def _encode(order: Dict[str, Any]) -> str:
+    doc = dict(order)
+    doc["_id"] = str(doc["_id"])
+    if isinstance(doc.get("orderTimestamp"), datetime.datetime):
+        doc["orderTimestamp"] = doc["orderTimestamp"].isoformat()
+    return json.dumps(doc)
+
+
+def _decode(line: str) -> Dict[str, Any]:
+    doc = json.loads(line)
+    doc["_id"] = ObjectId(doc["_id"])
+    if isinstance(doc.get("orderTimestamp"), str):
+        doc["orderTimestamp"] = datetime.datetime.fromisoformat(doc["orderTimestamp"])
+    return doc
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class OrderWriter:
+    """Write-behind queue for finalized orders.
+
+    submit() never blocks the event loop: orders go into a bounded queue and a
+    background task writes them with insert_many (in a worker thread, since
+    pymongo is synchronous) once ``batch_size`` orders are waiting or
+    ``flush_interval`` seconds have passed. Orders that can't be written -
+    Mongo down, queue full - are appended to a local JSONL spill file and
+    replayed on the next successful flush. Every order gets its _id up front,
+    so a replay of an order that did make it is just a duplicate-key no-op.
+    """
+
+    def __init__(
+        self,
+        get_collection: Callable[[], Any],
+        max_pending: int = 1000,
+        batch_size: int = 50,
+        flush_interval: float = 1.0,
+        spill_path: str = "unsaved_orders.jsonl",
+    ):
+        self.get_collection = get_collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._closing = False
+        self._spill_lock = asyncio.Lock()
+        self._claims = 0
+
+        self.submitted = 0
+        self.written = 0
+        self.batches = 0
+        self.spilled = 0
+        self.replayed = 0
+        self.write_errors = 0
+        self.corrupt_lines = 0
+
+    @classmethod
+    def from_env(cls, get_collection: Callable[[], Any]) -> "OrderWriter":
+        return cls(
+            get_collection,
+            max_pending=int(os.getenv("ORDER_QUEUE_MAX_PENDING", "1000")),
+            batch_size=int(os.getenv("ORDER_QUEUE_BATCH_SIZE", "50")),
+            flush_interval=float(os.getenv("ORDER_QUEUE_FLUSH_SECONDS", "1.0")),
+            spill_path=os.getenv("ORDER_SPILL_PATH", "unsaved_orders.jsonl"),
+        )
+
+    def submit(self, order_data: Dict[str, Any]) -> Any:
+        if ObjectId is None:
+            # Only before the writer task has loaded it; see _load_driver.
+            _load_driver()
+        order = dict(order_data)
+        order.setdefault("_id", ObjectId())
+        self.submitted += 1
+        try:
+            self.queue.put_nowait(order)
+        except asyncio.QueueFull:
+            log.warning("order_queue_full", spill_path=self.spill_path)
+            self._append_spill([order])
+        return order["_id"]
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        # Drain whatever is queued, then stop the background task.
+        if self._task is None:
+            return
+        self._closing = True
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        remaining, self._batch = self._batch, []
+        while not self.queue.empty():
+            remaining.append(self.queue.get_nowait())
+        for i in range(0, len(remaining), self.batch_size):
+            await self._flush(remaining[i:i + self.batch_size])
+        log.info("order_writer_stopped", written=self.written, spilled=self.spilled)
+
+    async def warm_up(self) -> None:
+        if BulkWriteError is None:
+            await asyncio.to_thread(_load_driver)
+
+    async def _run(self) -> None:
+        await self.warm_up()
+        await self.replay_spill()
+        # stop() also cancels us, but on Python 3.11 wait_for() can swallow a
+        # cancel that races with a completed get(), so check the flag too.
+        while not self._closing:
+            # Kept on self so stop() can still flush a batch we were cancelled
+            # in the middle of (a re-insert of the same _id is harmless).
+            self._batch = [await self.queue.get()]
+            deadline = asyncio.get_running_loop().time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - asyncio.get_running_loop().time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            await self._flush(self._batch)
+            self._batch = []
+
+    async def _flush(self, batch: List[Dict[str, Any]]) -> None:
+        if not batch:
+            return
+        failed = await self._insert(batch)
+        if failed:
+            self._append_spill(failed)
+        elif os.path.exists(self.spill_path):
+            await self.replay_spill()
+
+    async def _insert(self, batch: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # Returns the orders that were not written.
+        await self.warm_up()
+        collection = self.get_collection()
+        if collection is None:
+            return batch
+        try:
+            with span("mongo_write"):
+                await asyncio.to_thread(collection.insert_many, batch, ordered=False)
+        except BulkWriteError as e:
+            failed_indexes = {
+                err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY
+            }
+            self.write_errors += len(failed_indexes)
+            self.written += len(batch) - len(failed_indexes)
+            self.batches += 1
+            return [order for i, order in enumerate(batch) if i in failed_indexes]
+        except Exception as e:
+            record_error("mongo_write")
+            log.error("mongo_write_failed", orders=len(batch), error=str(e))
+            self.write_errors += len(batch)
+            return batch
+        self.written += len(batch)
+        self.batches += 1
+        log.debug("mongo_write", orders=len(batch))
+        return []
+
+    @contextlib.contextmanager
+    def _spill_file_lock(self):
+        # Appends and the claim rename exclude each other across workers.
+        # Otherwise a worker could append to a spill file another worker has
+        # already renamed and read, and those orders would be deleted with it.
+        # The lock is a separate file since the spill file itself gets renamed.
+        with open(self.spill_path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _append_spill(self, orders: List[Dict[str, Any]]) -> None:
+        try:
+            with self._spill_file_lock(), open(self.spill_path, "a") as f:
+                for order in orders:
+                    f.write(_encode(order) + "\n")
+            self.spilled += len(orders)
+        except Exception as e:
+            record_error("order_spill")
+            log.error("order_spill_failed", orders=len(orders), spill_path=self.spill_path, error=str(e), exc=traceback.format_exc())
+
+    def _claim_spill_files(self) -> List[str]:
+        # Every worker on a host shares the spill file. A worker claims it by
+        # renaming it to a name with its pid, which only one rename can win;
+        # anything appended afterwards starts a fresh spill file. Each claim
+        # gets its own number, so a claimed file that couldn't be replayed yet
+        # doesn't stop newer spills from being claimed. Claimed files left by
+        # workers that died mid-replay are picked up too.
+        pid = os.getpid()
+        self._claims += 1
+        with self._spill_file_lock():
+            try:
+                os.rename(self.spill_path, f"{self.spill_path}.replaying.{pid}-{self._claims}")
+            except FileNotFoundError:
+                pass
+        paths = []
+        for path in glob.glob(glob.escape(self.spill_path) + ".replaying*"):
+            owner = path.rsplit(".", 1)[-1].split("-", 1)[0]
+            if not owner.isdigit() or int(owner) == pid or not _pid_alive(int(owner)):
+                paths.append(path)
+        return sorted(paths)
+
+    def _read_spill_file(self, path: str) -> List[Dict[str, Any]]:
+        # A torn write (a worker killed mid-append) or a hand-edited file can
+        # leave lines that don't decode. They go to <spill_path>.corrupt for
+        # someone to look at, and the rest of the file is still replayed.
+        orders, corrupt = [], []
+        with open(path) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    orders.append(_decode(line))
+                except Exception:
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            self.corrupt_lines += len(corrupt)
+            record_error("order_spill_corrupt")
+            log.error("order_spill_corrupt", lines=len(corrupt), path=path, corrupt_path=self.spill_path + ".corrupt")
+            with open(self.spill_path + ".corrupt", "a") as f:
+                f.writelines(corrupt)
+        return orders
+
+    async def replay_spill(self) -> None:
+        # Also the writer task's first step and the on-connect hook, so it
+        # never raises: files it couldn't finish stay claimed for next time.
+        async with self._spill_lock:
+            try:
+                await self._replay_spill()
+            except Exception as e:
+                record_error("order_spill_replay")
+                log.error("order_spill_replay_failed", spill_path=self.spill_path, error=str(e), exc=traceback.format_exc())
+
+    async def _replay_spill(self) -> None:
+        if self.get_collection() is None:
+            return
+        await self.warm_up()
+        paths = self._claim_spill_files()
+        if not paths:
+            return
+        orders = []
+        for path in paths:
+            orders.extend(self._read_spill_file(path))
+        log.info("order_spill_replay", orders=len(orders), files=len(paths))
+        failed = []
+        for i in range(0, len(orders), self.batch_size):
+            failed.extend(await self._insert(orders[i:i + self.batch_size]))
+        self.replayed += len(orders) - len(failed)
+        if failed:
+            self._append_spill(failed)
+        for path in paths:
+            os.remove(path)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.queue.qsize(),
+            "submitted": self.submitted,
+            "written": self.written,
+            "batches": self.batches,
+            "spilled": self.spilled,
+            "replayed": self.replayed,
+            "write_errors": self.write_errors,
+            "corrupt_lines": self.corrupt_lines,
+            "spill_file_present": os.path.exists(self.spill_path),
+        }
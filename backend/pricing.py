@@ -0,0 +1,86 @@
+from dataclasses import dataclass, field
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence
+
+from models import OrderContext, OrderItemDetail
+from money import line_total, to_cents
+from order_parser import MenuIndex, normalize
+
+
+@dataclass
+class PricingResult:
+    context: OrderContext
+    # Names the model (or client) used that we mapped onto a menu item.
+    repaired: Dict[str, str] = field(default_factory=dict)
+    # Names that don't match anything on the menu; these lines are dropped.
+    dropped: List[str] = field(default_factory=list)
+    # Compact ids that aren't on the menu; dropped too, but an id means
+    # nothing to the customer, so note() only counts them.
+    unknown_ids: List[int] = field(default_factory=list)
+
+    def note(self) -> str:
+        parts = []
+        if self.dropped:
+            names = [f'"{name}"' for name in self.dropped]
+            listed = names[0] if len(names) == 1 else ", ".join(names[:-1]) + " and " + names[-1]
+            parts.append(f"{listed} {'is' if len(names) == 1 else 'are'}n't on our menu")
+        if self.unknown_ids:
+            count = len(self.unknown_ids)
+            items = ("one" if count == 1 else str(count)) + (" other" if self.dropped else "") + (" item" if count == 1 else " items")
+            parts.append(f"I couldn't match {items} to our menu")
+        if not parts:
+            return ""
+        them = "it" if len(self.dropped) + len(self.unknown_ids) == 1 else "them"
+        return f" (Note: {' and '.join(parts)}, so I left {them} off your order.)"
+
+
+class PriceBook:
+    """Authoritative prices for an order, independent of what the model or
+    client claims. Prices are parsed to Decimal once per menu; pricing an
+    order is a dict lookup per line."""
+
+    def __init__(self, menu: Dict[str, Dict], index: MenuIndex):
+        self.index = index
+        self.prices: Dict[str, Decimal] = {name: to_cents(details["price"]) for name, details in menu.items()}
+        self._exact: Dict[str, str] = {}
+        for name in menu:
+            self._exact[name] = name
+            self._exact.setdefault(name.lower(), name)
+
+    def canonical_name(self, raw_name: str) -> Optional[str]:
+        name = self._exact.get(raw_name) or self._exact.get(raw_name.strip().lower())
+        if name is not None:
+            return name
+        return self.index.resolve(normalize(raw_name))
+
+    def price_order(self, context: OrderContext, unknown_ids: Sequence[int] = ()) -> PricingResult:
+        # unknown_ids: compact ids the codec couldn't map; they are reported
+        # alongside any unknown names found here.
+        result = PricingResult(context=OrderContext(is_finalized=context.is_finalized), unknown_ids=list(unknown_ids))
+        items: Dict[str, OrderItemDetail] = result.context.items
+        subtotal = Decimal("0.00")
+        for raw_name, item in context.items.items():
+            name = self.canonical_name(raw_name)
+            if name is None:
+                result.dropped.append(raw_name)
+                continue
+            if name != raw_name:
+                result.repaired[raw_name] = name
+            quantity = item.quantity
+            modifications = list(item.modifications)
+            if name in items:
+                # Two spellings of the same item: merge them into one line.
+                existing = items[name]
+                subtotal -= to_cents(existing.total_price)
+                quantity += existing.quantity
+                modifications = existing.modifications + [m for m in modifications if m not in existing.modifications]
+            total = line_total(self.prices[name], quantity)
+            items[name] = OrderItemDetail(
+                quantity=quantity,
+                base_price=float(self.prices[name]),
+                total_price=float(total),
+                modifications=modifications,
+            )
+            subtotal += total
+        result.context.subtotal = float(subtotal)
+        return result
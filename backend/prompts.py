@@ -0,0 +1,279 @@
+import asyncio
+import datetime
+import hashlib
+import json
+import os
+import time
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+from models import OrderContext
+from order_codec import OrderCodec
+from telemetry import log
+
+
+def format_menu_for_prompt(menu: Dict) -> str:
+    # Ids match OrderCodec: 1-based position in the menu.
+    menu_str = "Available Menu Items:\n"
+    for item_id, (name, details) in enumerate(menu.items(), start=1):
+        try:
+            price = float(details.get('price', 0.0))
+            menu_str += f"- [{item_id}] {name.title()}: ${price:.2f} ({details.get('description', '')})\n"
+        except (ValueError, TypeError):
+             menu_str += f"- [{item_id}] {name.title()}: (Price Error) ({details.get('description', '')})\n"
+    return menu_str
+
+SYSTEM_INSTRUCTIONS_TEMPLATE = """
+You are "McBot", a friendly and helpful AI assistant for taking McDonald's orders.
+Your goal is to assist users in building their order, handling requests naturally, and keeping track of the items, modifications, quantities, and subtotal accurately.
+
+**Your Instructions:**
+
+1.  **Be Conversational:** Respond politely and naturally. Understand greetings and respond appropriately. Always ask "Anything else?" after successfully adding or modifying an item, unless the order is being finalized (see rule 11).
+
+2.  **Use the Menu:** Only add items from the menu provided below. If a user asks for something not on the menu, politely inform them it's unavailable. Prices are listed in the menu. Every menu item has a numeric id in square brackets (e.g., `[15] Large Fries`); refer to items in the JSON only by that id.
+
+3.  **Track the Order:** The order state is a compact JSON object whose `items` list has one line per ordered item: `[id, quantity]`, or `[id, quantity, [modifications]]` when there are modifications. If a user orders an item already in the list, increase its quantity on the existing line instead of adding a new one. Do not include prices or totals in the JSON; the server calculates them from the menu.
+
+4.  **Handle Multiple Items & Details:** If the user mentions multiple items or details in a single message (e.g., "filet o fish and large fries", "2 mcchickens and a small coke"), add all recognized items with their specified details. **Crucially, capture associated details like size or quantity mentioned for each item (e.g., if the user says 'large fries', add 'large fries', not just 'fries'; if they say '2 ketchup packets', set quantity to 2).** If a size or essential detail is truly missing for an item that requires it (like fries or drinks), then ask for clarification *only for that specific item*, while still adding any other fully specified items from the message.
+    * Example 1 (Size Provided): User: 'a mcchicken and a large sprite' -> Bot adds 'mcchicken' (qty 1) and 'large sprite' (qty 1) to the JSON, then asks 'Anything else?'
+    * Example 2 (Size Missing): User: 'fillet o fish and fries' -> Bot adds 'filet-o-fish' (qty 1) to JSON. Recognizes 'fries' but size is missing. Bot asks 'I've added the Filet-o-Fish. What size fries would you like?' (The Filet-o-Fish remains in the JSON context).
+
+5.  **Handle Modifications:** Understand requests like "extra cheese", "no pickles", "add onions", "plain". Add these modifications as strings to the modifications list of that item's line. Assume simple modifications do not change the price.
+
+6.  **Calculate Subtotal:** When you mention a subtotal in your reply, compute it as the sum of quantity * menu price for every line in the order. Calculate prices carefully.
+
+7.  **Show Menu/Order/Subtotal:** If the user asks for the "menu", their "order", or "subtotal", provide that information clearly based on the current order state, using the item names from the menu (never the ids). Format the order details nicely in your reply.
+
+8.  **Handle Ambiguity:** If the user's request is unclear (e.g., "add a burger"), ask for clarification (e.g., "Which burger would you like? We have...").
+
+9.  **Handle Removal/Quantity Change:** Understand requests like "remove the big mac", "take off the fries", "make that 2 cokes instead of 1", "I only want one fries". Update the `items` list (remove the line or change its quantity).
+
+10. **Handle Off-Topic:** If the user asks something unrelated to ordering, gently redirect them back to the order. Example: "I can only help with McDonald's orders right now. Was there anything else you wanted to add?"
+
+11. **Finalize Order:** When the user clearly indicates they are finished ordering (e.g., says 'no', 'that's all', 'nope', 'that's it' in response to 'Anything else?'), **do not ask 'Anything else?' again.** Instead, follow these steps meticulously:
+    * **First, summarize the order:** In your text reply, list the quantity and name of each item currently in the `items` list (based on the final state you are about to put in the JSON). Format it naturally (e.g., "Okay, so you have 1 Filet-O-Fish, 1 Large Fries, and 2 Honey Mustard Sauce."). Include any modifications if present.
+    * **Then, state the final subtotal:** Clearly state the final total (quantity * menu price, summed over every line).
+    * **Finally, provide a polite closing message.** (e.g., "Thanks for ordering with McBot!")
+    * **CRITICAL JSON Step:** In the JSON block accompanying this final reply, set the field `"is_finalized": true`. **The `items` list in this final JSON MUST perfectly match all the items, quantities and modifications stated in your textual summary.**
+
+12. **Output Format:** {output_format}
+
+**Menu:**
+{menu_string}
+"""
+
+TEXT_OUTPUT_FORMAT = """Your response MUST contain two parts:
+    * The user-facing conversational reply based on the instructions above.
+    * A JSON block representing the COMPLETE updated order state, enclosed in ```json ... ```, in the same compact format as the current order state plus an `is_finalized` field, e.g. `{"items":[[1,2,["no pickles"]],[15,1]],"is_finalized":false}`. Double-check the ids, quantities and modifications before outputting. Set `is_finalized` to `true` ONLY when finalizing the order as per rule 11."""
+
+JSON_OUTPUT_FORMAT = """Respond with a single JSON object and nothing else:
+    * `reply`: the user-facing conversational reply based on the instructions above (plain text, no JSON in it).
+    * `order`: the COMPLETE updated order state with an `items` list and an `is_finalized` field. In this object write each order line as `{"id": id, "qty": quantity, "mods": [modifications]}` instead of the array form, e.g. `{"reply":"Sure! Anything else?","order":{"items":[{"id":1,"qty":2,"mods":["no pickles"]},{"id":15,"qty":1}],"is_finalized":false}}`. Double-check the ids, quantities and modifications before outputting. Set `is_finalized` to `true` ONLY when finalizing the order as per rule 11."""
+
+# Schema for JSON output mode. Gemini's schema subset has no tuple arrays, so
+# order lines are {id, qty, mods} objects here; OrderCodec accepts both forms.
+ORDER_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "reply": {"type": "string"},
+        "order": {
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "qty": {"type": "integer"},
+                            "mods": {"type": "array", "items": {"type": "string"}},
+                        },
+                        "required": ["id", "qty"],
+                    },
+                },
+                "is_finalized": {"type": "boolean"},
+            },
+            "required": ["items", "is_finalized"],
+        },
+    },
+    "required": ["reply", "order"],
+}
+
+TURN_PROMPT_TEMPLATE = """
+**Current Order State:**
+{context_string}
+
+**User Message:**
+{user_message}
+
+**Your Response (Reply + JSON):** Ensure the JSON is valid and accurately reflects the order state described in the reply.  
+"""
+
+# Rough chars-per-token ratio for English prompt text; only used for reporting.
+CHARS_PER_TOKEN = 4
+
+# Explicit Gemini context caching has a minimum cacheable size (32k tokens on
+# 1.5 Flash) that our prefix is well under, so it is opt-in. Without it the
+# prefix still goes through system_instruction and is rendered once.
+# Ask Gemini for {"reply", "order"} JSON against ORDER_RESPONSE_SCHEMA instead
+# of a reply with a fenced JSON block in it.
+USE_JSON_OUTPUT = os.getenv("GEMINI_JSON_OUTPUT", "").lower() in ("1", "true", "yes")
+
+USE_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "").lower() in ("1", "true", "yes")
+CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# The cache entry is recreated this long before Gemini expires it.
+CONTEXT_CACHE_RENEW_MARGIN = min(300, CONTEXT_CACHE_TTL // 10)
+
+
+def menu_fingerprint(menu: Mapping) -> str:
+    # default=dict covers the read-only mappings menu_store hands out.
+    return hashlib.sha256(json.dumps(menu, sort_keys=True, default=dict).encode("utf-8")).hexdigest()
+
+
+class PromptCache:
+    """Holds the static prompt prefix (instructions + rendered menu) and the
+    model bound to it, so the prefix is rendered once per menu and per-turn
+    prompts only carry order state and the user message. Call refresh()
+    whenever the menu changes.
+
+    The prefix is still sent (and billed) with every call as
+    system_instruction, unless GEMINI_CONTEXT_CACHE is on and Gemini
+    accepted the cache entry; only then are tokens counted as saved.
+
+    model_factory, if set, replaces the Gemini SDK: it is called with this
+    PromptCache and returns anything with generate_content_async().
+    """
+
+    def __init__(self, model_name: str, json_output: bool = USE_JSON_OUTPUT,
+                 model_factory: Optional[Callable[["PromptCache"], Any]] = None):
+        self.model_name = model_name
+        self.json_output = json_output
+        self.model_factory = model_factory
+        self.fingerprint: Optional[str] = None
+        self.system_instruction = ""
+        self.prefix_bytes = 0
+        self.prefix_tokens = 0
+        self.cached_content_name: Optional[str] = None
+        self.codec: Optional[OrderCodec] = None
+        self._model = None
+        self._model_expires_at = float("inf")
+        self._model_lock = asyncio.Lock()
+        self.requests = 0
+        self.render_bytes_avoided = 0
+        self.cached_requests = 0
+        self.tokens_saved = 0
+        self.rebuilds = 0
+
+    def _reset_model(self) -> None:
+        # The next get_model() builds a fresh model (and context cache).
+        self.cached_content_name = None
+        self._model = None
+        self._model_expires_at = float("inf")
+
+    def set_model_factory(self, model_factory: Optional[Callable[["PromptCache"], Any]]) -> None:
+        """Swaps what get_model() builds, e.g. for a stand-in model."""
+        self.model_factory = model_factory
+        self._reset_model()
+
+    def refresh(self, menu: Dict) -> bool:
+        fingerprint = menu_fingerprint(menu)
+        if fingerprint == self.fingerprint:
+            return False
+        self.system_instruction = SYSTEM_INSTRUCTIONS_TEMPLATE.format(
+            menu_string=format_menu_for_prompt(menu),
+            output_format=JSON_OUTPUT_FORMAT if self.json_output else TEXT_OUTPUT_FORMAT,
+        )
+        self.prefix_bytes = len(self.system_instruction.encode("utf-8"))
+        self.prefix_tokens = len(self.system_instruction) // CHARS_PER_TOKEN
+        self.codec = OrderCodec(menu)
+        self.fingerprint = fingerprint
+        self._reset_model()
+        self.rebuilds += 1
+        log.info("prompt_prefix_built", bytes=self.prefix_bytes, tokens_estimate=self.prefix_tokens)
+        return True
+
+    async def get_model(self):
+        if self._model is not None and time.monotonic() < self._model_expires_at:
+            return self._model
+        async with self._model_lock:
+            if self._model is None or time.monotonic() >= self._model_expires_at:
+                fingerprint = self.fingerprint
+                # Creating a context cache entry is a blocking network call.
+                if USE_CONTEXT_CACHE and self.model_factory is None:
+                    model, expires_at, cache_name = await asyncio.to_thread(self._build_model)
+                else:
+                    model, expires_at, cache_name = self._build_model()
+                if fingerprint != self.fingerprint:
+                    # The menu changed while we were building; this model
+                    # matches the prompt the caller already has, but don't keep it.
+                    return model
+                self._model, self._model_expires_at = model, expires_at
+                self.cached_content_name = cache_name
+            return self._model
+
+    def _build_model(self) -> Tuple[Any, float, Optional[str]]:
+        # Returns the model, when it has to be rebuilt and the context cache
+        # entry it reads from. May run in a worker thread: no state changes.
+        never = float("inf")
+        if self.model_factory is not None:
+            return self.model_factory(self), never, None
+        # google.generativeai is slow to import; keep it off the startup path.
+        import google.generativeai as genai
+
+        generation_config = None
+        if self.json_output:
+            generation_config = genai.GenerationConfig(
+                response_mime_type="application/json",
+                response_schema=ORDER_RESPONSE_SCHEMA,
+            )
+        if USE_CONTEXT_CACHE:
+            try:
+                from google.generativeai import caching
+
+                cached = caching.CachedContent.create(
+                    model=self.model_name,
+                    system_instruction=self.system_instruction,
+                    ttl=datetime.timedelta(seconds=CONTEXT_CACHE_TTL),
+                )
+                log.info("gemini_context_cache_created", name=cached.name, ttl=CONTEXT_CACHE_TTL)
+                model = genai.GenerativeModel.from_cached_content(cached_content=cached, generation_config=generation_config)
+                return model, time.monotonic() + CONTEXT_CACHE_TTL - CONTEXT_CACHE_RENEW_MARGIN, cached.name
+            except Exception as e:
+                log.warning("gemini_context_cache_failed", error=str(e))
+        model = genai.GenerativeModel(
+            self.model_name,
+            system_instruction=self.system_instruction,
+            generation_config=generation_config,
+        )
+        return model, never, None
+
+    def build_turn_prompt(self, order_context: Optional[OrderContext], user_message: str) -> str:
+        prompt = TURN_PROMPT_TEMPLATE.format(
+            context_string=self.codec.format_state(order_context),
+            user_message=user_message,
+        )
+        self.requests += 1
+        # Rendering the instructions and menu is skipped every turn; tokens
+        # are only saved when the prefix lives in a Gemini context cache.
+        self.render_bytes_avoided += self.prefix_bytes
+        if self.cached_content_name is not None:
+            self.cached_requests += 1
+            self.tokens_saved += self.prefix_tokens
+        return prompt
+
+    def stats(self) -> Dict:
+        return {
+            "model": self.model_name,
+            "output_mode": "json" if self.json_output else "text",
+            "menu_fingerprint": self.fingerprint,
+            "context_cache": self.cached_content_name,
+            "prefix_bytes": self.prefix_bytes,
+            "prefix_tokens_estimate": self.prefix_tokens,
+            "rebuilds": self.rebuilds,
+            "requests": self.requests,
+            "render_bytes_avoided_per_request": self.prefix_bytes,
+            "render_bytes_avoided_total": self.render_bytes_avoided,
+            "cached_requests": self.cached_requests,
+            "tokens_saved_per_request": self.prefix_tokens if self.cached_content_name else 0,
+            "tokens_saved_total": self.tokens_saved,
+        }
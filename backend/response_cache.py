@@ -0,0 +1,113 @@
+import collections
+import hashlib
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+from models import OrderContext
+from order_parser import normalize
+
+
+class ResponseCache:
+    """LRU + TTL cache of Gemini replies to turns that didn't change the order
+    (menu questions, prices, "what's in a big mac").
+
+    Keys cover the normalized message, the order state and the menu
+    fingerprint, so a reply is only reused for the same question about the
+    same order against the same menu. invalidate() drops everything and must
+    be called whenever the menu changes.
+    """
+
+    def __init__(self, max_entries: int = 2048, max_bytes: int = 4 * 1024 * 1024, ttl_seconds: float = 900.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.menu_fingerprint = ""
+        # key -> (reply, expires_at, size in bytes, seconds the model took)
+        self._data: "collections.OrderedDict[str, Tuple[str, float, int, float]]" = collections.OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.invalidations = 0
+        self.latency_saved = 0.0
+
+    @classmethod
+    def from_env(cls) -> "ResponseCache":
+        return cls(
+            max_entries=int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2048")),
+            max_bytes=int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(4 * 1024 * 1024))),
+            ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "900")),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_bytes > 0
+
+    def invalidate(self, menu_fingerprint: str) -> None:
+        self._data.clear()
+        self._bytes = 0
+        self.menu_fingerprint = menu_fingerprint
+        self.invalidations += 1
+
+    def key(self, message: str, context: OrderContext) -> str:
+        # is_finalized is always reset at the start of a turn, so only the
+        # items take part in the key.
+        order_state = context.model_dump_json(include={"items"})
+        raw = "\0".join((self.menu_fingerprint, normalize(message), order_state))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _drop(self, key: str) -> None:
+        _, _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        entry = self._data.get(key)
+        if entry is not None and entry[1] <= time.monotonic():
+            self._drop(key)
+            self.evicted_ttl += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        self.latency_saved += entry[3]
+        return entry[0]
+
+    def put(self, key: str, reply: str, latency_seconds: float) -> None:
+        if not self.enabled:
+            return
+        size = len(key) + len(reply.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        if key in self._data:
+            self._drop(key)
+        self._data[key] = (reply, time.monotonic() + self.ttl, size, latency_seconds)
+        self._bytes += size
+        self.stores += 1
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            self._drop(next(iter(self._data)))
+            self.evicted_lru += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "invalidations": self.invalidations,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+        }
@@ -0,0 +1,263 @@
+import abc
+import collections
+import os
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import OrderContext
+
+
+class VersionConflict(Exception):
+    """Raised when a session was updated by another turn since it was read."""
+
+    def __init__(self, session_id: str, expected: int, actual: int):
+        super().__init__(f"session {session_id} is at version {actual}, expected {expected}")
+        self.session_id = session_id
+        self.expected = expected
+        self.actual = actual
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+class SessionStore(abc.ABC):
+    """Server-side OrderContext storage keyed by session id.
+
+    Every write bumps the session's version, and put() only succeeds if the
+    caller's expected version is still current, so a duplicate or concurrent
+    turn can't silently overwrite another one. A session that doesn't exist
+    yet is at version 0.
+    """
+
+    @abc.abstractmethod
+    async def get(self, session_id: str) -> Tuple[OrderContext, int]:
+        ...
+
+    @abc.abstractmethod
+    async def put(self, session_id: str, context: OrderContext, expected_version: int) -> int:
+        ...
+
+    @abc.abstractmethod
+    async def delete(self, session_id: str) -> None:
+        ...
+
+    async def close(self) -> None:
+        pass
+
+    @abc.abstractmethod
+    async def stats(self) -> Dict:
+        ...
+
+
+class InMemorySessionStore(SessionStore):
+    """Per-process LRU with a TTL. Fine for a single worker; use Redis when
+    more than one process serves the same sessions."""
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 3600.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl_seconds
+        # session_id -> (serialized context, version, expires_at)
+        self._data: "collections.OrderedDict[str, Tuple[bytes, int, float]]" = collections.OrderedDict()
+        self._bytes = 0
+        self.evicted_lru = 0
+        self.evicted_ttl = 0
+        self.conflicts = 0
+
+    def _drop(self, session_id: str) -> None:
+        payload, _, _ = self._data.pop(session_id)
+        self._bytes -= len(payload)
+
+    def _expire(self, now: float) -> None:
+        # Entries are in last-access order, and access refreshes the TTL, so
+        # expired entries are always at the front.
+        while self._data:
+            session_id, (_, _, expires_at) = next(iter(self._data.items()))
+            if expires_at > now:
+                break
+            self._drop(session_id)
+            self.evicted_ttl += 1
+
+    def _lookup(self, session_id: str, now: float) -> Optional[Tuple[bytes, int, float]]:
+        entry = self._data.get(session_id)
+        if entry is None:
+            return None
+        if entry[2] <= now:
+            self._drop(session_id)
+            self.evicted_ttl += 1
+            return None
+        return entry
+
+    async def get(self, session_id: str) -> Tuple[OrderContext, int]:
+        now = time.monotonic()
+        entry = self._lookup(session_id, now)
+        if entry is None:
+            return OrderContext(), 0
+        payload, version, _ = entry
+        self._data[session_id] = (payload, version, now + self.ttl)
+        self._data.move_to_end(session_id)
+        return OrderContext.model_validate_json(payload), version
+
+    async def put(self, session_id: str, context: OrderContext, expected_version: int) -> int:
+        now = time.monotonic()
+        entry = self._lookup(session_id, now)
+        current_version = entry[1] if entry else 0
+        if current_version != expected_version:
+            self.conflicts += 1
+            raise VersionConflict(session_id, expected_version, current_version)
+        if entry is not None:
+            self._drop(session_id)
+        payload = context.model_dump_json().encode("utf-8")
+        new_version = current_version + 1
+        self._data[session_id] = (payload, new_version, now + self.ttl)
+        self._bytes += len(payload)
+        self._expire(now)
+        while len(self._data) > self.max_sessions:
+            oldest = next(iter(self._data))
+            self._drop(oldest)
+            self.evicted_lru += 1
+        return new_version
+
+    async def delete(self, session_id: str) -> None:
+        if session_id in self._data:
+            self._drop(session_id)
+
+    async def stats(self) -> Dict:
+        sessions = len(self._data)
+        return {
+            "backend": "memory",
+            "sessions": sessions,
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl,
+            "payload_bytes": self._bytes,
+            "avg_bytes_per_session": self._bytes / sessions if sessions else 0.0,
+            "evicted_lru": self.evicted_lru,
+            "evicted_ttl": self.evicted_ttl,
+            "conflicts": self.conflicts,
+        }
+
+
+# Compare-and-set in one round trip: only write if the stored version is the
+# one the caller read. Returns the new version, or -(current version) - 1.
+_REDIS_CAS_SCRIPT = """
+local current = tonumber(redis.call('HGET', KEYS[1], 'version') or '0')
+if current ~= tonumber(ARGV[1]) then
+    return -current - 1
+end
+local new_version = current + 1
+redis.call('HSET', KEYS[1], 'context', ARGV[2], 'version', new_version)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return new_version
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in Redis (or anything speaking its protocol), shared by every
+    worker. TTL and memory limits are Redis's job (EXPIRE + maxmemory)."""
+
+    # Session keys MEMORY USAGE is run on for stats(); SCAN pages walked to find them.
+    STATS_SAMPLE = 50
+    STATS_MAX_PAGES = 10
+
+    def __init__(self, url: str = "", ttl_seconds: int = 3600, key_prefix: str = "mcbot:session:", client=None):
+        # client: an already built redis.asyncio client (e.g. fakeredis) to
+        # use instead of connecting to url.
+        if client is None:
+            try:
+                import redis.asyncio as redis_asyncio
+            except ImportError as e:
+                raise RuntimeError("SESSION_BACKEND=redis needs the 'redis' package installed") from e
+            client = redis_asyncio.from_url(url)
+        self.client = client
+        self.ttl = int(ttl_seconds)
+        self.key_prefix = key_prefix
+        self._cas = self.client.register_script(_REDIS_CAS_SCRIPT)
+        self.conflicts = 0
+        self.writes = 0
+
+    def _key(self, session_id: str) -> str:
+        return self.key_prefix + session_id
+
+    async def get(self, session_id: str) -> Tuple[OrderContext, int]:
+        key = self._key(session_id)
+        payload, version = await self.client.hmget(key, "context", "version")
+        if payload is None:
+            return OrderContext(), 0
+        await self.client.expire(key, self.ttl)
+        return OrderContext.model_validate_json(payload), int(version)
+
+    async def put(self, session_id: str, context: OrderContext, expected_version: int) -> int:
+        result = await self._cas(
+            keys=[self._key(session_id)],
+            args=[expected_version, context.model_dump_json(), self.ttl],
+        )
+        result = int(result)
+        if result < 0:
+            self.conflicts += 1
+            raise VersionConflict(session_id, expected_version, -result - 1)
+        self.writes += 1
+        return result
+
+    async def delete(self, session_id: str) -> None:
+        await self.client.delete(self._key(session_id))
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def _sample_keys(self) -> List[Any]:
+        keys: List[Any] = []
+        cursor = 0
+        for _ in range(self.STATS_MAX_PAGES):
+            cursor, page = await self.client.scan(cursor=cursor, match=self.key_prefix + "*", count=self.STATS_SAMPLE)
+            keys.extend(page)
+            if cursor == 0 or len(keys) >= self.STATS_SAMPLE:
+                break
+        return keys[:self.STATS_SAMPLE]
+
+    async def _server_stats(self) -> Dict:
+        # Per-session size from MEMORY USAGE on a sample of session keys, so
+        # stats never walks the whole keyspace. Evictions and expirations come
+        # from INFO and are server-wide: evicted_keys going up means maxmemory
+        # is too small for the session TTL.
+        keys = await self._sample_keys()
+        sizes: List[int] = []
+        if keys:
+            async with self.client.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.memory_usage(key)
+                sizes = [size for size in await pipe.execute() if size is not None]
+        info = await self.client.info("stats")
+        memory = await self.client.info("memory")
+        return {
+            "sampled_sessions": len(sizes),
+            "avg_bytes_per_session": sum(sizes) / len(sizes) if sizes else 0.0,
+            "used_memory_bytes": memory.get("used_memory", 0),
+            "maxmemory_bytes": memory.get("maxmemory", 0),
+            "evicted_keys": info.get("evicted_keys", 0),
+            "expired_keys": info.get("expired_keys", 0),
+        }
+
+    async def stats(self) -> Dict:
+        stats: Dict[str, Any] = {
+            "backend": "redis",
+            "ttl_seconds": self.ttl,
+            "writes": self.writes,
+            "conflicts": self.conflicts,
+        }
+        try:
+            stats.update(await self._server_stats())
+        except Exception as e:
+            stats["error"] = str(e)
+        return stats
+
+
+def session_store_from_env() -> SessionStore:
+    backend = os.getenv("SESSION_BACKEND", "memory").lower()
+    ttl = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+    if backend == "redis":
+        return RedisSessionStore(os.getenv("REDIS_URL", "redis://localhost:6379/0"), ttl_seconds=int(ttl))
+    return InMemorySessionStore(
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "10000")),
+        ttl_seconds=ttl,
+    )
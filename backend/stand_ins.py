@@ -0,0 +1,184 @@
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+from google.api_core import exceptions as google_exceptions
+from pymongo.errors import BulkWriteError
+
+from llm_client import GeminiConfig
+from mongo import MongoConnection
+
+# In-process stand-ins for Gemini and MongoDB, for load tests and benchmarks
+# that must not touch the real services. main.py installs them when
+# MCBOT_STAND_INS=1; benchmarks/load_harness.py installs them directly.
+
+STATE_HEADER = "Current Order State (compact JSON):\n"
+FENCE = "```"
+
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+
+
+class FakeResponse:
+    def __init__(self, text: str, usage: Optional[FakeUsage] = None):
+        self.text = text
+        self.usage_metadata = usage
+        self.prompt_feedback = None
+
+
+class FakeGenerativeModel:
+    """Stands in for genai.GenerativeModel.
+
+    Each call sleeps for latency +/- jitter seconds, fails with a transient
+    503 at error_rate, and answers with the next canned output if any were
+    given, otherwise with a short reply that keeps the current order as is.
+    """
+
+    def __init__(self, system_instruction: str = "", json_output: bool = False, latency: float = 0.8,
+                 jitter: float = 0.2, error_rate: float = 0.0, outputs: Optional[Sequence[str]] = None,
+                 seed: Optional[int] = None):
+        self.system_instruction = system_instruction
+        self.json_output = json_output
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.outputs: List[str] = list(outputs or [])
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self.errors = 0
+        self._prefix_tokens = len(system_instruction) // 4
+
+    def _order_state(self, prompt: str) -> Dict[str, Any]:
+        start = prompt.find(STATE_HEADER)
+        if start == -1:
+            return {"items": []}
+        line = prompt[start + len(STATE_HEADER):].split("\n", 1)[0]
+        try:
+            return json.loads(line)
+        except ValueError:
+            return {"items": []}
+
+    def _output(self, prompt: str) -> str:
+        if self.outputs:
+            return self.outputs[(self.calls - 1) % len(self.outputs)]
+        order = self._order_state(prompt)
+        order["is_finalized"] = False
+        reply = "Sure thing! Anything else?"
+        if self.json_output:
+            items = [{"id": line[0], "qty": line[1], "mods": line[2] if len(line) > 2 else []} for line in order["items"]]
+            return json.dumps({"reply": reply, "order": {"items": items, "is_finalized": False}})
+        return f"{reply}\n{FENCE}json\n{json.dumps(order, separators=(',', ':'))}\n{FENCE}"
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+
+    async def generate_content_async(self, prompt: str, stream: bool = False, **kwargs):
+        self.calls += 1
+        delay = self._delay()
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            await asyncio.sleep(delay / 4)
+            raise google_exceptions.ServiceUnavailable("503 stand-in model is overloaded")
+        text = self._output(prompt)
+        usage = FakeUsage(self._prefix_tokens + len(prompt) // 4, len(text) // 4)
+        if not stream:
+            await asyncio.sleep(delay)
+            return FakeResponse(text, usage)
+        # First chunk after ~60% of the latency, the rest spread over the remainder.
+        await asyncio.sleep(delay * 0.6)
+        chunks = [text[i:i + 24] for i in range(0, len(text), 24)] or [""]
+        per_chunk = delay * 0.4 / len(chunks)
+
+        async def chunk_stream():
+            for i, chunk in enumerate(chunks):
+                if i:
+                    await asyncio.sleep(per_chunk)
+                yield FakeResponse(chunk, usage if i == len(chunks) - 1 else None)
+        return chunk_stream()
+
+
+class InMemoryCollection:
+    """The slice of pymongo's Collection that OrderWriter uses, including
+    duplicate-key errors on _id, with an optional per-write delay.
+    Methods are called from worker threads, hence the lock."""
+
+    def __init__(self, write_latency: float = 0.0):
+        self.write_latency = write_latency
+        self.documents: Dict[Any, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def insert_many(self, documents, ordered: bool = True):
+        if self.write_latency:
+            time.sleep(self.write_latency)
+        errors = []
+        with self._lock:
+            for index, document in enumerate(documents):
+                if document["_id"] in self.documents:
+                    errors.append({"index": index, "code": 11000, "errmsg": "E11000 duplicate key error"})
+                    if ordered:
+                        break
+                    continue
+                self.documents[document["_id"]] = dict(document)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(documents) - len(errors)})
+
+    def insert_one(self, document):
+        self.insert_many([document])
+
+    def count_documents(self, query: Dict[str, Any]) -> int:
+        # Equality on top-level fields only, e.g. {"is_finalized": True}; like
+        # Mongo, {"field": None} also matches documents without the field.
+        for field, value in query.items():
+            if field.startswith("$") or (isinstance(value, dict) and any(k.startswith("$") for k in value)):
+                raise NotImplementedError(f"InMemoryCollection can't count with {field!r}: equality filters only")
+        with self._lock:
+            return sum(
+                all(document.get(field) == value for field, value in query.items())
+                for document in self.documents.values()
+            )
+
+
+def stand_in_collection(write_latency: float = 0.0):
+    # mongomock is closer to the real thing; use it when it is installed.
+    try:
+        import mongomock
+    except ImportError:
+        return InMemoryCollection(write_latency)
+    return mongomock.MongoClient()["mcdonalds_orders"]["orders"]
+
+
+def stand_in_dependencies(latency: float = 0.8, jitter: float = 0.2, error_rate: float = 0.0,
+                          mongo_write_latency: float = 0.005, outputs: Optional[Sequence[str]] = None,
+                          seed: Optional[int] = None):
+    """Returns (GeminiConfig, MongoConnection, model_factory) for
+    main.install_dependencies()."""
+
+    def model_factory(prompt_cache):
+        return FakeGenerativeModel(
+            prompt_cache.system_instruction,
+            json_output=prompt_cache.json_output,
+            latency=latency,
+            jitter=jitter,
+            error_rate=error_rate,
+            outputs=outputs,
+            seed=seed,
+        )
+
+    collection = stand_in_collection(mongo_write_latency)
+    return GeminiConfig.stand_in(), MongoConnection.for_collection(collection), model_factory
+
+
+def stand_in_dependencies_from_env():
+    return stand_in_dependencies(
+        latency=float(os.getenv("STAND_IN_LLM_LATENCY_MS", "800")) / 1000,
+        jitter=float(os.getenv("STAND_IN_LLM_JITTER_MS", "200")) / 1000,
+        error_rate=float(os.getenv("STAND_IN_LLM_ERROR_RATE", "0")),
+        mongo_write_latency=float(os.getenv("STAND_IN_MONGO_LATENCY_MS", "5")) / 1000,
+    )
@@ -0,0 +1,60 @@
+import json
+import re
+from typing import Any, Dict
+
+REPLY_KEY_RE = re.compile(r'(?<!\\)"reply"\s*:\s*"')
+
+
+class StructuredReplyStreamer:
+    """Streams the "reply" string out of a JSON-mode response
+    ({"reply": ..., "order": ...}) as it arrives.
+
+    feed() returns newly decoded reply text. Escapes are only decoded once
+    they are complete, so a chunk boundary inside "\\u00e9" is harmless. If
+    the model writes "order" first, the reply simply starts streaming later.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.pos = 0
+        self.in_reply = False
+        self.reply_closed = False
+
+    def feed(self, chunk: str) -> str:
+        self.text += chunk
+        if self.reply_closed:
+            return ""
+        if not self.in_reply:
+            match = REPLY_KEY_RE.search(self.text, max(0, self.pos - 16))
+            if match is None:
+                self.pos = len(self.text)
+                return ""
+            self.in_reply = True
+            self.pos = match.end()
+        start = self.pos
+        safe_end = start
+        i = start
+        while i < len(self.text):
+            char = self.text[i]
+            if char == '"':
+                self.reply_closed = True
+                break
+            if char == "\\":
+                escape_len = 6 if self.text[i + 1:i + 2] == "u" else 2
+                # A high surrogate (\ud800-\udbff) is only decodable with its pair.
+                if escape_len == 6 and self.text[i + 2:i + 4].lower() in ("d8", "d9", "da", "db"):
+                    escape_len = 12
+                if i + escape_len > len(self.text):
+                    break
+                i += escape_len
+            else:
+                i += 1
+            safe_end = i
+        self.pos = safe_end + 1 if self.reply_closed else safe_end
+        return json.loads('"' + self.text[start:safe_end] + '"')
+
+
+def ndjson_event(event_type: str, **payload: Any) -> str:
+    event: Dict[str, Any] = {"type": event_type}
+    event.update(payload)
+    return json.dumps(event) + "\n"
@@ -0,0 +1,325 @@
+import atexit
+import bisect
+import collections
+import contextvars
+import json
+import os
+import random
+import sys
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+# Per-stage latency, counters and structured logs for the chat path.
+#
+#   with span("prompt_build"):
+#       prompt = ...
+#
+# Every span lands in the mcbot_stage_seconds histogram (served on /metrics)
+# and in the current turn's Trace, which is logged once when the turn ends.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    if len(labels) == 1:
+        ((k, v),) = labels.items()
+        return ((k, str(v)),)
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    escaped = (f'{k}="{_escape(v)}"' for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """In-process counters, histograms and gauges, rendered in Prometheus
+    text format. Single event loop, so no locking; the numbers are only
+    read by /metrics and /api/stats."""
+
+    def __init__(self):
+        self.enabled = True
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+
+    def describe(self, name: str, kind: str, help_text: str) -> None:
+        self._help[name] = (kind, help_text)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        series = self._counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0.0) + value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        if not self.enabled:
+            return
+        series = self._histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    def gauge(self, name: str, read: Callable[[], float], help_text: str) -> None:
+        self._gauges[name] = read
+        self.describe(name, "gauge", help_text)
+
+    def _header(self, lines: List[str], name: str, default_kind: str) -> None:
+        kind, help_text = self._help.get(name, (default_kind, ""))
+        if help_text:
+            lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name, series in sorted(self._counters.items()):
+            self._header(lines, name, "counter")
+            for key, value in series.items():
+                lines.append(f"{name}{_format_labels(key)} {value:g}")
+        for name, series in sorted(self._histograms.items()):
+            self._header(lines, name, "histogram")
+            for key, histogram in series.items():
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        for name, read in sorted(self._gauges.items()):
+            try:
+                value = float(read())
+            except Exception:
+                continue
+            self._header(lines, name, "gauge")
+            lines.append(f"{name} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("mcbot_stage_seconds", "histogram", "Time spent per stage of a chat turn.")
+metrics.describe("mcbot_request_seconds", "histogram", "End-to-end chat turn latency.")
+metrics.describe("mcbot_requests_total", "counter", "Chat turns by route, answer source and outcome.")
+metrics.describe("mcbot_errors_total", "counter", "Errors by class.")
+metrics.describe("mcbot_llm_tokens_total", "counter", "Gemini tokens reported by usage metadata.")
+
+
+class Trace:
+    """Stage timings for one chat turn."""
+
+    def __init__(self, route: str):
+        self.route = route
+        # Only needs to be unique enough to correlate log lines; uuid4 reads
+        # os.urandom, which is surprisingly slow on some hosts.
+        self.request_id = f"{random.getrandbits(64):016x}"
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+
+_current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("mcbot_trace", default=None)
+
+
+def start_trace(route: str) -> Trace:
+    trace = Trace(route)
+    _current_trace.set(trace)
+    return trace
+
+
+def activate(trace: Trace) -> None:
+    # For code that runs outside the handler's context (streaming bodies).
+    _current_trace.set(trace)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def record_stage(stage: str, seconds: float) -> None:
+    if not metrics.enabled:
+        return
+    metrics.observe("mcbot_stage_seconds", seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+class span:
+    """Times a block as one stage of the current turn."""
+
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self) -> None:
+        self.started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        record_stage(self.stage, time.perf_counter() - self.started)
+
+
+def record_error(error_class: str) -> None:
+    metrics.inc("mcbot_errors_total", **{"class": error_class})
+
+
+def record_token_usage(response: Any) -> None:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attr in (("prompt", "prompt_token_count"), ("output", "candidates_token_count")):
+        count = getattr(usage, attr, 0) or 0
+        if count:
+            metrics.inc("mcbot_llm_tokens_total", count, kind=kind)
+
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+class StructuredLogger:
+    """JSON-lines logger that never writes on the event loop.
+
+    Records are appended to a bounded buffer (overflow is counted and
+    dropped) and a background thread serializes and writes them every
+    flush_interval seconds, so a log call never wakes another thread.
+    payload() is for order contents and raw model output, and is sampled:
+    by default none of it is logged.
+    """
+
+    def __init__(self, level: str = "info", payload_sample_rate: float = 0.0,
+                 max_buffer: int = 10000, flush_interval: float = 0.1, stream=None):
+        self.level = LEVELS.get(level.lower(), 20)
+        self.payload_sample_rate = payload_sample_rate
+        self.max_buffer = max_buffer
+        self.flush_interval = flush_interval
+        self.stream = stream or sys.stdout
+        # deque.append/popleft are atomic, so no lock on the hot path.
+        self._buffer: Deque[Dict[str, Any]] = collections.deque()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    @classmethod
+    def from_env(cls) -> "StructuredLogger":
+        return cls(
+            level=os.getenv("LOG_LEVEL", "info"),
+            payload_sample_rate=float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0")),
+            max_buffer=int(os.getenv("LOG_BUFFER_SIZE", "10000")),
+            flush_interval=float(os.getenv("LOG_FLUSH_INTERVAL_SECONDS", "0.1")),
+        )
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._stopping.clear()
+                self._thread = threading.Thread(target=self._run, name="mcbot-log", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+
+    def flush(self) -> None:
+        lines = []
+        while self._buffer:
+            lines.append(json.dumps(self._buffer.popleft(), default=str, ensure_ascii=False))
+        if lines:
+            try:
+                self.stream.write("\n".join(lines) + "\n")
+                self.stream.flush()
+            except Exception:
+                pass
+
+    def _emit(self, level: str, event: str, fields: Dict[str, Any]) -> None:
+        if LEVELS[level] < self.level:
+            return
+        if self._thread is None:
+            self._ensure_thread()
+        if len(self._buffer) >= self.max_buffer:
+            self.dropped += 1
+            return
+        record = {"ts": round(time.time(), 3), "level": level, "event": event}
+        trace = _current_trace.get()
+        if trace is not None:
+            record["request_id"] = trace.request_id
+        record.update(fields)
+        self._buffer.append(record)
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self._emit("debug", event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self._emit("info", event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self._emit("warning", event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self._emit("error", event, fields)
+
+    def payload(self, event: str, **fields: Any) -> None:
+        if self.payload_sample_rate > 0 and random.random() < self.payload_sample_rate:
+            self._emit("info", event, fields)
+
+    def stop(self, timeout: float = 2.0) -> None:
+        thread = self._thread
+        if thread is None:
+            return
+        self._stopping.set()
+        thread.join(timeout)
+        self._thread = None
+
+
+log = StructuredLogger.from_env()
+
+
+def finish_trace(trace: Trace, source: str, status: int = 200) -> None:
+    if not metrics.enabled:
+        return
+    elapsed = trace.elapsed
+    metrics.observe("mcbot_request_seconds", elapsed, route=trace.route)
+    metrics.inc("mcbot_requests_total", route=trace.route, source=source, status=status)
+    log.info(
+        "turn",
+        route=trace.route,
+        source=source,
+        status=status,
+        ms=round(elapsed * 1000, 2),
+        stages_ms={stage: round(seconds * 1000, 3) for stage, seconds in trace.stages.items()},
+    )
@@ -0,0 +1,43 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# The backend is a flat set of modules run from backend/, not a package.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Read at import time by main and friends.
+os.environ.setdefault("LLM_RATE_PER_MINUTE", "0")
+os.environ.setdefault("LOG_LEVEL", "error")
+os.environ.setdefault("MENU_RELOAD_INTERVAL_SECONDS", "0")
+os.environ.setdefault("ORDER_SPILL_PATH", os.path.join(tempfile.mkdtemp(prefix="mcbot-tests-"), "unsaved_orders.jsonl"))
+
+
+@pytest.fixture(scope="session")
+def _app_client():
+    # One client for the session: like a real worker, the app runs its
+    # lifespan once, on one event loop.
+    from fastapi.testclient import TestClient
+
+    import main
+    from stand_ins import stand_in_dependencies
+
+    gemini, mongo, model_factory = stand_in_dependencies(latency=0, jitter=0, mongo_write_latency=0)
+    main.install_dependencies(gemini, mongo, model_factory)
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def app_client(_app_client):
+    """start(model) -> a TestClient for the app with `model` standing in for
+    Gemini and an in-memory orders collection."""
+    import main
+
+    def start(model):
+        main.install_dependencies(model_factory=lambda prompt_cache: model)
+        main.response_cache.invalidate(main.prompt_cache.fingerprint)
+        return _app_client
+
+    return start
@@ -0,0 +1,71 @@
+import json
+import os
+import random
+
+import pytest
+
+from llm_output import OrderBlockExtractor, extract_order_block
+
+FIXTURES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fixtures", "llm_outputs.jsonl")
+with open(FIXTURES, encoding="utf-8") as f:
+    TEXT_FIXTURES = [case for case in map(json.loads, filter(str.strip, f)) if case["mode"] == "text"]
+
+
+def stream(text: str, seed: int):
+    rng = random.Random(seed)
+    extractor, deltas, pos = OrderBlockExtractor(), [], 0
+    while pos < len(text):
+        size = rng.randint(1, 12)
+        deltas.append(extractor.feed(text[pos:pos + size]))
+        pos += size
+    return extractor.finish(), deltas
+
+
+@pytest.mark.parametrize("case", TEXT_FIXTURES, ids=[case["name"] for case in TEXT_FIXTURES])
+def test_fixture_parses_as_expected(case):
+    assert (extract_order_block(case["text"]).order is not None) == case["parses"]
+
+
+@pytest.mark.parametrize("case", TEXT_FIXTURES, ids=[case["name"] for case in TEXT_FIXTURES])
+@pytest.mark.parametrize("seed", range(5))
+def test_chunked_feed_matches_one_shot(case, seed):
+    result, deltas = stream(case["text"], seed)
+    assert result == extract_order_block(case["text"])
+    if result.order is not None:
+        # Nothing of the order object is ever shown as reply text.
+        shown = "".join(deltas)
+        assert '"items"' not in shown
+        assert "```" not in shown
+
+
+def test_prose_brace_before_fenced_block():
+    result = extract_order_block('Sure :{ here\n```json\n{"items":[[1,1]],"is_finalized":false}\n```')
+    assert result.order == {"items": [[1, 1]], "is_finalized": False}
+    assert result.reply == "Sure :{ here"
+
+
+def test_unclosed_prose_brace_before_bare_object():
+    result = extract_order_block('Hmm {not json\n{"items":[[1,1]],"is_finalized":false}')
+    assert result.order == {"items": [[1, 1]], "is_finalized": False}
+    assert result.reply == "Hmm {not json"
+
+
+def test_fenced_block_wins_over_bare_object():
+    result = extract_order_block('Ok ```json\n{"items":[[2,1]]}\n``` and {"items":[[3,1]]}')
+    assert result.order == {"items": [[2, 1]]}
+
+
+def test_bare_order_is_held_back_while_streaming():
+    extractor = OrderBlockExtractor()
+    shown = extractor.feed("Here you go\n")
+    shown += extractor.feed('{"items":[[1,1]],')
+    shown += extractor.feed('"is_finalized":false}')
+    assert shown == "Here you go\n"
+    assert extractor.finish().order == {"items": [[1, 1]], "is_finalized": False}
+
+
+def test_cut_off_order_is_an_error_and_not_shown():
+    result = extract_order_block('Added!\n```json\n{"items":[[1,1]')
+    assert result.order is None
+    assert result.error == "unterminated JSON object"
+    assert result.reply == "Added!"
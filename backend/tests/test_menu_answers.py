@@ -0,0 +1,43 @@
+import pytest
+
+from menu_answers import MenuAnswers
+from menu_store import load_menu_file
+from order_parser import build_menu_index
+
+MENU = load_menu_file().items
+ANSWERS = MenuAnswers(MENU, build_menu_index(MENU))
+
+
+@pytest.mark.parametrize("message", ["show me the menu", "Can I see the menu?", "what do you have"])
+def test_menu_requests(message):
+    assert ANSWERS.answer(message) == ANSWERS.menu_reply
+
+
+@pytest.mark.parametrize("message", ["How much is a Big Mac?", "price of a big mac", "what does a big mac cost"])
+def test_price_of_one_item(message):
+    assert ANSWERS.answer(message) == "A Big Mac is $5.99. Would you like to add one?"
+
+
+def test_price_of_an_unsized_item_lists_every_size():
+    reply = ANSWERS.answer("how much are fries")
+    assert reply.startswith("We have Small Fries $")
+    assert "Medium Fries" in reply and "Large Fries" in reply
+
+
+def test_description():
+    reply = ANSWERS.answer("what's in a big mac")
+    assert reply.startswith("Big Mac ($5.99): ")
+    assert MENU["big mac"]["description"] in reply
+
+
+@pytest.mark.parametrize("message", [
+    "how much is my order",
+    "how much is the total",
+    "whats in my order",
+    "tell me about your day",
+    "how much is a pizza",
+    "2 big macs",
+    "",
+])
+def test_anything_else_falls_through(message):
+    assert ANSWERS.answer(message) is None
@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+from menu_store import DEFAULT_MENU_PATH, MenuError, MenuWatcher, parse_menu
+
+with open(DEFAULT_MENU_PATH) as f:
+    DOCUMENT = json.load(f)
+
+
+def menu_document(version, big_mac_price=5.99):
+    items = json.loads(json.dumps(DOCUMENT["items"]))
+    items["big mac"]["price"] = big_mac_price
+    return {"version": version, "items": items}
+
+
+class FlakySource:
+    """A source whose next `failures` loads raise, like a Mongo blip."""
+
+    path = "flaky"
+
+    def __init__(self, document, failures=1):
+        self.document = document
+        self.failures = failures
+
+    def signature(self):
+        return self.document["version"]
+
+    def load(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("connection reset")
+        return parse_menu(self.document, source="flaky")
+
+
+def watcher_for(source):
+    seen = []
+    watcher = MenuWatcher(source, seen.append, interval=0)
+    watcher.load()
+    return watcher, seen
+
+
+def test_a_failed_load_is_retried_on_the_next_poll():
+    source = FlakySource(menu_document("v2", 6.49))
+    watcher, seen = watcher_for(source)
+    asyncio.run(watcher.check())
+    assert watcher.current.version == DOCUMENT["version"]
+    assert watcher.failures == 1
+    asyncio.run(watcher.check())
+    assert watcher.current.version == "v2"
+    assert seen[-1].items["big mac"]["price"] == 6.49
+
+
+def test_unchanged_menu_is_not_reapplied():
+    source = FlakySource(menu_document(DOCUMENT["version"]), failures=0)
+    watcher, seen = watcher_for(source)
+    asyncio.run(watcher.check())
+    asyncio.run(watcher.check())
+    assert len(seen) == 1
+    assert watcher.reloads == 0
+
+
+@pytest.mark.parametrize("document", [
+    [],
+    {"items": {}},
+    {"items": {"big mac": {"price": -1}}},
+    {"items": {"big mac": {"price": True}}},
+    {"items": {"big mac": {"price": 1, "description": 3}}},
+])
+def test_invalid_menus_are_rejected(document):
+    with pytest.raises(MenuError):
+        parse_menu(document)
@@ -0,0 +1,73 @@
+import pytest
+from hypothesis import given, strategies as st
+
+from menu_store import load_menu_file
+from models import OrderContext, OrderItemDetail
+from money import line_total, to_cents
+from order_codec import MAX_QUANTITY, OrderCodec
+
+MENU = load_menu_file().items
+CODEC = OrderCodec(MENU)
+
+
+@st.composite
+def priced_orders(draw):
+    names = draw(st.lists(st.sampled_from(list(MENU)), unique=True, max_size=10))
+    items = {}
+    for name in names:
+        quantity = draw(st.integers(1, MAX_QUANTITY))
+        price = to_cents(MENU[name]["price"])
+        items[name] = OrderItemDetail(
+            quantity=quantity,
+            base_price=float(price),
+            total_price=float(line_total(price, quantity)),
+            modifications=draw(st.lists(st.sampled_from(["no pickles", "extra cheese", "plain"]), unique=True, max_size=2)),
+        )
+    subtotal = float(sum((to_cents(item.total_price) for item in items.values()), to_cents(0)))
+    return OrderContext(items=items, subtotal=subtotal, is_finalized=draw(st.booleans()))
+
+
+@given(priced_orders())
+def test_round_trip(order):
+    compact = CODEC.to_compact(order)
+    compact["is_finalized"] = order.is_finalized
+    decoded, unknown = CODEC.from_compact(compact)
+    assert decoded == order
+    assert unknown == []
+
+
+def test_object_lines_from_json_mode():
+    decoded, _ = CODEC.from_compact({"items": [{"id": 1, "qty": 2, "mods": ["no pickles"]}], "is_finalized": False})
+    assert decoded.items["big mac"].quantity == 2
+    assert decoded.items["big mac"].modifications == ["no pickles"]
+
+
+def test_string_modification_is_one_modification():
+    decoded, _ = CODEC.from_compact({"items": [[1, 2, "no pickles"]]})
+    assert decoded.items["big mac"].modifications == ["no pickles"]
+
+
+def test_unknown_ids_are_dropped_not_fatal():
+    decoded, unknown = CODEC.from_compact({"items": [[1, 1], [999, 1]]})
+    assert list(decoded.items) == ["big mac"]
+    assert unknown == [999]
+
+
+@pytest.mark.parametrize("data", [
+    {"items": [[1, 2]], "is_finalized": "false"},
+    {"items": [[1, 2]], "is_finalized": 0},
+    {"items": [[1.7, 1]]},
+    {"items": [[True, 1]]},
+    {"items": [["1", 1]]},
+    {"items": [[1, 2.5]]},
+    {"items": [[1, False]]},
+    {"items": [[1, 1000000000]]},
+    {"items": [[1, MAX_QUANTITY], [1, 1]]},
+    {"items": [[1, 2, {"no": "pickles"}]]},
+    {"items": [[1, 2, ["ok", 3]]]},
+    {"items": [[1]]},
+    {"items": "big mac"},
+])
+def test_malformed_output_is_rejected(data):
+    with pytest.raises(ValueError):
+        CODEC.from_compact(data)
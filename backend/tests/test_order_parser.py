@@ -0,0 +1,44 @@
+import pytest
+
+from menu_store import load_menu_file
+from models import OrderContext
+from order_parser import _item_label, build_menu_index, try_fast_path
+
+INDEX = build_menu_index(dict(load_menu_file().items))
+
+
+def turn(message, context=None):
+    result = try_fast_path(message, context or OrderContext(), INDEX)
+    assert result is not None
+    return result
+
+
+@pytest.mark.parametrize("name, quantity, label", [
+    ("big mac", 1, "1 Big Mac"),
+    ("big mac", 2, "2 Big Macs"),
+    ("quarter pounder with cheese", 3, "3 Quarter Pounders With Cheese"),
+    ("mcflurry with oreo cookies", 2, "2 Mcflurries With Oreo Cookies"),
+    ("large fries", 2, "2 Large Fries"),
+    ("filet-o-fish", 2, "2 Filet-O-Fish"),
+])
+def test_item_label_pluralizes(name, quantity, label):
+    assert _item_label(name, quantity) == label
+
+
+def test_replies_use_plural_names():
+    result = turn("2 big macs and a filet-o-fish")
+    assert result.reply.startswith("I've added 2 Big Macs and 1 Filet-O-Fish.")
+
+
+def test_remove_more_than_ordered_reports_what_was_removed():
+    ordered = turn("3 big macs and a mcchicken").context
+    result = turn("remove 5 big macs", ordered)
+    assert "big mac" not in result.context.items
+    assert result.reply.startswith("I've removed 3 Big Macs.")
+
+
+def test_partial_remove():
+    ordered = turn("3 big macs").context
+    result = turn("remove 1 big mac", ordered)
+    assert result.context.items["big mac"].quantity == 2
+    assert result.reply.startswith("I've removed 1 Big Mac.")
@@ -0,0 +1,179 @@
+import asyncio
+import os
+
+from bson import ObjectId
+
+from order_store import OrderWriter, _encode
+from stand_ins import InMemoryCollection
+
+
+class Mongo:
+    """get_collection for a writer: None while "down"."""
+
+    def __init__(self, up: bool = True):
+        self.collection = InMemoryCollection()
+        self.up = up
+
+    def __call__(self):
+        return self.collection if self.up else None
+
+
+def make_writer(tmp_path, mongo, **kwargs):
+    kwargs.setdefault("batch_size", 50)
+    kwargs.setdefault("flush_interval", 10.0)
+    return OrderWriter(mongo, spill_path=str(tmp_path / "spill.jsonl"), **kwargs)
+
+
+async def wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition():
+        assert asyncio.get_running_loop().time() < deadline, "condition never became true"
+        await asyncio.sleep(0.01)
+
+
+def write_spill(path, lines):
+    with open(path, "w") as f:
+        f.writelines(line + "\n" for line in lines)
+
+
+def test_flushes_when_a_batch_fills(tmp_path):
+    mongo = Mongo()
+    writer = make_writer(tmp_path, mongo, batch_size=3)
+
+    async def run():
+        await writer.start()
+        for i in range(3):
+            writer.submit({"n": i})
+        await wait_for(lambda: writer.written == 3)
+        assert writer.batches == 1
+        await writer.stop()
+
+    asyncio.run(run())
+    assert len(mongo.collection.documents) == 3
+
+
+def test_flushes_a_partial_batch_after_the_interval(tmp_path):
+    mongo = Mongo()
+    writer = make_writer(tmp_path, mongo, flush_interval=0.05)
+
+    async def run():
+        await writer.start()
+        order_id = writer.submit({"n": 1})
+        await wait_for(lambda: writer.written == 1)
+        assert order_id in mongo.collection.documents
+        await writer.stop()
+
+    asyncio.run(run())
+
+
+def test_stop_drains_the_queue(tmp_path):
+    mongo = Mongo()
+    writer = make_writer(tmp_path, mongo)
+
+    async def run():
+        await writer.start()
+        for i in range(7):
+            writer.submit({"n": i})
+        await writer.stop()
+
+    asyncio.run(run())
+    assert writer.written == 7
+    assert len(mongo.collection.documents) == 7
+    assert not writer.running
+
+
+def test_spills_while_mongo_is_down_and_replays_later(tmp_path):
+    mongo = Mongo(up=False)
+    writer = make_writer(tmp_path, mongo, flush_interval=0.01)
+
+    async def run():
+        await writer.start()
+        ids = [writer.submit({"n": i}) for i in range(4)]
+        await wait_for(lambda: writer.spilled == 4)
+        assert os.path.exists(writer.spill_path)
+        mongo.up = True
+        await writer.replay_spill()
+        await writer.stop()
+        return ids
+
+    ids = asyncio.run(run())
+    assert writer.replayed == 4
+    assert set(mongo.collection.documents) == set(ids)
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_replaying_an_order_that_was_already_written(tmp_path):
+    mongo = Mongo()
+    written, lost = {"_id": ObjectId(), "n": 1}, {"_id": ObjectId(), "n": 2}
+    mongo.collection.insert_one(written)
+    writer = make_writer(tmp_path, mongo)
+    write_spill(writer.spill_path, [_encode(written), _encode(lost)])
+
+    asyncio.run(writer.replay_spill())
+    assert set(mongo.collection.documents) == {written["_id"], lost["_id"]}
+    assert writer.write_errors == 0
+    assert not os.path.exists(writer.spill_path)
+
+
+def test_corrupt_spill_lines_are_set_aside(tmp_path):
+    mongo = Mongo()
+    writer = make_writer(tmp_path, mongo, flush_interval=0.01)
+    good = [{"_id": ObjectId(), "n": i} for i in range(2)]
+    torn = _encode({"_id": ObjectId(), "n": 3})[:20]
+    write_spill(writer.spill_path, [_encode(good[0]), torn, _encode(good[1]), '{"_id": "not an object id"}'])
+
+    async def run():
+        await writer.start()
+        await wait_for(lambda: writer.replayed == 2)
+        # Still running, and later orders still go through.
+        assert writer.running
+        later = writer.submit({"n": 4})
+        await wait_for(lambda: later in mongo.collection.documents)
+        await writer.stop()
+
+    asyncio.run(run())
+    assert {order["_id"] for order in good} <= set(mongo.collection.documents)
+    assert writer.corrupt_lines == 2
+    with open(writer.spill_path + ".corrupt") as f:
+        assert f.read().splitlines() == [torn, '{"_id": "not an object id"}']
+    assert not any(".replaying" in name for name in os.listdir(tmp_path))
+
+
+def test_a_leftover_claimed_file_does_not_block_new_spills(tmp_path):
+    mongo = Mongo()
+    writer = make_writer(tmp_path, mongo)
+    stuck, fresh = {"_id": ObjectId(), "n": 1}, {"_id": ObjectId(), "n": 2}
+    write_spill(f"{writer.spill_path}.replaying.{os.getpid()}", [_encode(stuck)])
+    write_spill(writer.spill_path, [_encode(fresh)])
+
+    asyncio.run(writer.replay_spill())
+    assert set(mongo.collection.documents) == {stuck["_id"], fresh["_id"]}
+    assert os.listdir(tmp_path) == ["spill.jsonl.lock"]
+
+
+def test_driver_is_imported_off_the_event_loop(tmp_path, monkeypatch):
+    import threading
+
+    import order_store
+
+    threads = []
+    load_driver = order_store._load_driver
+
+    def recording_load_driver():
+        threads.append(threading.current_thread())
+        load_driver()
+
+    monkeypatch.setattr(order_store, "ObjectId", None)
+    monkeypatch.setattr(order_store, "BulkWriteError", None)
+    monkeypatch.setattr(order_store, "_load_driver", recording_load_driver)
+    writer = make_writer(tmp_path, Mongo())
+
+    async def run():
+        await writer.start()
+        await wait_for(lambda: order_store.BulkWriteError is not None)
+        writer.submit({"n": 1})
+        await writer.stop()
+
+    asyncio.run(run())
+    assert threads and threading.main_thread() not in threads
+    assert writer.written == 1
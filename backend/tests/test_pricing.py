@@ -0,0 +1,99 @@
+from decimal import Decimal
+
+import pytest
+from hypothesis import given, strategies as st
+
+from menu_store import load_menu_file
+from models import OrderContext, OrderItemDetail
+from money import to_cents
+from order_parser import build_menu_index
+from pricing import PriceBook, PricingResult
+
+MENU = load_menu_file().items
+NAMES = list(MENU)
+BOOK = PriceBook(MENU, build_menu_index(MENU))
+
+
+def spellings(name: str):
+    return st.sampled_from([name, name.upper(), name.title(), f"  {name} "])
+
+
+@st.composite
+def orders(draw):
+    # Claimed prices and totals are random: the book must ignore them.
+    lines = draw(st.lists(st.tuples(st.sampled_from(NAMES), st.integers(1, 99)), max_size=8))
+    items = {}
+    for name, quantity in lines:
+        items[draw(spellings(name))] = OrderItemDetail(
+            quantity=quantity,
+            base_price=draw(st.floats(0, 100)),
+            total_price=draw(st.floats(0, 10000)),
+        )
+    return OrderContext(items=items, subtotal=draw(st.floats(0, 10000)))
+
+
+@given(orders())
+def test_line_totals_are_quantity_times_menu_price(order):
+    result = BOOK.price_order(order)
+    for name, item in result.context.items.items():
+        price = to_cents(MENU[name]["price"])
+        assert to_cents(item.base_price) == price
+        assert to_cents(item.total_price) == price * item.quantity
+
+
+@given(orders())
+def test_subtotal_is_sum_of_lines(order):
+    result = BOOK.price_order(order)
+    lines = sum((to_cents(item.total_price) for item in result.context.items.values()), Decimal("0.00"))
+    assert to_cents(result.context.subtotal) == lines
+
+
+@given(orders())
+def test_quantities_are_kept_per_menu_item(order):
+    expected = {}
+    for raw_name, item in order.items.items():
+        name = raw_name.strip().lower()
+        expected[name] = expected.get(name, 0) + item.quantity
+    result = BOOK.price_order(order)
+    assert {name: item.quantity for name, item in result.context.items.items()} == expected
+    assert not result.dropped
+
+
+def test_duplicate_spellings_merge():
+    order = OrderContext(items={
+        "big mac": OrderItemDetail(quantity=1, base_price=0, total_price=0, modifications=["no pickles"]),
+        "Big Macs": OrderItemDetail(quantity=2, base_price=0, total_price=0, modifications=["extra sauce"]),
+    })
+    result = BOOK.price_order(order)
+    assert list(result.context.items) == ["big mac"]
+    line = result.context.items["big mac"]
+    assert line.quantity == 3
+    assert line.modifications == ["no pickles", "extra sauce"]
+    assert to_cents(line.total_price) == Decimal("17.97")
+    assert result.repaired == {"Big Macs": "big mac"}
+
+
+def test_unknown_items_are_dropped_and_explained():
+    order = OrderContext(items={
+        "big mac": OrderItemDetail(quantity=1, base_price=5.99, total_price=5.99),
+        "whopper": OrderItemDetail(quantity=1, base_price=5.0, total_price=5.0),
+    })
+    result = BOOK.price_order(order, unknown_ids=[999])
+    assert list(result.context.items) == ["big mac"]
+    assert result.dropped == ["whopper"]
+    assert result.unknown_ids == [999]
+    assert result.note() == (' (Note: "whopper" isn\'t on our menu and I couldn\'t match one other item'
+                             ' to our menu, so I left them off your order.)')
+    assert "999" not in result.note()
+
+
+@pytest.mark.parametrize("dropped, unknown_ids, note", [
+    ([], [], ""),
+    (["whopper"], [], ' (Note: "whopper" isn\'t on our menu, so I left it off your order.)'),
+    (["whopper", "taco"], [], ' (Note: "whopper" and "taco" aren\'t on our menu, so I left them off your order.)'),
+    (["a", "b", "c"], [], ' (Note: "a", "b" and "c" aren\'t on our menu, so I left them off your order.)'),
+    ([], [999], " (Note: I couldn't match one item to our menu, so I left it off your order.)"),
+    ([], [998, 999], " (Note: I couldn't match 2 items to our menu, so I left them off your order.)"),
+])
+def test_note_wording(dropped, unknown_ids, note):
+    assert PricingResult(context=OrderContext(), dropped=dropped, unknown_ids=unknown_ids).note() == note
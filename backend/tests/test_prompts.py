@@ -0,0 +1,100 @@
+import asyncio
+
+from menu_store import load_menu_file
+from models import OrderContext, OrderItemDetail
+from prompts import TEXT_OUTPUT_FORMAT, TURN_PROMPT_TEMPLATE, PromptCache, format_menu_for_prompt
+from stand_ins import FakeResponse
+
+MENU = load_menu_file().items
+REPLY = 'Sure!\n```json\n{"items":[[1,2]],"is_finalized":false}\n```'
+
+
+class RecordingModel:
+    """Records what each call would have sent to Gemini."""
+
+    def __init__(self, system_instruction: str):
+        self.system_instruction = system_instruction
+        self.prompts = []
+
+    async def generate_content_async(self, prompt, **kwargs):
+        self.prompts.append(prompt)
+        return FakeResponse(REPLY)
+
+
+def recording_cache():
+    cache = PromptCache("gemini-1.5-flash", json_output=False,
+                        model_factory=lambda prompt_cache: RecordingModel(prompt_cache.system_instruction))
+    cache.refresh(MENU)
+    return cache
+
+
+def test_prefix_is_the_system_instruction_and_not_the_turn_prompt():
+    cache = recording_cache()
+    model = asyncio.run(cache.get_model())
+    assert format_menu_for_prompt(MENU) in model.system_instruction
+    assert TEXT_OUTPUT_FORMAT in model.system_instruction
+    prompt = cache.build_turn_prompt(OrderContext(), "add a big mac")
+    assert "Available Menu Items" not in prompt
+    assert prompt == TURN_PROMPT_TEMPLATE.format(
+        context_string="The user's order is currently empty.",
+        user_message="add a big mac",
+    )
+
+
+def test_turn_prompt_carries_compact_order_state():
+    cache = recording_cache()
+    order = OrderContext(items={"big mac": OrderItemDetail(quantity=2, base_price=5.99, total_price=11.98, modifications=["no pickles"])})
+    prompt = cache.build_turn_prompt(order, "and a coke")
+    assert 'Current Order State (compact JSON):\n{"items":[[1,2,["no pickles"]]]}' in prompt
+
+
+def test_model_is_built_once_per_menu():
+    cache = recording_cache()
+    first = asyncio.run(cache.get_model())
+    assert asyncio.run(cache.get_model()) is first
+    changed = dict(MENU, **{"mcrib": {"price": 5.49, "description": "Pork."}})
+    assert cache.refresh(changed)
+    second = asyncio.run(cache.get_model())
+    assert second is not first
+    assert "Mcrib" in second.system_instruction
+
+
+def test_tokens_only_count_as_saved_with_a_context_cache():
+    cache = recording_cache()
+    cache.build_turn_prompt(OrderContext(), "hi")
+    stats = cache.stats()
+    assert stats["tokens_saved_total"] == 0
+    assert stats["render_bytes_avoided_total"] == cache.prefix_bytes
+
+
+def test_chat_sends_exactly_the_turn_prompt(app_client):
+    import main
+
+    models = []
+
+    def factory(prompt_cache):
+        models.append(RecordingModel(prompt_cache.system_instruction))
+        return models[-1]
+
+    client = app_client(None)
+    main.install_dependencies(model_factory=factory)
+    response = client.post("/api/chat", json={"message": "tell me about your sauces"})
+    assert response.status_code == 200
+    assert response.json()["context"]["items"]["big mac"]["quantity"] == 2
+    (model,) = models
+    assert model.system_instruction == main.prompt_cache.system_instruction
+    assert model.prompts == [TURN_PROMPT_TEMPLATE.format(
+        context_string="The user's order is currently empty.",
+        user_message="tell me about your sauces",
+    )]
+
+
+def test_set_model_factory_drops_the_current_model():
+    cache = recording_cache()
+    first = asyncio.run(cache.get_model())
+    cache._model_expires_at, cache.cached_content_name = 0.0, "cachedContents/old"
+    cache.set_model_factory(lambda prompt_cache: RecordingModel("swapped"))
+    assert cache.cached_content_name is None
+    second = asyncio.run(cache.get_model())
+    assert second is not first and second.system_instruction == "swapped"
+    assert asyncio.run(cache.get_model()) is second
@@ -0,0 +1,89 @@
+import time
+
+from menu_store import load_menu_file, parse_menu
+from models import OrderContext, OrderItemDetail
+from response_cache import ResponseCache
+
+
+def big_macs(quantity):
+    return OrderContext(items={"big mac": OrderItemDetail(quantity=quantity, base_price=5.99, total_price=5.99 * quantity)})
+
+
+def test_hit_after_put_and_latency_saved():
+    cache = ResponseCache()
+    key = cache.key("What's in a Big Mac?", OrderContext())
+    assert cache.get(key) is None
+    cache.put(key, "Two all-beef patties...", latency_seconds=0.8)
+    assert cache.get(key) == "Two all-beef patties..."
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+    assert stats["latency_saved_seconds"] == 0.8
+
+
+def test_key_normalizes_the_message():
+    cache = ResponseCache()
+    assert cache.key("What's in a Big Mac?", OrderContext()) == cache.key("whats in a big mac", OrderContext())
+
+
+def test_key_changes_with_order_state_but_not_finalized_flag():
+    cache = ResponseCache()
+    message = "anything else good"
+    assert cache.key(message, big_macs(1)) != cache.key(message, big_macs(2))
+    assert cache.key(message, big_macs(1)) != cache.key(message, OrderContext())
+    finalized = big_macs(1)
+    finalized.is_finalized = True
+    assert cache.key(message, finalized) == cache.key(message, big_macs(1))
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put("a", "A", 0.1)
+    cache.put("b", "B", 0.1)
+    assert cache.get("a") == "A"
+    cache.put("c", "C", 0.1)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == ("A", "C")
+    assert cache.evicted_lru == 1
+
+
+def test_byte_limit_evicts_and_oversized_replies_are_skipped():
+    cache = ResponseCache(max_bytes=20)
+    cache.put("a", "x" * 9, 0.1)
+    cache.put("b", "y" * 10, 0.1)
+    assert cache.get("a") is None
+    assert cache.get("b") == "y" * 10
+    assert cache.stats()["bytes"] == 11
+    cache.put("c", "z" * 50, 0.1)
+    assert cache.get("c") is None
+    assert cache.get("b") == "y" * 10
+
+
+def test_expired_entries_are_dropped():
+    cache = ResponseCache(ttl_seconds=0.01)
+    cache.put("a", "A", 0.1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert cache.evicted_ttl == 1
+    assert cache.stats()["bytes"] == 0
+
+
+def test_disabled_cache_stores_nothing():
+    cache = ResponseCache(max_entries=0)
+    cache.put("a", "A", 0.1)
+    assert cache.get("a") is None
+
+
+def test_menu_change_invalidates_cached_replies():
+    import main
+
+    original = load_menu_file()
+    key = main.response_cache.key("tell me about your sauces", OrderContext())
+    main.response_cache.put(key, "We have ranch and barbeque.", 0.5)
+    items = {name: dict(details) for name, details in original.items.items()}
+    items["big mac"]["price"] = 6.49
+    try:
+        main.load_menu(parse_menu({"version": "changed", "items": items}))
+        assert main.response_cache.get(key) is None
+        assert main.response_cache.key("tell me about your sauces", OrderContext()) != key
+    finally:
+        main.load_menu(original)
@@ -0,0 +1,257 @@
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from models import OrderContext, OrderItemDetail
+from sessions import InMemorySessionStore, RedisSessionStore, SessionStore, VersionConflict
+
+# RedisSessionStore runs against fakeredis (with lupa for the Lua CAS
+# script), and also against a real server when TEST_REDIS_URL is set.
+STORES = ["memory", "fakeredis", "redis"]
+
+
+def make_store(kind: str) -> SessionStore:
+    if kind == "memory":
+        return InMemorySessionStore(ttl_seconds=60)
+    if kind == "fakeredis":
+        fakeredis = pytest.importorskip("fakeredis")
+        pytest.importorskip("lupa")
+        return RedisSessionStore(client=fakeredis.FakeAsyncRedis(), ttl_seconds=60)
+    url = os.getenv("TEST_REDIS_URL")
+    if not url:
+        pytest.skip("TEST_REDIS_URL not set")
+    return RedisSessionStore(url, ttl_seconds=60, key_prefix=f"mcbot-test-{os.getpid()}:")
+
+
+@pytest.fixture(params=STORES)
+def store(request):
+    return make_store(request.param)
+
+
+class UnreachableStore(SessionStore):
+    """Fails every call the way redis-py does when the server is down."""
+
+    async def get(self, session_id):
+        raise ConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+    async def put(self, session_id, context, expected_version):
+        raise ConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+    async def delete(self, session_id):
+        raise ConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+
+    async def stats(self):
+        return {"backend": "unreachable"}
+
+
+class ReadBarrier(SessionStore):
+    """Holds every get() until `readers` of them have read, so that many
+    turns on one session all start from the same version."""
+
+    def __init__(self, inner: SessionStore, readers: int = 2):
+        self.inner = inner
+        self.readers = readers
+        self.arrived = 0
+        self.all_read = asyncio.Event()
+
+    async def get(self, session_id):
+        result = await self.inner.get(session_id)
+        self.arrived += 1
+        if self.arrived >= self.readers:
+            self.all_read.set()
+        await asyncio.wait_for(self.all_read.wait(), 5)
+        return result
+
+    async def put(self, session_id, context, expected_version):
+        return await self.inner.put(session_id, context, expected_version)
+
+    async def delete(self, session_id):
+        await self.inner.delete(session_id)
+
+    async def stats(self):
+        return await self.inner.stats()
+
+
+def test_session_store_is_abstract():
+    with pytest.raises(TypeError):
+        SessionStore()
+
+
+def test_compare_and_set(store):
+    order = OrderContext(items={"big mac": OrderItemDetail(quantity=2, base_price=5.99, total_price=11.98)})
+
+    async def run():
+        context, version = await store.get("s1")
+        assert (context, version) == (OrderContext(), 0)
+        assert await store.put("s1", order, 0) == 1
+        assert await store.get("s1") == (order, 1)
+        with pytest.raises(VersionConflict) as conflict:
+            await store.put("s1", OrderContext(), 0)
+        assert (conflict.value.expected, conflict.value.actual) == (0, 1)
+        assert await store.put("s1", OrderContext(), 1) == 2
+        assert (await store.stats())["conflicts"] == 1
+        await store.delete("s1")
+        assert await store.get("s1") == (OrderContext(), 0)
+        await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_sessions_expire():
+    store = make_store("fakeredis")
+
+    async def run():
+        await store.put("s1", OrderContext(), 0)
+        ttl = await store.client.ttl(store._key("s1"))
+        assert 0 < ttl <= 60
+        await store.close()
+
+    asyncio.run(run())
+
+
+class StatsClient:
+    """Just the commands RedisSessionStore._server_stats sends; fakeredis
+    has no MEMORY or INFO."""
+
+    def __init__(self, keys, sizes):
+        self.keys = keys
+        self.sizes = sizes
+        self.scans = 0
+
+    async def scan(self, cursor=0, match=None, count=None):
+        self.scans += 1
+        page = self.keys[cursor:cursor + 2]
+        next_cursor = cursor + 2 if cursor + 2 < len(self.keys) else 0
+        return next_cursor, page
+
+    def pipeline(self, transaction=True):
+        client = self
+
+        class Pipeline:
+            def __init__(self):
+                self.queued = []
+
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):
+                return False
+
+            def memory_usage(self, key):
+                self.queued.append(client.sizes.get(key))
+
+            async def execute(self):
+                return self.queued
+
+        return Pipeline()
+
+    async def info(self, section):
+        if section == "stats":
+            return {"evicted_keys": 3, "expired_keys": 40, "keyspace_hits": 7}
+        return {"used_memory": 1_000_000, "maxmemory": 64 * 1024 * 1024}
+
+    def register_script(self, script):
+        return None
+
+
+def test_redis_stats_sample_memory_and_evictions():
+    keys = [f"mcbot:session:{i}" for i in range(5)]
+    client = StatsClient(keys, {keys[0]: 200, keys[1]: 300, keys[2]: None, keys[3]: 400, keys[4]: 500})
+    store = RedisSessionStore(client=client)
+    store.STATS_SAMPLE = 4
+    stats = asyncio.run(store.stats())
+    # Two SCAN pages give 4 keys; one of them expired before MEMORY USAGE.
+    assert client.scans == 2
+    assert stats["sampled_sessions"] == 3
+    assert stats["avg_bytes_per_session"] == 300
+    assert (stats["evicted_keys"], stats["expired_keys"]) == (3, 40)
+    assert stats["maxmemory_bytes"] == 64 * 1024 * 1024
+    assert "error" not in stats
+
+
+def test_redis_stats_report_errors_instead_of_raising():
+    stats = asyncio.run(make_store("fakeredis").stats())
+    assert stats["backend"] == "redis"
+    assert "error" in stats
+
+
+def test_redis_stats_against_a_server():
+    store = make_store("redis")
+
+    async def run():
+        await store.put("s1", OrderContext(), 0)
+        stats = await store.stats()
+        await store.delete("s1")
+        await store.close()
+        return stats
+
+    stats = asyncio.run(run())
+    assert "error" not in stats
+    assert stats["sampled_sessions"] >= 1
+    assert "evicted_keys" in stats and "expired_keys" in stats
+
+
+@pytest.fixture
+def session_client(app_client, monkeypatch, store):
+    import main
+
+    client = app_client(None)
+    monkeypatch.setattr(main, "session_store", store)
+    return client
+
+
+def chat(client, message, **session):
+    return client.post("/api/chat", json={"message": message, **session})
+
+
+def test_session_turns_bump_the_version(session_client):
+    first = chat(session_client, "2 big macs", use_session=True).json()
+    assert first["session_version"] == 1
+    session_id = first["session_id"]
+    # The server holds the order: no context is sent back.
+    second = chat(session_client, "a mcchicken", session_id=session_id, session_version=1).json()
+    assert (second["session_id"], second["session_version"]) == (session_id, 2)
+    assert set(second["context"]["items"]) == {"big mac", "mcchicken"}
+
+
+def test_stale_session_version_is_a_409(session_client):
+    first = chat(session_client, "2 big macs", use_session=True).json()
+    session = {"session_id": first["session_id"], "session_version": 1}
+    assert chat(session_client, "a mcchicken", **session).status_code == 200
+    response = chat(session_client, "a hamburger", **session)
+    assert response.status_code == 409
+
+
+def test_duplicate_finalize_saves_the_order_once(session_client, monkeypatch, store):
+    import main
+
+    first = chat(session_client, "2 big macs", use_session=True).json()
+    session = {"session_id": first["session_id"], "session_version": 1}
+    monkeypatch.setattr(main, "session_store", ReadBarrier(store))
+    submitted = main.order_writer.submitted
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        responses = list(pool.map(lambda _: chat(session_client, "that's all", **session), range(2)))
+    assert sorted(response.status_code for response in responses) == [200, 409]
+    assert main.order_writer.submitted == submitted + 1
+
+
+def error_count(client, route, status):
+    pattern = rf'mcbot_requests_total\{{route="{route}",source="error",status="{status}"\}} (\S+)'
+    match = re.search(pattern, client.get("/metrics").text)
+    return float(match.group(1)) if match else 0.0
+
+
+@pytest.mark.parametrize("path, route", [("/api/chat", "chat"), ("/api/chat/stream", "chat_stream")])
+def test_unreachable_session_store_is_a_503(app_client, monkeypatch, path, route):
+    import main
+
+    client = app_client(None)
+    monkeypatch.setattr(main, "session_store", UnreachableStore())
+    before = error_count(client, route, 503)
+    response = client.post(path, json={"message": "2 big macs", "use_session": True})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert error_count(client, route, 503) == before + 1
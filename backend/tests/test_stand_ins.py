@@ -0,0 +1,34 @@
+import pytest
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from stand_ins import InMemoryCollection
+
+
+def test_insert_many_reports_duplicate_keys():
+    collection = InMemoryCollection()
+    first, second = ObjectId(), ObjectId()
+    collection.insert_one({"_id": first})
+    with pytest.raises(BulkWriteError) as error:
+        collection.insert_many([{"_id": first}, {"_id": second}], ordered=False)
+    assert [e["index"] for e in error.value.details["writeErrors"]] == [0]
+    assert collection.count_documents({}) == 2
+
+
+def test_count_documents_with_equality_filters():
+    collection = InMemoryCollection()
+    collection.insert_many([
+        {"_id": 1, "is_finalized": True, "subtotal": 5.99},
+        {"_id": 2, "is_finalized": True, "subtotal": 11.98},
+        {"_id": 3, "is_finalized": False},
+    ])
+    assert collection.count_documents({"is_finalized": True}) == 2
+    assert collection.count_documents({"is_finalized": True, "subtotal": 5.99}) == 1
+    assert collection.count_documents({"_id": 3}) == 1
+    assert collection.count_documents({"subtotal": None}) == 1
+
+
+@pytest.mark.parametrize("query", [{"$or": []}, {"subtotal": {"$gt": 5}}])
+def test_count_documents_rejects_operators(query):
+    with pytest.raises(NotImplementedError):
+        InMemoryCollection().count_documents(query)
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+
+from benchmarks.startup_bench import BACKEND_DIR, STAND_IN_ENV, time_to_first_200
+
+# Startup must not wait on Mongo (STAND_IN_ENV points at an address that never
+# answers, with a 5 s server selection timeout) or load the heavy SDKs.
+STARTUP_BUDGET_SECONDS = 3.0
+DEFERRED_MODULES = ("pymongo", "bson", "google.generativeai")
+
+
+def test_importing_main_defers_heavy_sdks():
+    code = f"import sys, main; print(' '.join(m for m in {DEFERRED_MODULES!r} if m in sys.modules))"
+    env = dict(os.environ, **STAND_IN_ENV, LOG_LEVEL="error")
+    result = subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, timeout=60, check=True)
+    assert result.stdout.strip() == ""
+
+
+def test_first_200_with_mongo_unreachable():
+    assert time_to_first_200() < STARTUP_BUDGET_SECONDS
@@ -0,0 +1,51 @@
+import json
+
+from llm_client import LLMScheduler
+from stand_ins import FakeGenerativeModel
+
+MESSAGE = "what goes well with a big mac"
+FENCED = 'A Quarter Pounder with Cheese? Adding one.\n```json\n{"items":[[1,1],[2,1]],"is_finalized":false}\n```'
+BARE = 'Adding a Quarter Pounder with Cheese. {"items":[[1,1],[2,1]],"is_finalized":false}'
+
+
+def stream_events(client):
+    with client.stream("POST", "/api/chat/stream", json={"message": MESSAGE}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        return [json.loads(line) for line in response.iter_lines() if line]
+
+
+def streaming_model(output):
+    return FakeGenerativeModel(latency=0, jitter=0, outputs=[output])
+
+
+def test_deltas_then_done(app_client):
+    events = stream_events(app_client(streaming_model(FENCED)))
+    types = [event["type"] for event in events]
+    assert types[-1] == "done"
+    assert set(types[:-1]) == {"delta"}
+    assert len(types) > 2
+    done = events[-1]
+    assert set(done["context"]["items"]) == {"big mac", "quarter pounder with cheese"}
+    assert "".join(event["text"] for event in events[:-1]).strip() == done["reply"]
+
+
+def test_order_json_never_streams(app_client):
+    for output in (FENCED, BARE):
+        events = stream_events(app_client(streaming_model(output)))
+        streamed = "".join(event["text"] for event in events if event["type"] == "delta")
+        assert "```" not in streamed
+        assert '"items"' not in streamed
+        assert "{" not in streamed
+        assert events[-1]["type"] == "done"
+
+
+def test_scheduler_rejection_is_an_error_event(app_client, monkeypatch):
+    import main
+
+    client = app_client(streaming_model(FENCED))
+    monkeypatch.setattr(main, "llm_scheduler", LLMScheduler(max_in_flight=0, max_queue=0))
+    events = stream_events(client)
+    assert [event["type"] for event in events] == ["error"]
+    assert events[0]["status"] == 503
+    assert float(events[0]["retry_after"]) > 0
@@ -0,0 +1,115 @@
+import argparse
+import json
+import os
+import shutil
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.scaling_bench import free_port, start_server, wait_ready
+from menu_store import DEFAULT_MENU_PATH
+import order_store
+from order_store import OrderWriter, _decode
+
+WORKERS = 2
+
+
+def post(url, body):
+    request = urllib.request.Request(url, data=json.dumps(body).encode(), headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.status, json.load(response)
+
+
+def get(url):
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return json.load(response)
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    tmp = tmp_path_factory.mktemp("workers")
+    menu_path = tmp / "menu.json"
+    shutil.copy(DEFAULT_MENU_PATH, menu_path)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    os.environ.update(MENU_PATH=str(menu_path), MENU_RELOAD_INTERVAL_SECONDS="0.2")
+    try:
+        proc = start_server(WORKERS, port, argparse.Namespace(llm_latency_ms=0.0), str(tmp))
+    finally:
+        del os.environ["MENU_PATH"]
+        del os.environ["MENU_RELOAD_INTERVAL_SECONDS"]
+    try:
+        wait_ready(url, proc)
+        yield url, menu_path
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+
+
+def test_concurrent_turns_across_workers(server):
+    url, _ = server
+    messages = ["2 big macs", "a mcchicken and a hamburger", "tell me about your sauces"] * 20
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(lambda message: post(url + "/api/chat", {"message": message}), messages))
+    assert all(status == 200 for status, _ in results)
+    assert results[0][1]["context"]["items"]["big mac"]["quantity"] == 2
+
+
+def test_every_worker_picks_up_a_menu_change(server):
+    url, menu_path = server
+    document = json.loads(menu_path.read_text())
+    document["version"] = "test-reload"
+    document["items"]["big mac"]["price"] = 7.49
+    staged = menu_path.with_suffix(".tmp")
+    staged.write_text(json.dumps(document))
+    os.replace(staged, menu_path)
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        # Each request lands on whichever worker accepts it; enough of them
+        # in a row all seeing the new version means every worker reloaded.
+        versions = {get(url + "/api/stats")["menu"]["version"] for _ in range(20 * WORKERS)}
+        if versions == {"test-reload"}:
+            break
+        time.sleep(0.2)
+    assert versions == {"test-reload"}
+    _, body = post(url + "/api/chat", {"message": "2 big macs"})
+    assert body["context"]["items"]["big mac"]["total_price"] == 14.98
+
+
+def test_spill_claim_waits_for_an_append_in_progress(tmp_path, monkeypatch):
+    # One worker is halfway through appending when another claims the spill
+    # file for replay. The claim must wait, or the order is written into a
+    # file that was already read and is about to be deleted.
+    spill_path = str(tmp_path / "unsaved_orders.jsonl")
+    appending, resume = threading.Event(), threading.Event()
+    encode = order_store._encode
+
+    def slow_encode(order):
+        appending.set()
+        resume.wait(5)
+        return encode(order)
+
+    monkeypatch.setattr(order_store, "_encode", slow_encode)
+    spiller = OrderWriter(lambda: None, spill_path=spill_path)
+    replayer = OrderWriter(lambda: None, spill_path=spill_path)
+    order_id = "%024x" % 1
+    append = threading.Thread(target=spiller._append_spill, args=([{"_id": order_id, "items": {}}],))
+    append.start()
+    assert appending.wait(5)
+
+    claimed = []
+    claim = threading.Thread(target=lambda: claimed.extend(replayer._claim_spill_files()))
+    claim.start()
+    claim.join(0.2)
+    assert claim.is_alive()
+    resume.set()
+    append.join()
+    claim.join()
+
+    assert len(claimed) == 1
+    with open(claimed[0]) as f:
+        assert [str(_decode(line)["_id"]) for line in f] == [order_id]
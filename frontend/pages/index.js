@@ -12,7 +12,10 @@ export default function Chatbot() {
   const [isLarge, setIsLarge] = useState(false);
   const [messages, setMessages] = useState([]);
   const [input, setInput] = useState("");
-  const [conversationContext, setConversationContext] = useState({});
+  // The server keeps the order; we only track which session it is in and the
+  // last version we saw (so a double-send is rejected instead of applied twice).
+  const [sessionId, setSessionId] = useState(null);
+  const [sessionVersion, setSessionVersion] = useState(null);
 
   const chatBoxRef = useRef(null);
 
@@ -29,39 +32,94 @@ export default function Chatbot() {
   const API_BASE =
     (process.env.NEXT_PUBLIC_API_URL || "http://localhost:10000").replace(/\/$/, "");
 
+  // Replace the text of the bot message with the given id (used while streaming).
+  const setBotText = (id, text) => {
+    setMessages((prev) => prev.map((msg) => (msg.id === id ? { ...msg, text } : msg)));
+  };
+
   const sendMessage = async () => {
     const trimmed = input.trim();
     if (!trimmed) return;
 
-    // Show user message immediately
-    setMessages((prev) => [...prev, { text: trimmed, sender: "customer" }]);
+    // Show user message immediately, plus an empty bot bubble to stream into
+    const botId = `${Date.now()}-${Math.random()}`;
+    setMessages((prev) => [
+      ...prev,
+      { text: trimmed, sender: "customer" },
+      { id: botId, text: "…", sender: "bot" },
+    ]);
     setInput("");
 
     try {
-      const resp = await fetch(`${API_BASE}/api/chat`, {
+      const resp = await fetch(`${API_BASE}/api/chat/stream`, {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify({
           message: trimmed,
-          context: conversationContext,
+          use_session: true,
+          session_id: sessionId,
+          session_version: sessionVersion,
         }),
       });
 
-      if (!resp.ok) {
+      if (resp.status === 409) {
+        // Someone else (another tab, a retried send) moved the order on;
+        // drop our version so the next message continues from the latest.
+        setSessionVersion(null);
+        const { detail } = await resp.json();
+        setBotText(botId, detail);
+        return;
+      }
+
+      if (!resp.ok || !resp.body) {
         const errText = await resp.text();
         console.error("Error response body:", errText);
         throw new Error(`HTTP ${resp.status}`);
       }
 
-      const data = await resp.json();
-      setMessages((prev) => [...prev, { text: data.reply, sender: "bot" }]);
-      if (data.context) setConversationContext(data.context);
+      // The server sends newline-delimited JSON events:
+      //   {type: "delta", text}            reply text as it is generated
+      //   {type: "done", reply, context,   final validated reply + order,
+      //    session_id, session_version}   and where the session now stands
+      //   {type: "error", detail}          request could not be served
+      const reader = resp.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      let streamed = "";
+      let finished = false;
+
+      while (!finished) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffered += decoder.decode(value, { stream: true });
+
+        let newline;
+        while ((newline = buffered.indexOf("\n")) !== -1) {
+          const line = buffered.slice(0, newline).trim();
+          buffered = buffered.slice(newline + 1);
+          if (!line) continue;
+
+          const event = JSON.parse(line);
+          if (event.type === "delta") {
+            streamed += event.text;
+            setBotText(botId, streamed);
+          } else if (event.type === "done") {
+            setBotText(botId, event.reply);
+            if (event.session_id) setSessionId(event.session_id);
+            if (event.session_version != null) setSessionVersion(event.session_version);
+            finished = true;
+          } else if (event.type === "error") {
+            if (event.status === 409) setSessionVersion(null);
+            setBotText(botId, event.detail || "Sorry, something went wrong. Please try again.");
+            finished = true;
+          }
+        }
+      }
+
+      if (!finished) throw new Error("Stream ended before the final event");
     } catch (err) {
       console.error("Failed to send message:", err);
-      setMessages((prev) => [
-        ...prev,
-        { text: "Sorry, something went wrong. Please try again.", sender: "bot" },
-      ]);
+      setBotText(botId, "Sorry, something went wrong. Please try again.");
     }
   };
 